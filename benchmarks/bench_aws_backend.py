@@ -0,0 +1,188 @@
+"""
+Benchmark of the AWS backend using the local stand-in of EC2 and ssh.
+
+The benchmark reports:
+
+* the latency of the calls of :mod:`ramp_engine.aws.api`, i.e. the overhead
+  of the backend when the network is instantaneous;
+* the time spent by the scheduling loop (the calls made by the dispatcher to
+  the workers) and the throughput when training submissions on tens of
+  concurrent instances with an emulated network latency.
+
+Usage::
+
+    python benchmarks/bench_aws_backend.py --n-instances 1 10 50
+    python benchmarks/bench_aws_backend.py --n-instances 10 \
+        --submissions-per-instance 4
+"""
+import argparse
+import os
+import tempfile
+import time
+from statistics import median
+
+from ramp_engine.aws import api as aws
+from ramp_engine.aws import AWSWorker
+from ramp_engine.aws.testing import FakeEC2Transport
+
+REMOTE_KIT_FOLDER = '/home/ubuntu/ramp-kits/iris'
+
+
+def make_config(root_dir, n_submissions, max_concurrent_transfers,
+                **transport_params):
+    image_dir = os.path.join(root_dir, 'image')
+    os.makedirs(os.path.join(image_dir, REMOTE_KIT_FOLDER.lstrip('/'),
+                             'submissions'))
+    submissions_dir = os.path.join(root_dir, 'submissions')
+    for idx in range(n_submissions):
+        submission_dir = os.path.join(submissions_dir,
+                                      'submission_{:09d}'.format(idx))
+        os.makedirs(submission_dir)
+        for name in ('classifier.py', 'feature_extractor.py'):
+            with open(os.path.join(submission_dir, name), 'w') as f:
+                f.write('# {}\n'.format(name) * 100)
+    instances_dir = os.path.join(root_dir, 'instances')
+    os.makedirs(instances_dir)
+    transport = FakeEC2Transport(instances_dir, image_dir=image_dir,
+                                 **transport_params)
+    config = {
+        'instance_type': 't2.micro', 'access_key_id': 'xxx',
+        'secret_access_key': 'xxx', 'region_name': 'us-west-2',
+        'ami_image_name': 'iris', 'ami_user_name': 'ubuntu',
+        'key_name': 'iris', 'key_path': 'iris.pem',
+        'security_group': 'launch-wizard',
+        'remote_ramp_kit_folder': REMOTE_KIT_FOLDER,
+        'memory_profiling': False,
+        'check_finished_training_interval_secs': 0.01,
+        'max_concurrent_transfers': max_concurrent_transfers,
+        'submissions_dir': submissions_dir,
+        'predictions_dir': os.path.join(root_dir, 'predictions'),
+        'logs_dir': os.path.join(root_dir, 'logs'),
+        'transport': transport,
+    }
+    return config, transport
+
+
+def bench_call_latency(n_repeats):
+    """Measure the latency of the API calls with an instantaneous network."""
+    with tempfile.TemporaryDirectory() as root_dir:
+        config, _ = make_config(root_dir, 1, 1)
+        submission = 'submission_{:09d}'.format(0)
+        instance, = aws.launch_ec2_instances(config)
+        aws.upload_submission(config, instance.id, submission,
+                              config['submissions_dir'])
+        aws.launch_train(config, instance.id, submission)
+        aws._wait_until_train_finished(config, instance.id, submission)
+
+        calls = {
+            'upload_submission': lambda: aws.upload_submission(
+                config, instance.id, submission, config['submissions_dir']),
+            '_training_finished': lambda: aws._training_finished(
+                config, instance.id, submission),
+            '_training_successful': lambda: aws._training_successful(
+                config, instance.id, submission),
+            'download_log': lambda: aws.download_log(
+                config, instance.id, submission),
+            'download_predictions': lambda: aws.download_predictions(
+                config, instance.id, submission),
+            'status_of_ec2_instance': lambda: aws.status_of_ec2_instance(
+                config, instance.id),
+        }
+        print('{:<25}{:>15}'.format('call', 'median [ms]'))
+        for name, call in calls.items():
+            timings = []
+            for _ in range(n_repeats):
+                tic = time.perf_counter()
+                call()
+                timings.append(time.perf_counter() - tic)
+            print('{:<25}{:>15.2f}'.format(name, 1000 * median(timings)))
+        aws.terminate_ec2_instance(config, instance.id)
+
+
+def bench_throughput(n_instances, latency, train_duration,
+                     submissions_per_instance=1):
+    """Train submissions on the instances and measure the scheduling cost."""
+    n_submissions = n_instances * submissions_per_instance
+    with tempfile.TemporaryDirectory() as root_dir:
+        config, transport = make_config(
+            root_dir, n_submissions, n_submissions, latency=latency,
+            train_duration=train_duration
+        )
+        if submissions_per_instance > 1:
+            config['instance_vcpus'] = submissions_per_instance
+            config['submission_vcpus'] = 1
+        workers = [AWSWorker(config, 'submission_{:09d}'.format(idx))
+                   for idx in range(n_submissions)]
+        tic = time.perf_counter()
+        # emulate the calls made by the dispatcher loop
+        scheduling_time = 0
+        n_sweeps = 0
+        sweep_tic = time.perf_counter()
+        for worker in workers:
+            worker.setup()
+            worker.launch_submission()
+        scheduling_time += time.perf_counter() - sweep_tic
+        running = list(workers)
+        while running:
+            sweep_tic = time.perf_counter()
+            still_running = []
+            for worker in running:
+                if worker.status == 'running':
+                    still_running.append(worker)
+                else:
+                    worker.collect_results()
+                    worker.teardown()
+            running = still_running
+            scheduling_time += time.perf_counter() - sweep_tic
+            n_sweeps += 1
+            time.sleep(0.001)
+        wall_time = time.perf_counter() - tic
+        n_calls = sum(transport.calls.values())
+    return {
+        'n_instances': n_instances,
+        'n_submissions': n_submissions,
+        'n_launches': transport.calls['launch_instances'],
+        'wall_time': wall_time,
+        'throughput': n_submissions / wall_time,
+        'scheduling_time': scheduling_time,
+        'sweep_time': 1000 * scheduling_time / max(n_sweeps, 1),
+        'n_calls': n_calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--n-instances', type=int, nargs='+',
+                        default=[1, 10, 30])
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Emulated latency of each call in seconds.')
+    parser.add_argument('--train-duration', type=float, default=1.,
+                        help='Emulated training time in seconds.')
+    parser.add_argument('--submissions-per-instance', type=int, default=1,
+                        help='Number of submissions trained concurrently on '
+                             'each instance.')
+    parser.add_argument('--n-repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    print('Latency of the API calls (no emulated network latency)')
+    bench_call_latency(args.n_repeats)
+    print()
+    print('Throughput with a latency of {}s and a training of {}s'
+          .format(args.latency, args.train_duration))
+    header = ('{:>12}{:>13}{:>10}{:>14}{:>20}{:>18}{:>16}{:>10}'
+              .format('instances', 'submissions', 'launches', 'wall [s]',
+                      'submissions / s', 'scheduling [s]', 'sweep [ms]',
+                      'calls'))
+    print(header)
+    for n_instances in args.n_instances:
+        result = bench_throughput(n_instances, args.latency,
+                                  args.train_duration,
+                                  args.submissions_per_instance)
+        print('{n_instances:>12}{n_submissions:>13}{n_launches:>10}'
+              '{wall_time:>14.2f}{throughput:>20.2f}'
+              '{scheduling_time:>18.3f}{sweep_time:>16.3f}{n_calls:>10}'
+              .format(**result))
+
+
+if __name__ == '__main__':
+    main()
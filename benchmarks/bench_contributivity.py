@@ -0,0 +1,113 @@
+"""
+Benchmark of the ensembling of the submissions on a fold.
+
+Synthetic multiclass predictions are stacked in a memory-mapped array and the
+ensemble is built by greedy forward selection with
+:func:`ramp_database.tools.contributivity._greedy_forward_selection`, which
+combines and scores the candidate ensembles by batches with NumPy. The
+benchmark reports its time and compares it, for the smaller numbers of
+submissions, with :func:`rampwf.utils.combine.blend_on_fold` which combines
+and scores each candidate ensemble separately. Both must select the same
+ensemble.
+
+Usage::
+
+    python benchmarks/bench_contributivity.py --n-submissions 100 1000 5000
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+from rampwf.prediction_types import make_multiclass
+from rampwf.score_types import Accuracy
+from rampwf.score_types import NegativeLogLikelihood
+from rampwf.utils.combine import blend_on_fold
+
+from ramp_database.tools.contributivity import _greedy_forward_selection
+from ramp_database.tools.contributivity import _make_batch_scorer
+from ramp_database.tools.contributivity import _to_combinable
+
+SCORE_TYPES = {'acc': Accuracy(), 'nll': NegativeLogLikelihood()}
+
+
+def make_predictions(n_submissions, n_samples, n_classes, random_state=0):
+    """Make noisy predictions of the ground truth."""
+    rng = np.random.RandomState(random_state)
+    y_true = rng.randint(n_classes, size=n_samples)
+    for _ in range(n_submissions):
+        logits = rng.randn(n_samples, n_classes)
+        logits[np.arange(n_samples), y_true] += rng.uniform(0, 2)
+        y_pred = np.exp(logits)
+        yield y_true, y_pred / y_pred.sum(axis=1, keepdims=True)
+
+
+def bench(n_submissions, n_samples, n_classes, score_type, max_n_ensemble,
+          with_reference):
+    Predictions = make_multiclass(label_names=list(range(n_classes)))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        stack = np.lib.format.open_memmap(
+            os.path.join(tmp_dir, 'fold.npy'), mode='w+', dtype=np.float64,
+            shape=(n_submissions, n_samples, n_classes)
+        )
+        for idx, (y_true, y_pred) in enumerate(
+                make_predictions(n_submissions, n_samples, n_classes)):
+            stack[idx] = _to_combinable(Predictions, y_pred)
+        ground_truths = Predictions(y_true=y_true)
+        score_batch = _make_batch_scorer(score_type, ground_truths,
+                                         Predictions)
+        tic = time.perf_counter()
+        selection, _ = _greedy_forward_selection(
+            stack, score_batch, score_type.is_lower_the_better,
+            max_n_ensemble
+        )
+        vectorized_time = time.perf_counter() - tic
+        reference_time = None
+        if with_reference:
+            predictions_list = [Predictions(y_pred=y_pred)
+                                for y_pred in stack]
+            tic = time.perf_counter()
+            # blend_on_fold prints each step of the selection
+            with contextlib.redirect_stdout(io.StringIO()):
+                expected = blend_on_fold(predictions_list, ground_truths,
+                                         score_type, max_n_ensemble)
+            reference_time = time.perf_counter() - tic
+            assert selection == list(expected)
+        del stack
+    return len(selection), vectorized_time, reference_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--n-submissions', type=int, nargs='+',
+                        default=[100, 1000])
+    parser.add_argument('--n-samples', type=int, default=2000)
+    parser.add_argument('--n-classes', type=int, default=5)
+    parser.add_argument('--score', choices=sorted(SCORE_TYPES),
+                        default='nll')
+    parser.add_argument('--max-n-ensemble', type=int, default=80)
+    parser.add_argument('--max-reference', type=int, default=200,
+                        help='The largest number of submissions for which '
+                             'rampwf is timed.')
+    args = parser.parse_args()
+
+    header = '{:>14}{:>12}{:>16}{:>16}'
+    print(header.format('submissions', 'ensemble', 'vectorized [s]',
+                        'rampwf [s]'))
+    for n_submissions in args.n_submissions:
+        n_ensemble, vectorized_time, reference_time = bench(
+            n_submissions, args.n_samples, args.n_classes,
+            SCORE_TYPES[args.score], args.max_n_ensemble,
+            n_submissions <= args.max_reference
+        )
+        print('{:>14}{:>12}{:>16.3f}{:>16}'.format(
+            n_submissions, n_ensemble, vectorized_time,
+            '-' if reference_time is None
+            else '{:.3f}'.format(reference_time)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Benchmark of the indexes of the hot query paths.
+
+The toy database used by the tests is filled with synthetic submissions,
+user interactions and submission similarities. The query plan and the time
+of the queries filtering the submissions of a team by state, the
+interactions of a user and the similarities of a submission are reported
+without the indexes covering them, as in a database created before they were
+declared, and after adding them with :func:`ramp_database.utils.upgrade_db`,
+i.e. the ``ramp-database upgrade-db`` command.
+
+The folds of a submission, the scores of a fold and the event teams are
+queried through the unique constraints of their tables, which are indexes as
+well, and are therefore not benchmarked.
+
+WARNING: the database given in the configuration is erased. By default, the
+database of the tests is used: it should be created beforehand, as done by the
+``database_connection`` fixture of the tests.
+
+Usage::
+
+    python benchmarks/bench_indexes.py --n-submissions 100000
+"""
+import argparse
+import datetime
+import shutil
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from ramp_database.model import Model
+from ramp_database.model import Submission
+from ramp_database.model import SubmissionSimilarity
+from ramp_database.model import UserInteraction
+from ramp_database.testing import create_toy_db
+from ramp_database.utils import setup_db
+from ramp_database.utils import upgrade_db
+from ramp_utils import read_config
+from ramp_utils.testing import database_config_template
+from ramp_utils.testing import ramp_config_template
+
+# the indexes of the hot query paths which are not unique constraints
+INDEXES = [
+    'ix_submissions_event_team_state',
+    'ix_user_interactions_user_interaction',
+    'ix_user_interactions_user_timestamp',
+    'ix_submission_similaritys_source_submission_id',
+    'ix_submission_similaritys_target_submission_id',
+]
+
+QUERIES = [
+    ('submissions of a team in a state',
+     "SELECT id FROM submissions "
+     "WHERE event_team_id = :event_team_id AND state = 'new'"),
+    ('submissions looked at by a user',
+     "SELECT DISTINCT submission_id FROM user_interactions "
+     "WHERE user_id = :user_id AND interaction = 'looking at submission' "
+     "AND event_team_id = :event_team_id"),
+    ('last interactions of a user',
+     "SELECT id, timestamp FROM user_interactions "
+     "WHERE user_id = :user_id AND interaction = 'landing' "
+     "ORDER BY timestamp DESC LIMIT 20"),
+    ('credits received by a submission',
+     "SELECT source_submission_id, similarity FROM submission_similaritys "
+     "WHERE target_submission_id = :submission_id"),
+    ('credits given by a submission',
+     "SELECT target_submission_id, similarity FROM submission_similaritys "
+     "WHERE source_submission_id = :submission_id"),
+]
+
+CHUNK_SIZE = 5000
+
+
+def insert_rows(conn, table, rows):
+    """Insert rows by chunks of multi-row INSERT statements."""
+    for start in range(0, len(rows), CHUNK_SIZE):
+        conn.execute(table.insert().values(rows[start:start + CHUNK_SIZE]))
+
+
+def add_synthetic_rows(db, n_submissions, n_interactions, n_similarities,
+                       random_state=0):
+    """Add synthetic submissions, interactions and similarities."""
+    rng = np.random.RandomState(random_state)
+    now = datetime.datetime.utcnow()
+    with db.begin() as conn:
+        event_team_ids = [row[0] for row in conn.execute(
+            text('SELECT id FROM event_teams ORDER BY id'))]
+        user_ids = [row[0] for row in conn.execute(
+            text('SELECT id FROM users ORDER BY id'))]
+        states = np.array(['scored', 'training_error', 'new'])
+        insert_rows(conn, Submission.__table__, [
+            {'event_team_id': event_team_ids[idx % len(event_team_ids)],
+             'name': 'synthetic_{}'.format(idx),
+             'hash_': 'synthetic_{}'.format(idx),
+             'submission_timestamp': now - datetime.timedelta(minutes=idx),
+             'state': state}
+            for idx, state in enumerate(states[rng.choice(
+                3, size=n_submissions, p=[0.9, 0.09, 0.01])])
+        ])
+        submission_ids = [row[0] for row in conn.execute(
+            text('SELECT id FROM submissions ORDER BY id'))]
+        interactions = np.array(['looking at submission', 'landing',
+                                 'looking at leaderboard', 'download'])
+        insert_rows(conn, UserInteraction.__table__, [
+            {'timestamp': now - datetime.timedelta(seconds=idx),
+             'interaction': interactions[rng.randint(len(interactions))],
+             'user_id': user_ids[rng.randint(len(user_ids))],
+             'event_team_id': event_team_ids[rng.randint(
+                 len(event_team_ids))],
+             'submission_id': submission_ids[rng.randint(
+                 len(submission_ids))]}
+            for idx in range(n_interactions)
+        ])
+        insert_rows(conn, SubmissionSimilarity.__table__, [
+            {'type': 'target_credit',
+             'timestamp': now,
+             'similarity': rng.rand(),
+             'user_id': user_ids[rng.randint(len(user_ids))],
+             'source_submission_id': submission_ids[rng.randint(
+                 len(submission_ids))],
+             'target_submission_id': submission_ids[rng.randint(
+                 len(submission_ids))]}
+            for _ in range(n_similarities)
+        ])
+    return {'event_team_id': event_team_ids[0], 'user_id': user_ids[0],
+            'submission_id': submission_ids[len(submission_ids) // 2]}
+
+
+def _scans(plan):
+    """Get the scans of a PostgreSQL query plan."""
+    scans = []
+    # the bitmap index scans are the children of the bitmap heap scans
+    if 'Relation Name' in plan or 'Index Name' in plan:
+        scan = plan['Node Type']
+        if 'Index Name' in plan:
+            scan += ' using ' + plan['Index Name']
+        scans.append(scan)
+    for subplan in plan.get('Plans', []):
+        scans += _scans(subplan)
+    return scans
+
+
+def query_plan(conn, query, params):
+    """Summarize the query plan as the list of the scans of the tables."""
+    if conn.dialect.name == 'postgresql':
+        result = conn.execute(text('EXPLAIN (FORMAT JSON) ' + query),
+                              params).scalar()
+        return ', '.join(_scans(result[0]['Plan']))
+    elif conn.dialect.name == 'sqlite':
+        result = conn.execute(text('EXPLAIN QUERY PLAN ' + query), params)
+        return ', '.join(row[-1] for row in result)
+    return ''
+
+
+def bench(db, params, n_repeat):
+    if db.dialect.name == 'postgresql':
+        with db.begin() as conn:
+            conn.execute(text('ANALYZE'))
+    results = {}
+    with db.connect() as conn:
+        for name, query in QUERIES:
+            conn.execute(text(query), params).fetchall()
+            tic = time.perf_counter()
+            for _ in range(n_repeat):
+                conn.execute(text(query), params).fetchall()
+            results[name] = ((time.perf_counter() - tic) / n_repeat,
+                             query_plan(conn, query, params))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--n-submissions', type=int, default=100000)
+    parser.add_argument('--n-interactions', type=int, default=200000)
+    parser.add_argument('--n-similarities', type=int, default=100000)
+    parser.add_argument('--n-repeat', type=int, default=20)
+    parser.add_argument('--database-config', default=None,
+                        help='Configuration of the database. By default, the '
+                             'database used by the tests.')
+    args = parser.parse_args()
+
+    database_config = read_config(
+        args.database_config or database_config_template())
+    ramp_config = ramp_config_template()
+    deployment_dir = create_toy_db(database_config, ramp_config)
+    try:
+        db, _ = setup_db(database_config['sqlalchemy'])
+        params = add_synthetic_rows(db, args.n_submissions,
+                                    args.n_interactions, args.n_similarities)
+        # the database as created before the indexes were declared
+        with db.begin() as conn:
+            for index in INDEXES:
+                conn.execute(text('DROP INDEX {}'.format(index)))
+        before = bench(db, params, args.n_repeat)
+        for change in upgrade_db(database_config['sqlalchemy']):
+            print(change)
+        after = bench(db, params, args.n_repeat)
+    finally:
+        shutil.rmtree(deployment_dir, ignore_errors=True)
+        db, _ = setup_db(database_config['sqlalchemy'])
+        Model.metadata.drop_all(db)
+
+    print()
+    print('{} submissions, {} interactions, {} similarities'.format(
+        args.n_submissions, args.n_interactions, args.n_similarities))
+    for name, _ in QUERIES:
+        print()
+        print(name)
+        for label, results in (('before', before), ('after', after)):
+            print('  {:<8}{:>10.3f} ms  {}'.format(
+                label, 1000 * results[name][0], results[name][1]))
+
+
+if __name__ == '__main__':
+    main()
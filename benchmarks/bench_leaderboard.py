@@ -0,0 +1,295 @@
+"""
+Benchmark of the computation of the leaderboards.
+
+The toy database used by the tests is filled with synthetic scored
+submissions. The leaderboard built by
+:func:`ramp_database.tools.leaderboard._compute_leaderboard` is compared
+with the previous implementation which was querying the scores, the times, and
+the memory of each submission separately. The benchmark reports the time and
+the number of queries of both implementations to build the private
+leaderboard and checks that they build the same leaderboard.
+
+The refresh of all the leaderboards of the event and of its teams, as done by
+the dispatcher, is then timed when each leaderboard is rendered separately
+with :func:`ramp_database.tools.leaderboard.get_leaderboard` and when all of
+them are rendered from shared data by
+:func:`ramp_database.tools.leaderboard.update_leaderboards` and
+:func:`ramp_database.tools.leaderboard.update_all_user_leaderboards`, the
+latter being timed again without any changed submission.
+
+WARNING: the database given in the configuration is erased. By default, the
+database of the tests is used: it should be created beforehand, as done by the
+``database_connection`` fixture of the tests.
+
+Usage::
+
+    python benchmarks/bench_leaderboard.py --n-submissions 100 500 2000
+"""
+import argparse
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event as sqlalchemy_event
+
+from ramp_database.model import Event
+from ramp_database.model import EventTeam
+from ramp_database.model import Model
+from ramp_database.model import Submission
+from ramp_database.model import SubmissionFile
+from ramp_database.model import SubmissionOnCVFold
+from ramp_database.testing import create_toy_db
+from ramp_database.tools import leaderboard
+from ramp_database.tools.leaderboard import _compute_leaderboard
+from ramp_database.tools.leaderboard import get_leaderboard
+from ramp_database.tools.leaderboard import update_all_user_leaderboards
+from ramp_database.tools.leaderboard import update_leaderboards
+from ramp_database.tools.submission import get_bagged_scores
+from ramp_database.tools.submission import get_scores
+from ramp_database.tools.submission import get_submission_max_ram
+from ramp_database.tools.submission import get_time
+from ramp_database.utils import session_scope
+from ramp_database.utils import setup_db
+from ramp_utils import read_config
+from ramp_utils.testing import database_config_template
+from ramp_utils.testing import ramp_config_template
+
+EVENT_NAME = 'iris_test'
+
+
+def add_scored_submissions(session, n_submissions, random_state=0):
+    """Add synthetic scored submissions to the event."""
+    rng = np.random.RandomState(random_state)
+    event = session.query(Event).filter_by(name=EVENT_NAME).one()
+    event_teams = event.event_teams
+    # the synthetic submissions have the same files as the toy submissions
+    template = next(sub for event_team in event_teams
+                    for sub in event_team.submissions if sub.files)
+    for idx in range(n_submissions):
+        event_team = event_teams[idx % len(event_teams)]
+        with session.no_autoflush:
+            submission = Submission('synthetic_{}'.format(idx), event_team,
+                                    session=session)
+        session.add(submission)
+        for submission_file in template.files:
+            session.add(SubmissionFile(
+                submission=submission,
+                workflow_element=submission_file.workflow_element,
+                submission_file_type_extension=(
+                    submission_file.submission_file_type_extension)
+            ))
+        for cv_fold in event.cv_folds:
+            submission_on_cv_fold = SubmissionOnCVFold(submission, cv_fold)
+            session.add(submission_on_cv_fold)
+            for step in ('train', 'valid', 'test'):
+                setattr(submission_on_cv_fold, step + '_time', rng.rand())
+            for score in submission_on_cv_fold.scores:
+                for step in ('train', 'valid', 'test'):
+                    setattr(score, step + '_score', rng.rand())
+        n_folds = len(event.cv_folds)
+        for score in submission.scores:
+            for step in ('valid', 'test'):
+                bags = rng.rand(n_folds)
+                setattr(score, step + '_score_cv_bags', bags)
+                setattr(score, step + '_score_cv_bag', bags[-1])
+        submission.state = 'scored'
+        submission.max_ram = 100 * rng.rand()
+        submission.contributivity = rng.rand()
+    session.commit()
+
+
+def compute_leaderboard_per_submission(session, submissions,
+                                       leaderboard_type, event_name):
+    """Previous implementation querying each submission separately."""
+    record_score = []
+    event = session.query(Event).filter_by(name=event_name).one()
+    map_score_precision = {score_type.name: score_type.precision
+                           for score_type in event.score_types}
+    for sub in submissions:
+        # take only max n bag
+        df_scores_bag = get_bagged_scores(session, sub.id)
+        highest_level = df_scores_bag.index.get_level_values('n_bag').max()
+        df_scores_bag = df_scores_bag.loc[(slice(None), highest_level), :]
+        df_scores_bag.index = df_scores_bag.index.droplevel('n_bag')
+        df_scores_bag = df_scores_bag.round(map_score_precision)
+
+        df_scores = get_scores(session, sub.id)
+        df_scores = df_scores.round(map_score_precision)
+
+        df_time = get_time(session, sub.id)
+        df_time = df_time.stack().to_frame()
+        df_time.index = df_time.index.set_names(['fold', 'step'])
+        df_time = df_time.rename(columns={0: 'time'})
+        df_time = df_time.groupby(level="step").sum().T
+
+        df_scores_mean = df_scores.groupby('step').mean()
+        df_scores_std = df_scores.groupby('step').std()
+
+        map_renaming = {'valid': 'public', 'test': 'private'}
+        df_scores_mean = (df_scores_mean.loc[list(map_renaming.keys())]
+                                        .rename(index=map_renaming)
+                                        .stack().to_frame().T)
+        df_scores_std = (df_scores_std.loc[list(map_renaming.keys())]
+                                      .rename(index=map_renaming)
+                                      .stack().to_frame().T)
+        df_scores_bag = (df_scores_bag.rename(index=map_renaming)
+                                      .stack().to_frame().T)
+
+        df = pd.concat([df_scores_bag, df_scores_mean, df_scores_std], axis=1,
+                       keys=['bag', 'mean', 'std'])
+        df.columns = df.columns.set_names(['stat', 'set', 'score'])
+        df.columns = df.columns.map(lambda x: " ".join(x))
+
+        df_time.index = df.index
+        df_time = df_time.rename(
+            columns={'train': 'train time [s]',
+                     'valid': 'validation time [s]',
+                     'test': 'test time [s]'}
+        )
+        df = pd.concat([df, df_time], axis=1)
+
+        if leaderboard_type == 'private':
+            df['submission ID'] = sub.basename.replace('submission_', '')
+        df['team'] = sub.team.name
+        df['submission'] = sub.name
+        df['contributivity'] = int(round(100 * sub.contributivity))
+        df['historical contributivity'] = int(round(
+            100 * sub.historical_contributivity))
+        df['max RAM [MB]'] = get_submission_max_ram(session, sub.id)
+        df['submitted at (UTC)'] = pd.Timestamp(sub.submission_timestamp)
+        record_score.append(df)
+    return pd.concat(record_score, axis=0, ignore_index=True, sort=False)
+
+
+@contextmanager
+def count_queries(session):
+    """Count the queries executed through the session."""
+    counter = {'n_queries': 0}
+
+    def before_cursor_execute(*args):
+        counter['n_queries'] += 1
+
+    engine = session.get_bind()
+    sqlalchemy_event.listen(engine, 'before_cursor_execute',
+                            before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        sqlalchemy_event.remove(engine, 'before_cursor_execute',
+                                before_cursor_execute)
+
+
+def bench(session):
+    submissions = (session.query(Submission)
+                          .filter(Submission.is_private_leaderboard)
+                          .all())
+    results = {}
+    frames = {}
+    for name, func in (
+            ('per submission', compute_leaderboard_per_submission),
+            ('set-based', _compute_leaderboard)):
+        # start from an empty identity map for both implementations
+        session.expire_all()
+        submissions = [session.query(Submission).get(sub.id)
+                       for sub in submissions]
+        kwargs = {'with_links': False} if func is _compute_leaderboard else {}
+        with count_queries(session) as counter:
+            tic = time.perf_counter()
+            frames[name] = func(session, submissions, 'private', EVENT_NAME,
+                                **kwargs)
+            results[name] = (time.perf_counter() - tic, counter['n_queries'])
+    # the previous implementation did not format the leaderboard
+    expected = frames['per submission']
+    leaderboard = frames['set-based']
+    expected = expected.loc[leaderboard.index, leaderboard.columns]
+    expected['submitted at (UTC)'] = \
+        expected['submitted at (UTC)'].astype('datetime64[s]')
+    pd.testing.assert_frame_equal(leaderboard, expected, check_exact=True)
+    return len(submissions), results
+
+
+def refresh_per_leaderboard(session, event_name):
+    """Render each leaderboard of the event and of its teams separately."""
+    for leaderboard_type, with_links in (
+            ('private', True), ('public', True), ('public', False),
+            ('failed', True), ('public competition', True),
+            ('private competition', True), ('new', True)):
+        get_leaderboard(session, leaderboard_type, event_name,
+                        with_links=with_links)
+    event_teams = (session.query(EventTeam).join(Event)
+                          .filter(Event.name == event_name).all())
+    for event_team in event_teams:
+        for leaderboard_type in ('public', 'failed', 'new'):
+            get_leaderboard(session, leaderboard_type, event_name,
+                            event_team.team.name)
+
+
+def refresh_shared(session, event_name):
+    """Render all the leaderboards from shared data."""
+    update_leaderboards(session, event_name)
+    update_all_user_leaderboards(session, event_name)
+
+
+def bench_refresh(session):
+    results = {}
+    for name, func in (('per leaderboard', refresh_per_leaderboard),
+                       ('shared', refresh_shared),
+                       ('unchanged', refresh_shared)):
+        # start from an empty identity map and, except when refreshing
+        # unchanged leaderboards, without the data kept between refreshes
+        session.expire_all()
+        if name != 'unchanged':
+            leaderboard._LEADERBOARD_STATES.clear()
+            leaderboard._TEAM_LEADERBOARD_FINGERPRINTS.clear()
+        with count_queries(session) as counter:
+            tic = time.perf_counter()
+            func(session, EVENT_NAME)
+            results[name] = (time.perf_counter() - tic, counter['n_queries'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--n-submissions', type=int, nargs='+',
+                        default=[100, 500])
+    parser.add_argument('--database-config', default=None,
+                        help='Configuration of the database. By default, the '
+                             'database used by the tests.')
+    args = parser.parse_args()
+
+    database_config = read_config(
+        args.database_config or database_config_template())
+    ramp_config = ramp_config_template()
+    header = '{:>14}{:>14}{:>12}{:>14}{:>12}'
+    print(header.format('submissions', 'before [s]', 'queries', 'after [s]',
+                        'queries'))
+    refresh_results = []
+    for n_submissions in args.n_submissions:
+        deployment_dir = create_toy_db(database_config, ramp_config)
+        try:
+            with session_scope(database_config['sqlalchemy']) as session:
+                add_scored_submissions(session, n_submissions)
+                n_scored, results = bench(session)
+                print('{:>14}{:>14.3f}{:>12}{:>14.3f}{:>12}'.format(
+                    n_scored, *results['per submission'],
+                    *results['set-based']))
+                refresh_results.append((n_scored, bench_refresh(session)))
+        finally:
+            shutil.rmtree(deployment_dir, ignore_errors=True)
+            db, _ = setup_db(database_config['sqlalchemy'])
+            Model.metadata.drop_all(db)
+    print()
+    print('Refresh of the leaderboards of the event and of its teams')
+    print((header + '{:>16}{:>12}').format(
+        'submissions', 'separate [s]', 'queries', 'shared [s]', 'queries',
+        'unchanged [s]', 'queries'))
+    for n_scored, results in refresh_results:
+        print('{:>14}{:>14.3f}{:>12}{:>14.3f}{:>12}{:>16.3f}{:>12}'.format(
+            n_scored, *results['per leaderboard'], *results['shared'],
+            *results['unchanged']))
+
+
+if __name__ == '__main__':
+    main()
@@ -10,11 +10,13 @@ from ramp_utils import generate_ramp_config
 
 from .utils import session_scope
 
+from .tools import contributivity as contributivity_module
 from .tools import event as event_module
 from .tools import leaderboard as leaderboard_module
 from .tools import submission as submission_module
 from .tools import team as team_module
 from .tools import user as user_module
+from . import utils as utils_module
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
@@ -259,7 +261,9 @@ def get_submissions_by_state(config, event, state):
     """Display the list of submission for an event in a particular state."""
     config = read_config(config)
     with session_scope(config['sqlalchemy']) as session:
-        submissions = submission_module.get_submissions(session, event, state)
+        submissions = submission_module.get_submissions(
+            session, event, state, lightweight=True
+        )
         if submissions:
             data = defaultdict(list)
             for sub_info in submissions:
@@ -289,6 +293,40 @@ def set_submission_state(config, submission_id, state):
         submission_module.set_submission_state(session, submission_id, state)
 
 
+@main.command()
+@click.option("--config", default='config.yml', show_default=True,
+              help='Configuration file YAML format containing the database '
+              'information')
+@click.option("--submission-id", "submission_ids", type=int, multiple=True,
+              help='The submission ID. Can be repeated')
+@click.option("--event", help='The event name. All the submissions of the '
+              'event in the state given by --from-state are updated')
+@click.option("--from-state", help='The state of the submissions of the '
+              'event to update')
+@click.option("--state", help='The state to affect to the submissions')
+def set_submission_states(config, submission_ids, event, from_state, state):
+    """Set the state of several submissions at once."""
+    by_event = event is not None or from_state is not None
+    if (by_event == bool(submission_ids) or
+            (by_event and None in (event, from_state))):
+        raise click.UsageError(
+            'Give either the submission IDs or both the event and the state '
+            'of its submissions to update.'
+        )
+    config = read_config(config)
+    with session_scope(config['sqlalchemy']) as session:
+        if event is not None:
+            submission_ids = [
+                sub_id for sub_id, _ in submission_module.get_submissions(
+                    session, event, from_state, lightweight=True)
+            ]
+        n_submissions = submission_module.set_submission_states(
+            session, submission_ids, state
+        )
+        click.echo('{} submission(s) set to the state "{}"'
+                   .format(n_submissions, state))
+
+
 @main.command()
 @click.option("--config", default='config.yml', show_default=True,
               help='Configuration file YAML format containing the database '
@@ -326,6 +364,72 @@ def update_all_users_leaderboards(config, event):
         leaderboard_module.update_all_user_leaderboards(session, event)
 
 
+@main.command()
+@click.option("--config", default='config.yml', show_default=True,
+              help='Configuration file YAML format containing the database '
+              'information')
+@click.option("--event", help='The event name')
+@click.option("--path", help='The path of the exported file')
+@click.option("--format", "export_format", default='csv', show_default=True,
+              type=click.Choice(sorted(leaderboard_module.EXPORT_FORMATS)),
+              help='The file format')
+@click.option("--chunk-size", default=10000, show_default=True,
+              help='The number of rows read and written at once')
+def export_leaderboard(config, event, path, export_format, chunk_size):
+    """Export the scores of each fold of the submissions of an event."""
+    config = read_config(config)
+    with session_scope(config['sqlalchemy']) as session:
+        leaderboard_module.export_leaderboard(session, event, path,
+                                              export_format, chunk_size)
+
+
+@main.command()
+@click.option("--config", default='config.yml', show_default=True,
+              help='Configuration file YAML format containing the database '
+              'information')
+@click.option("--config-event", required=True,
+              help='Path to configuration file YAML format '
+              'containing the event information, eg config.yml')
+@click.option("--min-improvement", default=0.0, show_default=True,
+              help='The minimum improvement of the score needed to add a '
+              'submission to the ensemble')
+def compute_contributivity(config, config_event, min_improvement):
+    """Ensemble the submissions of an event and compute their
+    contributivity."""
+    ramp_config = generate_ramp_config(config_event, config)
+    event_name = ramp_config['event_name']
+    config = read_config(config)
+    with session_scope(config['sqlalchemy']) as session:
+        contributivity_module.compute_contributivity(
+            session, event_name, min_improvement=min_improvement
+        )
+        leaderboard_module.update_leaderboards(session, event_name)
+        leaderboard_module.update_all_user_leaderboards(session, event_name)
+        event = event_module.get_event(session, event_name)
+        click.echo('Combined score on the validation set: {}'
+                   .format(event.combined_combined_valid_score_str))
+        click.echo('Combined score on the testing set: {}'
+                   .format(event.combined_combined_test_score_str))
+
+
+@main.command()
+@click.option("--config", default='config.yml', show_default=True,
+              help='Configuration file YAML format containing the database '
+              'information')
+def upgrade_db(config):
+    """Add the tables, columns and indexes missing from a database.
+
+    The database should be set up with this command before being used. The
+    upgrade only adds the missing tables, columns and indexes and can be run
+    several times."""
+    config = read_config(config)
+    changes = utils_module.upgrade_db(config['sqlalchemy'])
+    for change in changes:
+        click.echo(change)
+    if not changes:
+        click.echo('The database is up to date')
+
+
 def start():
     main()
 
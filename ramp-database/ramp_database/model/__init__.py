@@ -13,3 +13,4 @@ from .problem import *  # noqa
 from .workflow import *  # noqa
 from .datatype import *  # noqa
 from .submission import *  # noqa
+from .leaderboard import *  # noqa
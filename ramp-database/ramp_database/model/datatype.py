@@ -1,4 +1,6 @@
+from functools import lru_cache
 import pickle
+import struct
 import zlib
 
 import numpy as np
@@ -6,42 +8,268 @@ import numpy as np
 from sqlalchemy import LargeBinary
 from sqlalchemy import TypeDecorator
 
-__all__ = ['NumpyType']
+__all__ = ['IndicesType', 'NumpyType']
+
+# The arrays are stored as a header followed by their raw C-ordered data:
+#
+#   magic (4 bytes) | version (uint8) | codec (uint8) | level (int8) |
+#   ndim (uint8) | length of the dtype (uint16) | dtype (ascii) |
+#   shape (ndim x uint64) | data, compressed with the codec
+#
+# The arrays of Python objects cannot be stored as raw data and are pickled
+# in the legacy format, a zlib-compressed pickle, which does not start with
+# the magic string.
+_MAGIC = b'\x93RNP'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBBbBH')
+_CODEC_NONE = 0
+_CODEC_ZLIB = 1
+
+
+def _encode(value, compression_level):
+    """Encode an array in the binary format."""
+    value = np.asarray(value)
+    if value.dtype.hasobject or value.dtype.fields is not None:
+        return zlib.compress(value.dumps())
+    if not value.flags.c_contiguous:
+        value = value.copy(order='C')
+    dtype = value.dtype.str.encode('ascii')
+    codec = _CODEC_ZLIB if compression_level else _CODEC_NONE
+    header = _HEADER.pack(_MAGIC, _VERSION, codec, compression_level,
+                          value.ndim, len(dtype))
+    data = value.reshape(-1).view(np.uint8)
+    if codec == _CODEC_ZLIB:
+        data = zlib.compress(data, compression_level)
+    return b''.join([header, dtype,
+                     struct.pack('<{}Q'.format(value.ndim), *value.shape),
+                     data])
+
+
+def _decode(value):
+    """Decode an array stored in the binary format or in the legacy one."""
+    if value[:len(_MAGIC)] != _MAGIC:
+        return pickle.loads(zlib.decompress(value))
+    _, version, codec, _, ndim, dtype_len = _HEADER.unpack_from(value)
+    if version > _VERSION:
+        raise ValueError(
+            'The array is stored with the version {} of the format while '
+            'only the versions up to {} are supported.'
+            .format(version, _VERSION)
+        )
+    offset = _HEADER.size
+    dtype = np.dtype(value[offset:offset + dtype_len].decode('ascii'))
+    offset += dtype_len
+    shape = struct.unpack_from('<{}Q'.format(ndim), value, offset)
+    offset += 8 * ndim
+    if codec == _CODEC_ZLIB:
+        value, offset = zlib.decompress(memoryview(value)[offset:]), 0
+    elif codec != _CODEC_NONE:
+        raise ValueError('Unknown compression codec {}.'.format(codec))
+    return np.frombuffer(value, dtype=dtype, offset=offset).reshape(shape)
 
 
 class NumpyType(TypeDecorator):
-    """Storing zipped numpy arrays."""
+    """Storing compressed numpy arrays.
+
+    The arrays are stored with a header giving their dtype and shape,
+    followed by their data, and are loaded without being unpickled. The
+    loaded arrays are read-only. The arrays pickled by the previous versions
+    are still loaded.
+
+    Parameters
+    ----------
+    compression_level : int, default=6
+        The zlib compression level, from 0 to 9. The arrays are stored
+        uncompressed with 0 and loaded without being copied.
+    """
     impl = LargeBinary
 
+    def __init__(self, compression_level=6, **kwargs):
+        if compression_level not in range(10):
+            raise ValueError(
+                'compression_level should be an integer between 0 and 9. Got '
+                '{!r} instead.'.format(compression_level)
+            )
+        self.compression_level = compression_level
+        super().__init__(**kwargs)
+
     def process_bind_param(self, value, dialect):
-        """Compress and pickle NumPy arrays on disk.
+        """Encode NumPy arrays in the binary format.
 
         Parameters
         ----------
-        value : ndarray
-            The array to pickle.
+        value : ndarray or None
+            The array to encode. Lists are converted into arrays.
         dialect : Dialect
             Dialect in use.
         Returns
         -------
-        pickle : pickle
-            The compress pickle.
+        data : bytes or None
+            The encoded array.
         """
-        # we convert the initial value into np.array to handle None and lists
-        return zlib.compress(np.array(value).dumps())
+        if value is None:
+            return None
+        return _encode(value, self.compression_level)
 
     def process_result_value(self, value, dialect):
-        """Load pickle into NumPy array.
+        """Decode the binary format into NumPy array.
 
         Parameters
         ----------
-        value : pickle
-            The NumPy array which was dumped into a pickle.
+        value : bytes or None
+            The encoded array.
         dialect : Dialect
             Dialect in use.
         Returns
         -------
-        array : ndarray
+        array : ndarray or None
             The NumPy array which has been loaded.
         """
-        return pickle.loads(zlib.decompress(value))
+        if value is None:
+            return None
+        return _decode(value)
+
+
+# The indices are stored as a header followed by their encoding, which is
+# chosen to be the smallest of:
+#
+#   - the ranges of consecutive indices, as (start, stop) pairs of int64;
+#   - a bitmap of the indices, after the offset (int64) of the smallest index
+#     and the number of bits (int64);
+#   - the array of indices in the NumpyType format.
+#
+# The ranges and the bitmap can only store increasing indices, such that the
+# order of the indices is always preserved.
+_INDICES_MAGIC = b'\x93RIX'
+_INDICES_VERSION = 1
+_INDICES_HEADER = struct.Struct('<4sBB')
+_INDICES_RANGES = 0
+_INDICES_BITMAP = 1
+_INDICES_ARRAY = 2
+_BITMAP_HEADER = struct.Struct('<qq')
+# the number of decoded indices kept by each process
+_INDICES_CACHE_SIZE = 64
+
+
+def _encode_indices(value):
+    """Encode indices in the smallest of the binary formats."""
+    value = np.asarray(value)
+    if (value.ndim != 1 or not value.size or
+            not np.issubdtype(value.dtype, np.integer) or
+            np.any(value[1:] <= value[:-1])):
+        return _INDICES_HEADER.pack(_INDICES_MAGIC, _INDICES_VERSION,
+                                    _INDICES_ARRAY) + _encode(value, 6)
+    value = value.astype(np.int64, copy=False)
+    # the positions where a range of consecutive indices starts
+    starts = np.flatnonzero(np.diff(value, prepend=value[0] - 2) != 1)
+    n_bits = int(value[-1] - value[0] + 1)
+    n_bytes = {
+        _INDICES_RANGES: 16 * starts.size,
+        _INDICES_BITMAP: _BITMAP_HEADER.size + (n_bits + 7) // 8,
+        _INDICES_ARRAY: 8 * value.size,
+    }
+    codec = min(n_bytes, key=n_bytes.get)
+    header = _INDICES_HEADER.pack(_INDICES_MAGIC, _INDICES_VERSION, codec)
+    if codec == _INDICES_RANGES:
+        stops = np.append(value[starts[1:] - 1], value[-1]) + 1
+        ranges = np.column_stack([value[starts], stops]).astype('<i8')
+        return header + ranges.tobytes()
+    elif codec == _INDICES_BITMAP:
+        bits = np.zeros(n_bits, dtype=bool)
+        bits[value - value[0]] = True
+        return (header + _BITMAP_HEADER.pack(int(value[0]), n_bits) +
+                np.packbits(bits).tobytes())
+    return header + _encode(value, 6)
+
+
+@lru_cache(maxsize=_INDICES_CACHE_SIZE)
+def _decode_indices(value):
+    """Decode indices stored in any of the binary formats.
+
+    The decoded indices are cached and shared: they are read-only.
+    """
+    if value[:len(_INDICES_MAGIC)] != _INDICES_MAGIC:
+        # the indices stored by NumpyType
+        indices = _decode(value)
+    else:
+        _, version, codec = _INDICES_HEADER.unpack_from(value)
+        if version > _INDICES_VERSION:
+            raise ValueError(
+                'The indices are stored with the version {} of the format '
+                'while only the versions up to {} are supported.'
+                .format(version, _INDICES_VERSION)
+            )
+        offset = _INDICES_HEADER.size
+        if codec == _INDICES_RANGES:
+            starts, stops = np.frombuffer(
+                value, dtype='<i8', offset=offset).reshape(-1, 2).T
+            lengths = stops - starts
+            # the index minus its position is constant in each range
+            indices = (np.arange(lengths.sum()) +
+                       np.repeat(starts - np.cumsum(lengths) + lengths,
+                                 lengths))
+        elif codec == _INDICES_BITMAP:
+            start, n_bits = _BITMAP_HEADER.unpack_from(value, offset)
+            bits = np.frombuffer(value, dtype=np.uint8,
+                                 offset=offset + _BITMAP_HEADER.size)
+            indices = np.flatnonzero(np.unpackbits(bits, count=n_bits))
+            indices += start
+        elif codec == _INDICES_ARRAY:
+            indices = _decode(value[offset:])
+        else:
+            raise ValueError(
+                'Unknown encoding of the indices {}.'.format(codec)
+            )
+    indices.flags.writeable = False
+    return indices
+
+
+class IndicesType(TypeDecorator):
+    """Storing arrays of indices compactly.
+
+    The increasing indices, e.g. the indices of the folds of a K-fold, are
+    stored as ranges of consecutive indices or as a bitmap, whichever is the
+    smallest, and the other arrays as :class:`NumpyType`. The arrays stored
+    by :class:`NumpyType` are loaded as well.
+
+    The decoded indices are cached by each process, such that the indices
+    loaded several times, e.g. in several sessions, are decoded once and
+    shared. The loaded indices are read-only.
+    """
+    impl = LargeBinary
+
+    def process_bind_param(self, value, dialect):
+        """Encode the indices in the smallest of the binary formats.
+
+        Parameters
+        ----------
+        value : ndarray or None
+            The indices to encode.
+        dialect : Dialect
+            Dialect in use.
+        Returns
+        -------
+        data : bytes or None
+            The encoded indices.
+        """
+        if value is None:
+            return None
+        return _encode_indices(value)
+
+    def process_result_value(self, value, dialect):
+        """Decode the indices, or get them from the cache.
+
+        Parameters
+        ----------
+        value : bytes or None
+            The encoded indices.
+        dialect : Dialect
+            Dialect in use.
+        Returns
+        -------
+        indices : ndarray or None
+            The decoded indices.
+        """
+        if value is None:
+            return None
+        return _decode_indices(bytes(value))
@@ -6,7 +6,7 @@ from sqlalchemy.orm import backref
 from sqlalchemy.orm import relationship
 
 from .base import Model
-from .datatype import NumpyType
+from .datatype import IndicesType
 
 __all__ = [
     'CVFold',
@@ -30,9 +30,11 @@ class CVFold(Model):
     type : {'live', 'test'}
         The type of the CV fold.
     train_is : ndarray
-        The training indices.
+        The training indices. The loaded indices are read-only and shared by
+        the instances of the same fold.
     test_is : ndarray
-        The testing indices.
+        The testing indices. The loaded indices are read-only and shared by
+        the instances of the same fold.
     event_id : int
         The ID of the event.
     event : :class:`ramp_database.model.Event`
@@ -46,8 +48,8 @@ class CVFold(Model):
     id = Column(Integer, primary_key=True)
     type = Column(cv_fold_types, default='live')
 
-    train_is = Column(NumpyType, nullable=False)
-    test_is = Column(NumpyType, nullable=False)
+    train_is = Column(IndicesType, nullable=False)
+    test_is = Column(IndicesType, nullable=False)
 
     event_id = Column(Integer, ForeignKey('events.id'), nullable=False)
     event = relationship('Event',
@@ -0,0 +1,290 @@
+import datetime
+
+from sqlalchemy import JSON
+from sqlalchemy import Float
+from sqlalchemy import Index
+from sqlalchemy import Column
+from sqlalchemy import String
+from sqlalchemy import Boolean
+from sqlalchemy import Integer
+from sqlalchemy import DateTime
+from sqlalchemy import ForeignKey
+from sqlalchemy import UniqueConstraint
+from sqlalchemy.orm import backref
+from sqlalchemy.orm import relationship
+
+from .base import Model
+
+__all__ = [
+    'Leaderboard',
+    'LeaderboardEntry',
+    'LeaderboardSnapshot',
+    'LeaderboardSnapshotRow',
+]
+
+
+class Leaderboard(Model):
+    """Leaderboard table.
+
+    The leaderboards of an event are stored as columnar data such that they
+    can be paginated, sorted, and filtered without being rendered entirely.
+
+    Parameters
+    ----------
+    event : :class:`ramp_database.model.Event`
+        The event instance.
+    leaderboard_type : {'public', 'private', 'failed', 'new', \
+'public competition', 'private competition'}
+        The type of leaderboard.
+
+    Attributes
+    ----------
+    id : int
+        The ID of the table row.
+    event_id : int
+        The ID of the event.
+    event : :class:`ramp_database.model.Event`
+        The event instance.
+    leaderboard_type : str
+        The type of leaderboard.
+    columns : list of str
+        The names of the columns displayed, in order.
+    data : dict
+        The values of each column, the rows being ordered as in the default
+        leaderboard. It can contain columns which are not displayed, e.g. the
+        ``'submission link'`` column giving the name of the submission with a
+        link to its code.
+    n_rows : int
+        The number of rows.
+    update_timestamp : datetime
+        The date and time of the last update.
+    """
+    __tablename__ = 'leaderboards'
+    __table_args__ = (UniqueConstraint('event_id', 'leaderboard_type',
+                                       name='leaderboard_constraint'),)
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, ForeignKey('events.id'), nullable=False)
+    event = relationship('Event',
+                         backref=backref('leaderboards',
+                                         cascade='all, delete-orphan'))
+    leaderboard_type = Column(String, nullable=False)
+    columns = Column(JSON, nullable=False)
+    data = Column(JSON, nullable=False)
+    n_rows = Column(Integer, nullable=False)
+    update_timestamp = Column(DateTime, nullable=False)
+
+    def __init__(self, event, leaderboard_type):
+        self.event = event
+        self.leaderboard_type = leaderboard_type
+        self.set_data([], {})
+
+    def __repr__(self):
+        return 'Leaderboard({}, {})'.format(self.event.name,
+                                            self.leaderboard_type)
+
+    def set_data(self, columns, data):
+        """Set the content of the leaderboard.
+
+        Parameters
+        ----------
+        columns : list of str
+            The names of the columns displayed, in order.
+        data : dict
+            The values of each column.
+        """
+        self.columns = columns
+        self.data = data
+        self.n_rows = len(next(iter(data.values()))) if data else 0
+        self.update_timestamp = datetime.datetime.utcnow()
+
+
+class LeaderboardEntry(Model):
+    """Leaderboard entry table.
+
+    The entries materialize the leaderboards of the events: each entry holds
+    the aggregated scores of a scored submission for one of the scores of the
+    event, such that the leaderboards can be queried with SQL. The entries
+    are kept up to date by
+    :func:`ramp_database.tools.leaderboard.update_leaderboard_entries`.
+
+    Attributes
+    ----------
+    id : int
+        The ID of the table row.
+    event_id : int
+        The ID of the event.
+    event : :class:`ramp_database.model.Event`
+        The event instance.
+    event_team_id : int
+        The ID of the event/team of the submission.
+    event_team : :class:`ramp_database.model.EventTeam`
+        The event/team instance.
+    submission_id : int
+        The ID of the submission.
+    submission : :class:`ramp_database.model.Submission`
+        The submission instance.
+    event_score_type_id : int
+        The ID of the event/score type.
+    event_score_type : :class:`ramp_database.model.EventScoreType`
+        The event/score type instance.
+    is_in_competition : bool
+        Whether the submission is in the competition.
+    bag_public_score : float
+        The bagged score on the public (validation) set.
+    mean_public_score : float
+        The mean of the scores of the folds on the public (validation) set.
+    std_public_score : float
+        The standard deviation of the scores of the folds on the public
+        (validation) set.
+    bag_private_score : float
+        The bagged score on the private (test) set.
+    mean_private_score : float
+        The mean of the scores of the folds on the private (test) set.
+    std_private_score : float
+        The standard deviation of the scores of the folds on the private
+        (test) set.
+    train_time : float
+        The training time summed over the folds.
+    valid_time : float
+        The validation time summed over the folds.
+    test_time : float
+        The testing time summed over the folds.
+    max_ram : float
+        The maximum RAM used by the submission in MB.
+    submission_timestamp : datetime
+        The date and time of the submission.
+    """
+    __tablename__ = 'leaderboard_entries'
+    __table_args__ = (
+        UniqueConstraint('submission_id', 'event_score_type_id',
+                         name='leaderboard_entry_constraint'),
+        # ranking of the submissions of an event on a score
+        Index('ix_leaderboard_entries_public_score', 'event_id',
+              'event_score_type_id', 'bag_public_score'),
+        Index('ix_leaderboard_entries_private_score', 'event_id',
+              'event_score_type_id', 'bag_private_score'),
+        # ranking of the submissions of each team
+        Index('ix_leaderboard_entries_team_score', 'event_id',
+              'event_score_type_id', 'event_team_id', 'bag_public_score'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, ForeignKey('events.id'), nullable=False)
+    event = relationship('Event')
+    event_team_id = Column(Integer, ForeignKey('event_teams.id'),
+                           nullable=False)
+    event_team = relationship('EventTeam')
+    submission_id = Column(Integer, ForeignKey('submissions.id'),
+                           nullable=False)
+    submission = relationship('Submission',
+                              backref=backref('leaderboard_entries',
+                                              cascade='all, delete-orphan'))
+    event_score_type_id = Column(Integer, ForeignKey('event_score_types.id'),
+                                 nullable=False)
+    event_score_type = relationship('EventScoreType')
+    is_in_competition = Column(Boolean, nullable=False)
+
+    bag_public_score = Column(Float)
+    mean_public_score = Column(Float)
+    std_public_score = Column(Float)
+    bag_private_score = Column(Float)
+    mean_private_score = Column(Float)
+    std_private_score = Column(Float)
+    train_time = Column(Float)
+    valid_time = Column(Float)
+    test_time = Column(Float)
+    max_ram = Column(Float)
+    submission_timestamp = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return ('LeaderboardEntry(submission_id={}, event_score_type_id={})'
+                .format(self.submission_id, self.event_score_type_id))
+
+
+class LeaderboardSnapshot(Model):
+    """Leaderboard snapshot table.
+
+    A snapshot records the rows of the leaderboard of an event which changed
+    since the previous snapshot, such that the leaderboard at any point in
+    time is reconstructed from the latest row of each submission. The
+    snapshots are taken by
+    :func:`ramp_database.tools.leaderboard.take_leaderboard_snapshot`.
+
+    Attributes
+    ----------
+    id : int
+        The ID of the table row.
+    event_id : int
+        The ID of the event.
+    event : :class:`ramp_database.model.Event`
+        The event instance.
+    timestamp : datetime
+        The date and time of the snapshot.
+    n_changes : int
+        The number of rows which changed since the previous snapshot.
+    rows : list of :class:`ramp_database.model.LeaderboardSnapshotRow`
+        A back-reference to the rows which changed.
+    """
+    __tablename__ = 'leaderboard_snapshots'
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, ForeignKey('events.id'), nullable=False)
+    event = relationship('Event',
+                         backref=backref('leaderboard_snapshots',
+                                         cascade='all, delete-orphan'))
+    timestamp = Column(DateTime, nullable=False, index=True)
+    n_changes = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return 'LeaderboardSnapshot({}, {})'.format(self.event.name,
+                                                    self.timestamp)
+
+
+class LeaderboardSnapshotRow(Model):
+    """Leaderboard snapshot row table.
+
+    The row of a submission in the leaderboard of an event, recorded by a
+    snapshot when it was added, changed, or removed.
+
+    Attributes
+    ----------
+    id : int
+        The ID of the table row.
+    snapshot_id : int
+        The ID of the snapshot.
+    snapshot : :class:`ramp_database.model.LeaderboardSnapshot`
+        The snapshot instance.
+    event_id : int
+        The ID of the event.
+    submission_id : int
+        The ID of the submission. It is not a foreign key such that the
+        history is kept when the submission is deleted.
+    is_in_competition : bool
+        Whether the submission was in the competition.
+    data : dict or None
+        The values of the columns of the row, as computed by
+        :func:`ramp_database.tools.leaderboard._compute_leaderboard_rows`.
+        None when the submission was removed from the leaderboard.
+    """
+    __tablename__ = 'leaderboard_snapshot_rows'
+    __table_args__ = (
+        # latest row of each submission of an event
+        Index('ix_leaderboard_snapshot_rows_submission', 'event_id',
+              'submission_id', 'snapshot_id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    snapshot_id = Column(Integer, ForeignKey('leaderboard_snapshots.id'),
+                         nullable=False)
+    snapshot = relationship('LeaderboardSnapshot',
+                            backref=backref('rows',
+                                            cascade='all, delete-orphan'))
+    event_id = Column(Integer, ForeignKey('events.id'), nullable=False)
+    submission_id = Column(Integer, nullable=False)
+    is_in_competition = Column(Boolean, nullable=False)
+    data = Column(JSON(none_as_null=True))
+
+    def __repr__(self):
+        return ('LeaderboardSnapshotRow(snapshot_id={}, submission_id={})'
+                .format(self.snapshot_id, self.submission_id))
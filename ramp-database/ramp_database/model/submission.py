@@ -2,6 +2,8 @@ import os
 import hashlib
 import datetime
 
+import numpy as np
+
 from sqlalchemy import Enum
 from sqlalchemy import Float
 from sqlalchemy import Column
@@ -10,13 +12,19 @@ from sqlalchemy import Integer
 from sqlalchemy import Boolean
 from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import UniqueConstraint
+from sqlalchemy import and_
 from sqlalchemy import inspect
+from sqlalchemy import select
 from sqlalchemy.orm import backref
+from sqlalchemy.orm import deferred
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from .base import Model
+from .event import Event
+from .event import EventTeam
 from .event import EventScoreType
 from .datatype import NumpyType
 
@@ -124,6 +132,11 @@ class Submission(Model):
         data.
     max_ram : float
         The maximum amount of RAM consumed during training.
+    memory_profile : ndarray, shape (2, n_points)
+        The downsampled memory profile of the training. The first row
+        contains the time in seconds since the beginning of the training and
+        the second row the maximum memory in MB during each time span. Only
+        meaningful if ``has_memory_profile`` is True.
     historical_contributivitys : list of \
 :class:`ramp_database.model.HistoricalContributivity`
         A back-reference of the historical contributivities for the submission.
@@ -176,8 +189,12 @@ class Submission(Model):
     test_time_cv_std = Column(Float, default=0.0)
     # the maximum memory size used when training/testing, in MB
     max_ram = Column(Float, default=0.0)
+    # downsampled memory curve, only loaded when accessed
+    memory_profile = deferred(Column(NumpyType, default=None))
     # later also ramp_id
     UniqueConstraint(event_team_id, name, name='ts_constraint')
+    # submissions of the teams of an event in a given state
+    Index('ix_submissions_event_team_state', event_team_id, state)
 
     def __init__(self, name, event_team, session=None):
         self.name = name
@@ -260,29 +277,64 @@ class Submission(Model):
         """bool: Whether the submission is not a sandbox."""
         return self.name != self.event.ramp_sandbox_name
 
+    @is_not_sandbox.expression
+    def is_not_sandbox(cls):
+        sandbox_name = (select([Event.ramp_sandbox_name])
+                        .where(Event.id == EventTeam.event_id)
+                        .where(EventTeam.id == cls.event_team_id)
+                        .correlate_except(Event, EventTeam)
+                        .as_scalar())
+        return cls.name != sandbox_name
+
     @hybrid_property
     def is_error(self):
         """bool: Whether the training of the submission failed."""
         return 'error' in self.state
 
+    @is_error.expression
+    def is_error(cls):
+        return cls.state.in_([state for state in submission_states.enums
+                              if 'error' in state])
+
     @hybrid_property
     def is_new(self):
         """bool: Whether the submission is a new submission."""
         return (self.state in ['new', 'training', 'sent_to_training'] and
                 self.is_not_sandbox)
 
+    @is_new.expression
+    def is_new(cls):
+        return and_(cls.state.in_(['new', 'training', 'sent_to_training']),
+                    cls.is_not_sandbox)
+
     @hybrid_property
     def is_public_leaderboard(self):
         """bool: Whether the submission is part of the public leaderboard."""
         return (self.is_not_sandbox and self.is_valid and
                 (self.state == 'scored'))
 
+    @is_public_leaderboard.expression
+    def is_public_leaderboard(cls):
+        return and_(cls.is_not_sandbox, cls.is_valid, cls.state == 'scored')
+
     @hybrid_property
     def is_private_leaderboard(self):
         """bool: Whether the submission is part of the private leaderboard."""
         return (self.is_not_sandbox and self.is_valid and
                 (self.state == 'scored'))
 
+    @is_private_leaderboard.expression
+    def is_private_leaderboard(cls):
+        return and_(cls.is_not_sandbox, cls.is_valid, cls.state == 'scored')
+
+    @property
+    def has_memory_profile(self):
+        """bool: Whether the memory profile of the training is stored."""
+        # a missing profile is NULL, or a 0-d array of None when stored by
+        # the previous versions of NumpyType
+        return (self.memory_profile is not None and
+                np.ndim(self.memory_profile) == 2)
+
     @property
     def path(self):
         """str: The path to the submission."""
@@ -291,7 +343,23 @@ class Submission(Model):
     @property
     def basename(self):
         """str: The base name of the submission."""
-        return 'submission_' + '{:09d}'.format(self.id)
+        return self.get_basename(self.id)
+
+    @staticmethod
+    def get_basename(submission_id):
+        """Get the base name of a submission from its id.
+
+        Parameters
+        ----------
+        submission_id : int
+            The id of the submission.
+
+        Returns
+        -------
+        basename : str
+            The base name of the submission.
+        """
+        return 'submission_' + '{:09d}'.format(submission_id)
 
     @property
     def module(self):
@@ -693,8 +761,22 @@ class SubmissionFile(Model):
         code : str
             The code to write into the submission file.
         """
-        with open(self.path, 'w') as f:
+        # the file is replaced rather than written in place since it can be
+        # shared with other submissions, see
+        # :mod:`ramp_database.tools._file_store`
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
             f.write(code)
+        os.replace(tmp_path, self.path)
+
+
+def _load_y_pred(path):
+    """Load predictions stored on disk as a read-only memory-mapped array.
+
+    The predictions are written by the code of the participants and are never
+    unpickled.
+    """
+    return np.load(path, mmap_mode='r')
 
 
 class SubmissionFileTypeExtension(Model):
@@ -886,6 +968,12 @@ class SubmissionOnCVFold(Model):
         Predictions on the full training set.
     test_y_pred : ndarray
         Predictions on the testing set.
+    full_train_y_pred_path : str
+        The path of the ``.npy`` file storing the predictions on the full
+        training set, if they are stored on disk.
+    test_y_pred_path : str
+        The path of the ``.npy`` file storing the predictions on the testing
+        set, if they are stored on disk.
     train_time : float
         Computation time for the training set.
     valid_time : float
@@ -906,6 +994,11 @@ class SubmissionOnCVFold(Model):
     db (lack of disk and pickling issues), so trained submission is not a
     database column. On the other hand, we will store train, valid, and test
     predictions. In a sense substituting CPU time for storage.
+
+    The predictions are stored on disk, see
+    :func:`ramp_database.tools.submission.set_predictions`, and loaded as
+    read-only memory-mapped arrays when they are accessed. The predictions
+    stored in the database by the previous versions are still loaded.
     """
 
     __tablename__ = 'submission_on_cv_folds'
@@ -929,8 +1022,11 @@ class SubmissionOnCVFold(Model):
 
     # prediction on the full training set, including train and valid points
     # properties train_predictions and valid_predictions will make the slicing
-    full_train_y_pred = Column(NumpyType, default=None)
-    test_y_pred = Column(NumpyType, default=None)
+    _full_train_y_pred = deferred(
+        Column('full_train_y_pred', NumpyType, default=None))
+    _test_y_pred = deferred(Column('test_y_pred', NumpyType, default=None))
+    full_train_y_pred_path = Column(String)
+    test_y_pred_path = Column(String)
     train_time = Column(Float, default=0.0)
     valid_time = Column(Float, default=0.0)
     test_time = Column(Float, default=0.0)
@@ -980,6 +1076,30 @@ class SubmissionOnCVFold(Model):
         """bool: Whether or not the submission failed at one of the stage."""
         return 'error' in self.state
 
+    @property
+    def full_train_y_pred(self):
+        """ndarray: Predictions on the full training set."""
+        if self.full_train_y_pred_path is not None:
+            return _load_y_pred(self.full_train_y_pred_path)
+        return self._full_train_y_pred
+
+    @full_train_y_pred.setter
+    def full_train_y_pred(self, y_pred):
+        self.full_train_y_pred_path = None
+        self._full_train_y_pred = y_pred
+
+    @property
+    def test_y_pred(self):
+        """ndarray: Predictions on the testing set."""
+        if self.test_y_pred_path is not None:
+            return _load_y_pred(self.test_y_pred_path)
+        return self._test_y_pred
+
+    @test_y_pred.setter
+    def test_y_pred(self, y_pred):
+        self.test_y_pred_path = None
+        self._test_y_pred = y_pred
+
     # The following four functions are converting the stored numpy arrays
     # <>_y_pred into Prediction instances
     @property
@@ -1200,14 +1320,16 @@ class SubmissionSimilarity(Model):
                         backref=backref('submission_similaritys',
                                         cascade='all, delete-orphan'))
 
-    source_submission_id = Column(Integer, ForeignKey('submissions.id'))
+    source_submission_id = Column(Integer, ForeignKey('submissions.id'),
+                                  index=True)
     source_submission = relationship(
         'Submission', primaryjoin=(
             'SubmissionSimilarity.source_submission_id == Submission.id'),
         backref=backref('sources', cascade='all, delete-orphan')
     )
 
-    target_submission_id = Column(Integer, ForeignKey('submissions.id'))
+    target_submission_id = Column(Integer, ForeignKey('submissions.id'),
+                                  index=True)
     target_submission = relationship(
         'Submission', primaryjoin=(
             'SubmissionSimilarity.target_submission_id == Submission.id'),
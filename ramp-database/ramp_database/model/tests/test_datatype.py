@@ -0,0 +1,179 @@
+import shutil
+import zlib
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from sqlalchemy import bindparam
+from sqlalchemy import LargeBinary
+from sqlalchemy import text
+
+from ramp_utils import read_config
+from ramp_utils.testing import database_config_template
+from ramp_utils.testing import ramp_config_template
+
+from ramp_database.model import Model
+from ramp_database.model import SubmissionScore
+from ramp_database.model.datatype import IndicesType
+from ramp_database.model.datatype import NumpyType
+
+from ramp_database.utils import setup_db
+from ramp_database.utils import session_scope
+from ramp_database.testing import create_toy_db
+
+
+@pytest.fixture(scope='module')
+def session_scope_module(database_connection):
+    database_config = read_config(database_config_template())
+    ramp_config = ramp_config_template()
+    try:
+        deployment_dir = create_toy_db(database_config, ramp_config)
+        with session_scope(database_config['sqlalchemy']) as session:
+            yield session
+    finally:
+        shutil.rmtree(deployment_dir, ignore_errors=True)
+        db, _ = setup_db(database_config['sqlalchemy'])
+        Model.metadata.drop_all(db)
+
+
+@pytest.mark.parametrize('compression_level', [0, 1, 6, 9])
+@pytest.mark.parametrize(
+    'value',
+    [np.arange(10),
+     np.array(0.5),
+     np.empty((0, 3)),
+     np.arange(6, dtype='>i4').reshape(2, 3),
+     np.asfortranarray(np.arange(6.).reshape(2, 3)),
+     np.arange(12.).reshape(3, 4)[:, ::2],
+     np.array([True, False]),
+     np.array(['a', 'bc']),
+     [1, 2, 3]]
+)
+def test_numpy_type(value, compression_level):
+    numpy_type = NumpyType(compression_level=compression_level)
+    data = numpy_type.process_bind_param(value, None)
+    assert data[:4] == b'\x93RNP'
+    array = numpy_type.process_result_value(data, None)
+    value = np.asarray(value)
+    assert array.dtype == value.dtype
+    assert array.shape == value.shape
+    assert_array_equal(array, value)
+    # the array is loaded without being copied
+    assert not array.flags.writeable
+
+
+def test_numpy_type_object():
+    # the arrays of Python objects are pickled
+    numpy_type = NumpyType()
+    value = np.array([None, 'a'], dtype=object)
+    array = numpy_type.process_result_value(
+        numpy_type.process_bind_param(value, None), None
+    )
+    assert_array_equal(array, value)
+
+
+def test_numpy_type_none():
+    numpy_type = NumpyType()
+    assert numpy_type.process_bind_param(None, None) is None
+    assert numpy_type.process_result_value(None, None) is None
+
+
+@pytest.mark.parametrize('value', [np.arange(10), np.array(None)])
+def test_numpy_type_legacy(value):
+    # the arrays pickled by the previous versions are still loaded
+    array = NumpyType().process_result_value(zlib.compress(value.dumps()),
+                                             None)
+    assert_array_equal(array, value)
+
+
+def test_numpy_type_compression_level():
+    value = np.zeros(1000)
+    assert (len(NumpyType(compression_level=9).process_bind_param(value,
+                                                                  None)) <
+            len(NumpyType(compression_level=0).process_bind_param(value,
+                                                                  None)))
+    with pytest.raises(ValueError, match='compression_level should be'):
+        NumpyType(compression_level=10)
+
+
+def test_numpy_type_unknown_version():
+    data = bytearray(NumpyType().process_bind_param(np.arange(3), None))
+    data[4] = 2
+    with pytest.raises(ValueError, match='version 2 of the format'):
+        NumpyType().process_result_value(bytes(data), None)
+
+
+def test_numpy_type_database(session_scope_module):
+    session = session_scope_module
+    score = session.query(SubmissionScore).order_by(SubmissionScore.id).first()
+    score_id = score.id
+    valid_score_cv_bags = np.array([0.5, 0.25])
+    score.valid_score_cv_bags = valid_score_cv_bags
+    session.commit()
+    session.expire_all()
+    score = session.query(SubmissionScore).get(score_id)
+    assert_array_equal(score.valid_score_cv_bags, valid_score_cv_bags)
+    assert not score.valid_score_cv_bags.flags.writeable
+
+    # the scores stored by the previous versions are still loaded
+    session.execute(
+        text('UPDATE submission_scores SET valid_score_cv_bags = :bags '
+             'WHERE id = :id')
+        .bindparams(bindparam('bags', type_=LargeBinary)),
+        {'bags': zlib.compress(valid_score_cv_bags.dumps()), 'id': score_id}
+    )
+    session.commit()
+    session.expire_all()
+    score = session.query(SubmissionScore).get(score_id)
+    assert_array_equal(score.valid_score_cv_bags, valid_score_cv_bags)
+
+    # and stored in the new format once updated
+    score.valid_score_cv_bags = np.array(score.valid_score_cv_bags)
+    session.commit()
+    data = session.execute(
+        text('SELECT valid_score_cv_bags FROM submission_scores '
+             'WHERE id = :id'),
+        {'id': score_id}
+    ).scalar()
+    assert bytes(data[:4]) == b'\x93RNP'
+    session.expire_all()
+    assert_array_equal(
+        session.query(SubmissionScore).get(score_id).valid_score_cv_bags,
+        valid_score_cv_bags
+    )
+
+
+@pytest.mark.parametrize(
+    'value, encoding',
+    [(np.arange(100), 0),
+     (np.r_[0:1000, 2000:3000], 0),
+     (np.r_[3:10:2, 11:100:3], 1),
+     (np.array([2, 1000000]), 2),
+     (np.random.RandomState(0).permutation(100), 2),
+     (np.arange(10, dtype=np.uint8)[::-1], 2),
+     (np.array([True, False, True]), 2),
+     (np.array([], dtype=np.int64), 2)]
+)
+def test_indices_type(value, encoding):
+    indices_type = IndicesType()
+    data = indices_type.process_bind_param(value, None)
+    assert data[:4] == b'\x93RIX'
+    assert data[5] == encoding
+    indices = indices_type.process_result_value(data, None)
+    assert indices.dtype.kind == value.dtype.kind
+    assert_array_equal(indices, value)
+    assert not indices.flags.writeable
+    # the indices are decoded once
+    assert indices_type.process_result_value(data, None) is indices
+
+
+@pytest.mark.parametrize(
+    'data',
+    [zlib.compress(np.arange(10).dumps()),
+     NumpyType().process_bind_param(np.arange(10), None)]
+)
+def test_indices_type_numpy_type(data):
+    # the indices stored by NumpyType are still loaded
+    assert_array_equal(IndicesType().process_result_value(data, None),
+                       np.arange(10))
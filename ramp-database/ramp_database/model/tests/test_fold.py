@@ -53,3 +53,18 @@ def test_cv_fold_model_backref(session_scope_module, backref, expected_type):
     # only check if the list is not empty
     if backref_attr:
         assert isinstance(backref_attr[0], expected_type)
+
+
+def test_cv_fold_model_indices(session_scope_module):
+    event = get_event(session_scope_module, 'iris_test')
+    cv_fold = (session_scope_module.query(CVFold)
+                                   .filter(CVFold.event_id == event.id)
+                                   .first())
+    train_is, test_is = cv_fold.train_is, cv_fold.test_is
+    assert not train_is.flags.writeable
+    assert not test_is.flags.writeable
+    # the indices are decoded once and shared by the instances of the fold
+    session_scope_module.expire_all()
+    cv_fold = session_scope_module.query(CVFold).get(cv_fold.id)
+    assert cv_fold.train_is is train_is
+    assert cv_fold.test_is is test_is
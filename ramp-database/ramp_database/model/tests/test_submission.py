@@ -91,6 +91,28 @@ def test_submission_model_property(session_scope_module):
         assert isinstance(score, SubmissionScore)
 
 
+@pytest.mark.parametrize("state", ['new', 'training_error', 'scored'])
+def test_submission_model_hybrid_expression(session_scope_module, state):
+    # the filters run in SQL select the same submissions as the properties
+    submission = get_submission_by_id(session_scope_module, 5)
+    previous_state = submission.state
+    submission.state = state
+    session_scope_module.commit()
+    try:
+        submissions = session_scope_module.query(Submission).all()
+        for attr in ['is_not_sandbox', 'is_error', 'is_new',
+                     'is_public_leaderboard', 'is_private_leaderboard']:
+            expected = {sub.id for sub in submissions if getattr(sub, attr)}
+            selected = (session_scope_module.query(Submission.id)
+                                            .filter(getattr(Submission, attr))
+                                            .all())
+            assert {id_ for id_, in selected} == expected
+            assert (submission.id in expected) is getattr(submission, attr)
+    finally:
+        submission.state = previous_state
+        session_scope_module.commit()
+
+
 def test_submission_model_set_state(session_scope_module):
     submission = get_submission_by_id(session_scope_module, 5)
     submission.set_state('sent_to_training')
@@ -212,6 +234,7 @@ def test_submission_score_model_property(session_scope_module):
     submission_score = \
         (session_scope_module.query(SubmissionScore)
                              .filter(SubmissionScore.submission_id == 5)
+                             .order_by(SubmissionScore.id)
                              .first())
     assert submission_score.score_name == 'acc'
     assert callable(submission_score.score_function)
@@ -2,6 +2,7 @@ import datetime
 
 from sqlalchemy import Enum
 from sqlalchemy import Float
+from sqlalchemy import Index
 from sqlalchemy import Column
 from sqlalchemy import String
 from sqlalchemy import Integer
@@ -277,6 +278,14 @@ default is None
         The session to directly perform the operation on the database.
     """
     __tablename__ = 'user_interactions'
+    __table_args__ = (
+        # submissions at which a user looked, used to credit them
+        Index('ix_user_interactions_user_interaction', 'user_id',
+              'interaction', 'event_team_id', 'submission_id'),
+        # interactions of a user over time
+        Index('ix_user_interactions_user_timestamp', 'user_id',
+              'interaction', 'timestamp'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     timestamp = Column(DateTime, nullable=False)
@@ -12,8 +12,10 @@ from ramp_utils.testing import database_config_template
 from ramp_utils.testing import ramp_config_template
 
 from ramp_database.utils import setup_db
+from ramp_database.utils import session_scope
 from ramp_database.model import Model
 from ramp_database.testing import create_toy_db
+from ramp_database.tools.submission import get_submissions
 
 from ramp_database.cli import main
 
@@ -285,6 +287,50 @@ def test_set_submission_state(make_toy_db):
     assert result.exit_code == 0, result.output
 
 
+def test_set_submission_states(make_toy_db):
+    database_config = read_config(database_config_template())
+    with session_scope(database_config['sqlalchemy']) as session:
+        submissions = get_submissions(session, 'iris_test', 'new',
+                                      lightweight=True)
+    submission_ids = [sub_id for sub_id, _ in submissions[:2]]
+    runner = CliRunner()
+    result = runner.invoke(main, ['set-submission-states',
+                                  '--config', database_config_template(),
+                                  '--submission-id', submission_ids[0],
+                                  '--submission-id', submission_ids[1],
+                                  '--state', 'training'],
+                           catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+    assert '2 submission(s) set to the state "training"' in result.output
+
+    result = runner.invoke(main, ['set-submission-states',
+                                  '--config', database_config_template(),
+                                  '--event', 'iris_test',
+                                  '--from-state', 'training',
+                                  '--state', 'new'],
+                           catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+    assert '2 submission(s) set to the state "new"' in result.output
+
+    for options in [[], ['--event', 'iris_test'],
+                    ['--event', 'iris_test', '--from-state', 'new',
+                     '--submission-id', 5]]:
+        result = runner.invoke(main, ['set-submission-states',
+                                      '--config', database_config_template(),
+                                      '--state', 'new'] + options)
+        assert result.exit_code == 2
+        assert 'Give either the submission IDs' in result.output
+
+
+def test_upgrade_db(make_toy_db):
+    runner = CliRunner()
+    result = runner.invoke(main, ['upgrade-db',
+                                  '--config', database_config_template()],
+                           catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+    assert 'The database is up to date' in result.output
+
+
 def test_update_leaderboards(make_toy_db):
     runner = CliRunner()
     result = runner.invoke(main, ['update-leaderboards',
@@ -311,3 +357,28 @@ def test_update_all_user_leaderboards(make_toy_db):
                                   '--event', 'iris_test'],
                            catch_exceptions=False)
     assert result.exit_code == 0, result.output
+
+
+def test_export_leaderboard(make_toy_db, tmpdir):
+    runner = CliRunner()
+    path = str(tmpdir.join('leaderboard.csv'))
+    result = runner.invoke(main, ['export-leaderboard',
+                                  '--config', database_config_template(),
+                                  '--event', 'iris_test',
+                                  '--path', path],
+                           catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+    with open(path) as f:
+        header = f.readline()
+    assert header.startswith('team,submission,submission ID')
+
+
+def test_compute_contributivity(make_toy_db):
+    runner = CliRunner()
+    result = runner.invoke(main, ['compute-contributivity',
+                                  '--config', database_config_template(),
+                                  '--config-event', ramp_config_template()],
+                           catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+    # the submissions of the toy database were not trained
+    assert 'Combined score on the validation set: None' in result.output
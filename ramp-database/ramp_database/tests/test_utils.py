@@ -2,19 +2,25 @@ import shutil
 
 import pytest
 
+from sqlalchemy import inspect
+
 from ramp_utils import read_config
 from ramp_utils.testing import database_config_template
 from ramp_utils.testing import ramp_config_template
 
 from ramp_database.testing import create_test_db
 
+from ramp_database import utils
 from ramp_database.model import Model
 from ramp_database.model import SubmissionFileType
 
 from ramp_database.utils import check_password
+from ramp_database.utils import dispose_engines
+from ramp_database.utils import get_engine
 from ramp_database.utils import hash_password
 from ramp_database.utils import setup_db
 from ramp_database.utils import session_scope
+from ramp_database.utils import upgrade_db
 
 
 @pytest.fixture
@@ -41,6 +47,61 @@ def test_setup_db(database):
         assert len(file_type) > 0
 
 
+def test_get_engine(database):
+    database_config = read_config(
+        database_config_template(), filter_section='sqlalchemy'
+    )
+    # the engine is shared by the calls using the same configuration
+    db, Session = get_engine(database_config)
+    assert get_engine(dict(database_config)) == (db, Session)
+    assert setup_db(database_config) == (db, Session)
+
+    # the options of the pool of connections are part of the configuration
+    pool_config = dict(database_config, pool_size=2, pool_pre_ping=True)
+    pool_db, _ = get_engine(pool_config)
+    assert pool_db is not db
+    assert pool_db.pool.size() == 2
+    assert pool_db.url == db.url
+    with session_scope(pool_config) as session:
+        assert session.query(SubmissionFileType).count() > 0
+
+    # the engines are created again once disposed
+    dispose_engines()
+    assert get_engine(database_config)[0] is not db
+
+
+def test_get_engine_forked_process(database, monkeypatch):
+    database_config = read_config(
+        database_config_template(), filter_section='sqlalchemy'
+    )
+    db, Session = get_engine(database_config)
+    with db.connect() as conn:
+        conn.execute('SELECT 1')
+    pool = db.pool
+    assert pool.checkedin() == 1
+    # the engines inherited by a forked process get a new pool and the
+    # connections of the parent are left open
+    monkeypatch.setattr(utils, '_ENGINES_PID', None)
+    assert get_engine(database_config) == (db, Session)
+    assert db.pool is not pool
+    assert pool.checkedin() == 1
+    with session_scope(database_config) as session:
+        assert session.query(SubmissionFileType).count() > 0
+
+
+def test_session_scope_without_tables(database):
+    database_config = read_config(
+        database_config_template(), filter_section='sqlalchemy'
+    )
+    db, _ = setup_db(database_config)
+    Model.metadata.drop_all(db)
+    # the tables are only created by setup_db
+    with session_scope(database_config) as session:
+        assert not inspect(session.get_bind()).get_table_names()
+    setup_db(database_config)
+    assert 'submission_file_types' in inspect(db).get_table_names()
+
+
 def test_session_scope(database):
     database_config = read_config(
         database_config_template(), filter_section='sqlalchemy'
@@ -50,6 +111,32 @@ def test_session_scope(database):
         assert len(file_type) > 0
 
 
+def test_upgrade_db(database):
+    database_config = read_config(
+        database_config_template(), filter_section='sqlalchemy'
+    )
+    # a database created before some columns and indexes were declared
+    db, _ = setup_db(database_config)
+    with db.begin() as conn:
+        conn.execute('DROP INDEX ix_submissions_event_team_state')
+        conn.execute('ALTER TABLE submission_on_cv_folds '
+                     'DROP COLUMN full_train_y_pred_path')
+    assert upgrade_db(database_config) == [
+        'Added the index ix_submissions_event_team_state on submissions',
+        'Added the column submission_on_cv_folds.full_train_y_pred_path'
+    ]
+    inspector = inspect(db)
+    assert 'ix_submissions_event_team_state' in {
+        index['name'] for index in inspector.get_indexes('submissions')}
+    assert 'full_train_y_pred_path' in {
+        column['name']
+        for column in inspector.get_columns('submission_on_cv_folds')}
+    with session_scope(database_config) as session:
+        assert session.query(SubmissionFileType).count() > 0
+    # the upgrade can be run several times
+    assert upgrade_db(database_config) == []
+
+
 def test_check_password():
     password = "hjst3789ep;ocikaqjw"
     hashed_password = hash_password(password)
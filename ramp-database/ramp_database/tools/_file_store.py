@@ -0,0 +1,153 @@
+"""
+Content-addressed store of the files of the submissions.
+
+Each distinct file content is stored once, as a blob named after its SHA-256
+digest, in a store located in the submissions directory of an event. The
+files of the submissions are hard links to these blobs, such that a file
+shared by several submissions, e.g. a data file or an unchanged code file,
+is neither copied nor stored twice. The number of links of a blob, minus its
+own, is the number of submission files referencing it: a blob is removed once
+the last submission file referencing it is removed.
+
+Since the files of several submissions can share the same blob, the files of
+a submission should be replaced rather than written in place.
+
+On a file system without hard links, the files of the submissions are copies
+of the blobs. The references to a blob cannot be counted then: the blobs are
+never removed, and the store can be deleted as a whole to reclaim its space
+since no submission file depends on it.
+"""
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+
+FILE_STORE_DIRNAME = '.file_store'
+_CHUNK_SIZE = 1 << 20
+
+
+def get_file_store_dir(submissions_dir):
+    """Get the directory of the file store of an event.
+
+    Parameters
+    ----------
+    submissions_dir : str
+        The directory in which the submissions of the event are stored.
+
+    Returns
+    -------
+    store_dir : str
+        The directory of the file store.
+    """
+    return os.path.join(submissions_dir, FILE_STORE_DIRNAME)
+
+
+def _hash_file(path):
+    """Compute the SHA-256 digest of the content of a file."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _get_blob_path(store_dir, digest):
+    return os.path.join(store_dir, digest[:2], digest)
+
+
+def _add_blob(src, blob_path):
+    """Copy a file in the store, unless a blob with its content exists."""
+    blob_dir = os.path.dirname(blob_path)
+    os.makedirs(blob_dir, exist_ok=True)
+    # copy the file under a temporary name such that a blob is never
+    # partially written, and keep the first blob added concurrently
+    fd, tmp_path = tempfile.mkstemp(dir=blob_dir)
+    os.close(fd)
+    try:
+        shutil.copy2(src, tmp_path)
+        os.link(tmp_path, blob_path)
+    except FileExistsError:
+        pass
+    except OSError as e:
+        if e.errno not in (errno.EPERM, errno.EXDEV, errno.EMLINK,
+                           errno.ENOTSUP):
+            raise
+        # the file system does not support hard links
+        os.replace(tmp_path, blob_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def store_file(store_dir, src, dst):
+    """Store a file and link it to its destination.
+
+    The content of the file is copied in the store only if no blob with the
+    same content exists yet. The destination is then a hard link to the blob,
+    or a copy of it if the file system does not support hard links. In the
+    latter case, the blob is never released by :func:`remove_files`.
+
+    Parameters
+    ----------
+    store_dir : str
+        The directory of the file store.
+    src : str
+        The path of the file to store.
+    dst : str
+        The path of the file to create. It should not exist.
+
+    Returns
+    -------
+    digest : str
+        The SHA-256 digest of the content of the file.
+    """
+    digest = _hash_file(src)
+    blob_path = _get_blob_path(store_dir, digest)
+    while True:
+        if not os.path.exists(blob_path):
+            _add_blob(src, blob_path)
+        try:
+            os.link(blob_path, dst)
+        except FileNotFoundError:
+            # the blob was removed by a concurrent call to remove_files since
+            # it was found: it is stored again
+            if os.path.exists(blob_path):
+                raise
+            continue
+        except OSError as e:
+            if e.errno not in (errno.EPERM, errno.EXDEV, errno.EMLINK,
+                               errno.ENOTSUP):
+                raise
+            shutil.copy2(blob_path, dst)
+        return digest
+
+
+def remove_files(store_dir, directory):
+    """Remove a directory of submission files and release their blobs.
+
+    The blobs which are not referenced by any other file are removed from
+    the store.
+
+    Parameters
+    ----------
+    store_dir : str
+        The directory of the file store.
+    directory : str
+        The directory to remove.
+    """
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            # only the digest of the last file referencing a blob is needed
+            # to find the blob to remove
+            digest = None
+            if os.lstat(path).st_nlink == 2:
+                digest = _hash_file(path)
+            os.remove(path)
+            if digest is not None:
+                blob_path = _get_blob_path(store_dir, digest)
+                if (os.path.exists(blob_path) and
+                        os.stat(blob_path).st_nlink == 1):
+                    os.remove(blob_path)
+    shutil.rmtree(directory)
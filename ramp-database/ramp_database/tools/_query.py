@@ -9,6 +9,7 @@ from ..model import EventTeam
 from ..model import Extension
 from ..model import Problem
 from ..model import Submission
+from ..model import SubmissionFile
 from ..model import SubmissionFileType
 from ..model import SubmissionFileTypeExtension
 from ..model import SubmissionSimilarity
@@ -36,14 +37,78 @@ def select_submissions_by_state(session, event_name, state):
     submissions : list of :class:`ramp_database.model.Submission`
         The queried list of submissions.
     """
-    q = (session.query(Submission)
-                .filter(Event.name == event_name)
-                .filter(Event.id == EventTeam.event_id)
-                .filter(EventTeam.id == Submission.event_team_id)
-                .order_by(Submission.submission_timestamp))
+    q = _filter_submissions_by_state(session.query(Submission), event_name,
+                                     state)
+    return q.order_by(Submission.submission_timestamp).all()
+
+
+def _filter_submissions_by_state(query, event_name, state):
+    query = (query.filter(Event.name == event_name)
+                  .filter(Event.id == EventTeam.event_id)
+                  .filter(EventTeam.id == Submission.event_team_id))
     if state is None:
-        return q.all()
-    return q.filter(Submission.state == state).all()
+        return query
+    return query.filter(Submission.state == state)
+
+
+def select_submission_ids_by_state(session, event_name, state):
+    """Query the ids of the submissions for a given event with given state.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to query the database.
+    event_name : str
+        The name of the RAMP event.
+    state : str or None
+        The state of the submissions to query. If None, all the submissions
+        are queried.
+
+    Returns
+    -------
+    submissions : list of tuple(int, str)
+        The id of the submissions and the directory in which the submissions
+        of the event are stored, ordered by submission time.
+    """
+    q = session.query(Submission.id, Event.path_ramp_submissions)
+    return (_filter_submissions_by_state(q, event_name, state)
+            .order_by(Submission.submission_timestamp)
+            .all())
+
+
+def select_submission_files_by_ids(session, submission_ids):
+    """Query the files of the given submissions.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to query the database.
+    submission_ids : list of int
+        The ids of the submissions.
+
+    Returns
+    -------
+    files : list of tuple(int, str, str)
+        The id of the submission, the name of the workflow element type, and
+        the extension of each file.
+    """
+    return (session.query(SubmissionFile.submission_id,
+                          WorkflowElementType.name, Extension.name)
+                   .join(WorkflowElement,
+                         WorkflowElement.id ==
+                         SubmissionFile.workflow_element_id)
+                   .join(WorkflowElementType,
+                         WorkflowElementType.id ==
+                         WorkflowElement.workflow_element_type_id)
+                   .join(SubmissionFileTypeExtension,
+                         SubmissionFileTypeExtension.id ==
+                         SubmissionFile.submission_file_type_extension_id)
+                   .join(Extension,
+                         Extension.id ==
+                         SubmissionFileTypeExtension.extension_id)
+                   .filter(SubmissionFile.submission_id.in_(submission_ids))
+                   .order_by(SubmissionFile.id)
+                   .all())
 
 
 def select_submission_by_id(session, submission_id):
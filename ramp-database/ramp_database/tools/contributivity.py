@@ -0,0 +1,545 @@
+"""
+Ensembling of the submissions of an event and computation of their
+contributivity.
+
+The predictions of the scored submissions are stacked, fold by fold, in
+memory-mapped arrays and the ensemble of each fold is built with Caruana's
+greedy forward selection with replacement [1]_. At each step, the candidate
+ensembles obtained by adding each submission to the current ensemble are
+combined and scored by batches with NumPy, such that the memory used does not
+depend on the number of submissions.
+
+References
+----------
+.. [1] R. Caruana, A. Niculescu-Mizil, G. Crew and A. Ksikes, "Ensemble
+   selection from libraries of models", ICML, 2004.
+"""
+import datetime
+import logging
+import os
+import tempfile
+
+import numpy as np
+from rampwf.score_types import Accuracy
+from rampwf.score_types import ClassificationError
+from rampwf.score_types import NegativeLogLikelihood
+from rampwf.score_types import RMSE
+
+from ..model import CVFold
+from ..model import HistoricalContributivity
+from ..model import Submission
+from ..model import SubmissionOnCVFold
+from ..model import SubmissionSimilarity
+
+from ._query import select_event_by_name
+
+logger = logging.getLogger('RAMP-DATABASE')
+
+# the number of bytes of the candidate ensembles combined and scored at once
+_BATCH_NBYTES = 64 * 2 ** 20
+
+# the columns storing the predictions in the database before they were
+# stored on disk
+_LEGACY_Y_PRED_COLUMNS = {'train': SubmissionOnCVFold._full_train_y_pred,
+                          'test': SubmissionOnCVFold._test_y_pred}
+
+
+def _is_averaging(Predictions, y_true):
+    """Whether the predictions are combined by averaging them.
+
+    The combination of a few predictions, built from the ground truth, is
+    compared with the average of each of them once combined alone, e.g.
+    clipped and normalized for probabilities. Only the public interface of
+    the predictions is used such that the predictions defined by the
+    problems are supported.
+    """
+    y_true = np.asarray(y_true[:10])
+    rng = np.random.RandomState(0)
+    try:
+        y_preds = [y_true.astype(np.float64), y_true[::-1].astype(np.float64),
+                   rng.uniform(size=y_true.shape)]
+        combined = Predictions.combine(
+            [Predictions(y_pred=y_pred) for y_pred in y_preds]).y_pred
+        averaged = np.mean([_to_combinable(Predictions, y_pred)
+                            for y_pred in y_preds], axis=0)
+        return bool(np.allclose(combined, averaged, equal_nan=True))
+    except Exception:
+        # e.g. the predictions are not numerical arrays
+        return False
+
+
+def _get_fold_predictions(session, submission_ids):
+    """Get where the predictions of the submissions are stored.
+
+    Returns
+    -------
+    fold_predictions : dict
+        The ID of the submission on a fold and the paths of its training and
+        testing predictions, keyed by (submission id, fold id). The paths are
+        None when the predictions are stored in the database.
+    """
+    rows = (session.query(SubmissionOnCVFold.id,
+                          SubmissionOnCVFold.submission_id,
+                          SubmissionOnCVFold.cv_fold_id,
+                          SubmissionOnCVFold.full_train_y_pred_path,
+                          SubmissionOnCVFold.test_y_pred_path)
+                   .filter(SubmissionOnCVFold.submission_id.in_(
+                       submission_ids))
+                   .all())
+    return {(submission_id, cv_fold_id): (
+                submission_on_cv_fold_id,
+                {'train': train_path, 'test': test_path})
+            for (submission_on_cv_fold_id, submission_id, cv_fold_id,
+                 train_path, test_path) in rows}
+
+
+def _has_y_pred(session, fold_predictions, step):
+    """Whether the predictions of a submission on a fold are available."""
+    if fold_predictions is None:
+        return False
+    submission_on_cv_fold_id, paths = fold_predictions
+    if paths[step] is not None:
+        return os.path.isfile(paths[step])
+    column = _LEGACY_Y_PRED_COLUMNS[step]
+    return session.query(
+        session.query(SubmissionOnCVFold)
+               .filter(SubmissionOnCVFold.id == submission_on_cv_fold_id)
+               .filter(column.isnot(None))
+               .exists()
+    ).scalar()
+
+
+def _load_y_pred(session, fold_predictions, step):
+    """Load the predictions of a submission on a fold.
+
+    The predictions are memory-mapped from the ``.npy`` file stored by
+    :func:`ramp_database.tools.submission.set_predictions`, or read from the
+    database for the submissions scored before.
+    """
+    submission_on_cv_fold_id, paths = fold_predictions
+    if paths[step] is not None:
+        return np.load(paths[step], mmap_mode='r')
+    return (session.query(_LEGACY_Y_PRED_COLUMNS[step])
+                   .filter(SubmissionOnCVFold.id == submission_on_cv_fold_id)
+                   .scalar())
+
+
+def _to_combinable(Predictions, y_pred):
+    """Transform predictions such that combining them is averaging them."""
+    return Predictions.combine([Predictions(y_pred=y_pred)]).y_pred
+
+
+def _stack_fold_predictions(session, fold_predictions, submission_ids,
+                            cv_fold, Predictions, path):
+    """Stack the validation predictions of the submissions on a fold.
+
+    The predictions are written one submission at a time in a memory-mapped
+    array.
+
+    Returns
+    -------
+    candidate_ids : list of int
+        The IDs of the submissions whose predictions are available, i.e. the
+        rows of the stacked predictions.
+    stack : :class:`numpy.memmap`
+        The stacked predictions of shape (n_candidates, n_valid, ...).
+    """
+    candidate_ids, stack = [], None
+    for submission_id in submission_ids:
+        predictions = fold_predictions.get((submission_id, cv_fold.id))
+        if not all(_has_y_pred(session, predictions, step)
+                   for step in ('train', 'test')):
+            logger.warning('The predictions of the submission {} on the fold '
+                           '{} are missing: the submission is not ensembled'
+                           .format(submission_id, cv_fold.id))
+            continue
+        y_pred = _load_y_pred(session, predictions, 'train')
+        y_pred = _to_combinable(Predictions, y_pred[cv_fold.test_is])
+        if stack is None:
+            stack = np.lib.format.open_memmap(
+                path, mode='w+', dtype=np.float64,
+                shape=(len(submission_ids),) + y_pred.shape
+            )
+        stack[len(candidate_ids)] = y_pred
+        candidate_ids.append(submission_id)
+    if stack is not None:
+        stack = stack[:len(candidate_ids)]
+    return candidate_ids, stack
+
+
+def _make_batch_scorer(score_type, ground_truths, Predictions):
+    """Make a function scoring a batch of predictions.
+
+    The scores implemented by ``rampwf`` which are commonly used as official
+    scores are computed with NumPy on the whole batch. The other scores are
+    computed by calling the score function on each prediction.
+    """
+    y_true = ground_truths.y_pred
+    if type(score_type) in (Accuracy, ClassificationError):
+        y_true_label_index = np.argmax(y_true, axis=1)
+
+        def score_batch(y_pred):
+            accuracy = np.mean(
+                np.argmax(y_pred, axis=-1) == y_true_label_index, axis=1)
+            return (accuracy if type(score_type) is Accuracy
+                    else 1 - accuracy)
+    elif type(score_type) is RMSE:
+        def score_batch(y_pred):
+            axis = tuple(range(1, y_pred.ndim))
+            return np.sqrt(np.mean(np.square(y_pred - y_true), axis=axis))
+    elif type(score_type) is NegativeLogLikelihood:
+        is_one_hot = (np.all(np.isin(y_true, (0, 1))) and
+                      np.all(np.sum(y_true, axis=1) == 1))
+        y_true_label_index = np.argmax(y_true, axis=1)
+        samples = np.arange(len(y_true))
+
+        def score_batch(y_pred):
+            np.clip(y_pred, 1e-15, 1 - 1e-15, out=y_pred)
+            normalizer = np.sum(y_pred, axis=-1)
+            if is_one_hot:
+                # only the probability of the true label is needed
+                log_proba = np.log(
+                    y_pred[:, samples, y_true_label_index] / normalizer)
+            else:
+                log_proba = np.sum(
+                    y_true * np.log(y_pred / normalizer[..., np.newaxis]),
+                    axis=-1)
+            return -np.mean(log_proba, axis=1)
+    else:
+        def score_batch(y_pred):
+            return np.array([
+                score_type.score_function(ground_truths,
+                                          Predictions(y_pred=y_pred_i))
+                for y_pred_i in y_pred
+            ])
+    return score_batch
+
+
+def _score_candidates(stack, ensemble_sum, n_ensemble, score_batch,
+                      is_lower_the_better, batch_size):
+    """Score the ensembles obtained by adding each candidate to an ensemble.
+
+    Parameters
+    ----------
+    stack : ndarray of shape (n_candidates, n_samples, ...)
+        The predictions of the candidates.
+    ensemble_sum : ndarray of shape (n_samples, ...) or None
+        The sum of the predictions of the current ensemble or None if the
+        ensemble is empty.
+    n_ensemble : int
+        The number of predictions in the current ensemble.
+    score_batch : callable
+        The function scoring a batch of predictions.
+    is_lower_the_better : bool
+        Whether a lower score is better.
+    batch_size : int
+        The number of candidate ensembles combined and scored at once.
+
+    Returns
+    -------
+    scores : ndarray of shape (n_candidates,)
+        The score of each candidate ensemble. The undefined scores are
+        replaced by the worst possible score.
+    """
+    scores = np.empty(len(stack))
+    # the batches are combined in the same buffer, which can be modified by
+    # the scoring function
+    buffer = np.empty((min(batch_size, len(stack)),) + stack.shape[1:])
+    for start in range(0, len(stack), batch_size):
+        batch = stack[start:start + batch_size]
+        y_pred = buffer[:len(batch)]
+        if ensemble_sum is None:
+            y_pred[...] = batch
+        else:
+            np.add(batch, ensemble_sum, out=y_pred)
+            y_pred /= n_ensemble + 1
+        scores[start:start + batch_size] = score_batch(y_pred)
+    scores[np.isnan(scores)] = np.inf if is_lower_the_better else -np.inf
+    return scores
+
+
+def _greedy_forward_selection(stack, score_batch, is_lower_the_better,
+                              max_n_ensemble, min_improvement=0.0,
+                              batch_size=None):
+    """Select an ensemble of the candidates with replacement.
+
+    Starting from the best candidate, the candidate improving the most the
+    score of the average of the ensemble is added until the score is not
+    improved by more than ``min_improvement`` or the ensemble contains
+    ``max_n_ensemble`` predictions.
+
+    Returns
+    -------
+    selection : list of int
+        The indices of the candidates in the ensemble, in their order of
+        selection. A candidate can be selected several times.
+    score : float
+        The score of the ensemble.
+    """
+    if batch_size is None:
+        batch_size = max(1, _BATCH_NBYTES // max(stack[0].nbytes, 1))
+    argbest = np.argmin if is_lower_the_better else np.argmax
+    sign = 1 if is_lower_the_better else -1
+    selection, ensemble_sum, score = [], None, None
+    while len(selection) < max(max_n_ensemble, 1):
+        scores = _score_candidates(stack, ensemble_sum, len(selection),
+                                   score_batch, is_lower_the_better,
+                                   batch_size)
+        best_idx = int(argbest(scores))
+        if (selection and
+                not sign * scores[best_idx] < sign * score - min_improvement):
+            break
+        selection.append(best_idx)
+        score = scores[best_idx]
+        if ensemble_sum is None:
+            ensemble_sum = np.array(stack[best_idx])
+        else:
+            ensemble_sum += stack[best_idx]
+    return selection, score
+
+
+def _combine_selection(session, fold_predictions, Predictions, candidate_ids,
+                       selection, stack, cv_fold):
+    """Combine the validation and testing predictions of an ensemble."""
+    y_pred_valid = np.mean(stack[selection], axis=0)
+    unique_idx, counts = np.unique(selection, return_counts=True)
+    y_pred_test = None
+    for candidate_idx, count in zip(unique_idx, counts):
+        y_pred = _load_y_pred(
+            session,
+            fold_predictions[candidate_ids[candidate_idx], cv_fold.id], 'test'
+        )
+        y_pred = count * _to_combinable(Predictions, y_pred)
+        y_pred_test = y_pred if y_pred_test is None else y_pred_test + y_pred
+    return y_pred_valid, y_pred_test / len(selection)
+
+
+def _score_bagged_predictions(score_type, ground_truths, Predictions,
+                              y_pred_sum, counts):
+    """Score the predictions averaged over the folds."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y_pred = y_pred_sum / counts.reshape((-1,) + (1,) *
+                                             (y_pred_sum.ndim - 1))
+    return float(score_type.score_function(
+        ground_truths, Predictions(y_pred=y_pred), counts > 0))
+
+
+def _compute_historical_contributivity(session, submissions):
+    """Share the contributivity of the submissions with the submissions they
+    credit.
+
+    The submissions are processed in order of submission: each submission
+    gives to the sources it credits a share of its historical contributivity
+    equal to the similarity declared by the authors. Only the latest credit
+    given to a source is taken into account.
+    """
+    submission_ids = [sub.id for sub in submissions]
+    similarities = (
+        session.query(SubmissionSimilarity.target_submission_id,
+                      SubmissionSimilarity.source_submission_id,
+                      SubmissionSimilarity.similarity)
+               .filter(SubmissionSimilarity.type == 'target_credit')
+               .filter(SubmissionSimilarity.target_submission_id.in_(
+                   submission_ids))
+               .order_by(SubmissionSimilarity.timestamp.desc(),
+                         SubmissionSimilarity.id.desc())
+               .all()
+    )
+    credits = {}
+    for target_id, source_id, similarity in similarities:
+        credits.setdefault(target_id, {}).setdefault(source_id, similarity)
+    historical_contributivity = {sub.id: 0.0 for sub in submissions}
+    for sub in sorted(submissions,
+                      key=lambda sub: (sub.submission_timestamp, sub.id)):
+        historical_contributivity[sub.id] += sub.contributivity
+        contributivity = historical_contributivity[sub.id]
+        for source_id, similarity in credits.get(sub.id, {}).items():
+            if source_id not in historical_contributivity:
+                continue
+            partial_credit = contributivity * similarity
+            historical_contributivity[source_id] += partial_credit
+            historical_contributivity[sub.id] -= partial_credit
+    return historical_contributivity
+
+
+def compute_contributivity(session, event_name, min_improvement=0.0,
+                           cache_dir=None, batch_size=None):
+    """Ensemble the submissions of an event and compute their contributivity.
+
+    On each fold, the validation predictions of the scored submissions to be
+    ensembled are stacked in a memory-mapped array and an ensemble of at most
+    ``event.max_n_ensemble`` predictions is built by greedy forward selection
+    with replacement on the official score. The contributivity of a
+    submission on a fold is the fraction of the ensemble made of its
+    predictions. The following information is updated in the database:
+
+    * the contributivity of the submissions on each fold and whether they
+      were the best submission of the fold;
+    * the contributivity and historical contributivity of the submissions,
+      recording the changes in the historical contributivity table;
+    * the scores of the ensembles (combined) and of the best submissions of
+      each fold (foldwise) of the event, bagged over the folds.
+
+    The predictions are loaded from the files whose paths are stored with the
+    submissions on each fold, or from the database for the submissions scored
+    before the predictions were stored on disk.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The name of the event.
+    min_improvement : float, default=0.0
+        The minimum improvement of the score needed to add a submission to
+        the ensemble.
+    cache_dir : str or None, default=None
+        The directory in which the memory-mapped predictions are temporarily
+        stored. By default, the temporary directory of the system is used.
+    batch_size : int or None, default=None
+        The number of candidate ensembles scored at once. By default, the
+        batches take 64 MB.
+
+    Raises
+    ------
+    ValueError :
+        when the predictions of the event are not combined by averaging them,
+        e.g. the detection predictions.
+    """
+    event = select_event_by_name(session, event_name)
+    problem_module = event.problem.module
+    Predictions = problem_module.Predictions
+    score_type = next(score_type for score_type in problem_module.score_types
+                      if score_type.name == event.official_score_name)
+    _, y_train = problem_module.get_train_data(
+        path=event.problem.path_ramp_data)
+    _, y_test = problem_module.get_test_data(
+        path=event.problem.path_ramp_data)
+    ground_truths_train = Predictions(y_true=y_train)
+    ground_truths_test = Predictions(y_true=y_test)
+    if not _is_averaging(Predictions, ground_truths_train.y_pred):
+        raise ValueError("The predictions of the event '{}' are not combined "
+                         "by averaging them: they cannot be ensembled."
+                         .format(event_name))
+
+    submissions = (session.query(Submission)
+                          .filter(Submission.event_team.has(event=event))
+                          .filter(Submission.is_public_leaderboard)
+                          .order_by(Submission.id)
+                          .all())
+    candidate_ids = [sub.id for sub in submissions if sub.is_to_ensemble]
+    cv_folds = (session.query(CVFold)
+                       .filter(CVFold.event_id == event.id)
+                       .order_by(CVFold.id)
+                       .all())
+    n_folds = len(cv_folds)
+    fold_predictions = _get_fold_predictions(session, candidate_ids)
+
+    # contributivity and best submission on each fold, keyed by
+    # (submission id, fold id)
+    fold_contributivity, fold_best = {}, set()
+    bags = {'combined': {}, 'foldwise': {}}
+    with tempfile.TemporaryDirectory(dir=cache_dir) as tmp_dir:
+        for fold_idx, cv_fold in enumerate(cv_folds):
+            fold_ids, stack = _stack_fold_predictions(
+                session, fold_predictions, candidate_ids, cv_fold,
+                Predictions, os.path.join(tmp_dir, 'fold_{}.npy'
+                                                   .format(fold_idx))
+            )
+            if not fold_ids:
+                continue
+            ground_truths_valid = Predictions(y_true=y_train[cv_fold.test_is])
+            score_batch = _make_batch_scorer(score_type, ground_truths_valid,
+                                             Predictions)
+            selection, _ = _greedy_forward_selection(
+                stack, score_batch, score_type.is_lower_the_better,
+                event.max_n_ensemble, min_improvement, batch_size
+            )
+            for candidate_idx in selection:
+                key = (fold_ids[candidate_idx], cv_fold.id)
+                fold_contributivity[key] = (fold_contributivity.get(key, 0) +
+                                            1 / len(selection))
+            fold_best.add((fold_ids[selection[0]], cv_fold.id))
+
+            for name, fold_selection in (('combined', selection),
+                                         ('foldwise', selection[:1])):
+                y_pred_valid, y_pred_test = _combine_selection(
+                    session, fold_predictions, Predictions, fold_ids,
+                    fold_selection, stack, cv_fold
+                )
+                bag = bags[name]
+                if not bag:
+                    bag['valid'] = np.zeros((len(y_train),) +
+                                            y_pred_valid.shape[1:])
+                    bag['valid_counts'] = np.zeros(len(y_train))
+                    bag['test'] = np.zeros_like(y_pred_test)
+                    bag['test_counts'] = np.zeros(len(y_test))
+                bag['valid'][cv_fold.test_is] += y_pred_valid
+                bag['valid_counts'][cv_fold.test_is] += 1
+                bag['test'] += y_pred_test
+                bag['test_counts'] += 1
+            del stack
+
+    for name, bag in bags.items():
+        for step, ground_truths in (('valid', ground_truths_train),
+                                    ('test', ground_truths_test)):
+            score = (_score_bagged_predictions(
+                score_type, ground_truths, Predictions, bag[step],
+                bag[step + '_counts']) if bag else None)
+            setattr(event, 'combined_{}_{}_score'.format(name, step), score)
+
+    # update the submissions on each fold which changed
+    all_cv_folds = (
+        session.query(SubmissionOnCVFold.id, SubmissionOnCVFold.submission_id,
+                      SubmissionOnCVFold.cv_fold_id,
+                      SubmissionOnCVFold.contributivity,
+                      SubmissionOnCVFold.best)
+               .join(Submission)
+               .filter(Submission.event_team.has(event=event))
+               .all()
+    )
+    mappings = []
+    for (submission_on_cv_fold_id, submission_id, cv_fold_id, contributivity,
+         best) in all_cv_folds:
+        key = (submission_id, cv_fold_id)
+        new_contributivity = fold_contributivity.get(key, 0.0)
+        new_best = key in fold_best
+        if (contributivity, best) != (new_contributivity, new_best):
+            mappings.append({'id': submission_on_cv_fold_id,
+                             'contributivity': new_contributivity,
+                             'best': new_best})
+    session.bulk_update_mappings(SubmissionOnCVFold, mappings)
+
+    # we share a unit of 1. among the folds
+    submission_contributivity = {}
+    for (submission_id, _), contributivity in fold_contributivity.items():
+        submission_contributivity[submission_id] = (
+            submission_contributivity.get(submission_id, 0.0) +
+            contributivity / n_folds
+        )
+    previous = {sub.id: (sub.contributivity, sub.historical_contributivity)
+                for sub in submissions}
+    for sub in submissions:
+        sub.contributivity = submission_contributivity.get(sub.id, 0.0)
+    historical_contributivity = _compute_historical_contributivity(
+        session, submissions)
+    timestamp = datetime.datetime.utcnow()
+    for sub in submissions:
+        sub.historical_contributivity = historical_contributivity[sub.id]
+        if (sub.contributivity, sub.historical_contributivity) != \
+                previous[sub.id]:
+            session.add(HistoricalContributivity(
+                timestamp=timestamp, submission=sub,
+                contributivity=sub.contributivity,
+                historical_contributivity=sub.historical_contributivity
+            ))
+    # the submissions which left the leaderboard do not contribute anymore
+    (session.query(Submission)
+            .filter(Submission.event_team.has(event=event))
+            .filter(~Submission.is_public_leaderboard)
+            .filter((Submission.contributivity != 0) |
+                    (Submission.historical_contributivity != 0))
+            .update({Submission.contributivity: 0.0,
+                     Submission.historical_contributivity: 0.0},
+                    synchronize_session='fetch'))
+    session.commit()
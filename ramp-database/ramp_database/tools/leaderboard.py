@@ -1,39 +1,237 @@
+from collections import namedtuple
+import datetime
 from distutils.version import LooseVersion
 from itertools import product
+import threading
 
 import numpy as np
 import pandas as pd
+from sqlalchemy import and_
+from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.orm import selectinload
 
 from ..model.event import Event
+from ..model.event import EventScoreType
 from ..model.event import EventTeam
+from ..model.leaderboard import Leaderboard
+from ..model.leaderboard import LeaderboardEntry
+from ..model.leaderboard import LeaderboardSnapshot
+from ..model.leaderboard import LeaderboardSnapshotRow
 from ..model.submission import Submission
+from ..model.submission import SubmissionOnCVFold
+from ..model.submission import SubmissionScore
+from ..model.submission import SubmissionScoreOnCVFold
 from ..model.team import Team
 
 from .team import get_event_team_by_name
 
-from .submission import get_bagged_scores
-from .submission import get_scores
-from .submission import get_submission_max_ram
-from .submission import get_time
-
 width = -1 if LooseVersion(pd.__version__) < LooseVersion("1.0.0") else None
 pd.set_option('display.max_colwidth', width)
 
+# the leaderboards report the validation and testing steps as public and
+# private
+_MAP_STEP_TO_SET = {'valid': 'public', 'test': 'private'}
 
-def _compute_leaderboard(session, submissions, leaderboard_type, event_name,
-                         with_links=True):
-    """Format the leaderboard.
+
+def _round_scores(df, map_score_precision, columns):
+    """Round the scores stored in a long format, i.e. one score per row."""
+    df = df.copy()
+    for score_name, precision in map_score_precision.items():
+        mask = (df['score'] == score_name).to_numpy()
+        df.loc[mask, columns] = df.loc[mask, columns].round(precision)
+    return df
+
+
+def _get_fold_scores(session, submission_ids):
+    """Get the public and private scores of each fold of the submissions.
+
+    The scores are returned in a long format (one row per submission, fold,
+    and score) ordered by fold, in a single query.
+    """
+    query = (session.query(SubmissionOnCVFold.submission_id,
+                           SubmissionOnCVFold.id,
+                           EventScoreType.name,
+                           SubmissionScoreOnCVFold.valid_score,
+                           SubmissionScoreOnCVFold.test_score)
+                    .join(SubmissionScoreOnCVFold,
+                          SubmissionScoreOnCVFold.submission_on_cv_fold_id ==
+                          SubmissionOnCVFold.id)
+                    .join(SubmissionScore,
+                          SubmissionScore.id ==
+                          SubmissionScoreOnCVFold.submission_score_id)
+                    .join(EventScoreType,
+                          EventScoreType.id ==
+                          SubmissionScore.event_score_type_id)
+                    .filter(SubmissionOnCVFold.submission_id.in_(
+                        submission_ids))
+                    .order_by(SubmissionOnCVFold.id))
+    columns = ['submission_id', 'fold_id', 'score', 'valid', 'test']
+    df = pd.DataFrame(query.all(), columns=columns)
+    df[['valid', 'test']] = df[['valid', 'test']].astype(float)
+    return df
+
+
+def _get_last_bagged_scores(session, submission_ids):
+    """Get the public and private scores of the submissions bagged over all
+    the folds.
+
+    The scores are returned in a long format (one row per submission and
+    score), in a single query.
+    """
+    query = (session.query(SubmissionScore.submission_id,
+                           EventScoreType.name,
+                           SubmissionScore.valid_score_cv_bags,
+                           SubmissionScore.test_score_cv_bags)
+                    .join(EventScoreType,
+                          EventScoreType.id ==
+                          SubmissionScore.event_score_type_id)
+                    .filter(SubmissionScore.submission_id.in_(submission_ids)))
+    records = []
+    for submission_id, score_name, valid_bags, test_bags in query:
+        bags = [np.ravel(scores) if np.ndim(scores) else np.array([])
+                for scores in (valid_bags, test_bags)]
+        records.append((submission_id, score_name, bags))
+    # the bag with the largest number of folds of a submission is reported;
+    # a score which has not been bagged over that many folds is missing
+    n_bags = {}
+    for submission_id, _, bags in records:
+        n_bags[submission_id] = max(n_bags.get(submission_id, 0),
+                                    *(len(scores) for scores in bags))
+    data = [(submission_id, score_name) + tuple(
+                scores[-1] if 0 < len(scores) == n_bags[submission_id]
+                else np.nan
+                for scores in bags)
+            for submission_id, score_name, bags in records]
+    return pd.DataFrame(data, columns=['submission_id', 'score', 'valid',
+                                       'test'])
+
+
+def _get_fold_times(session, submission_ids):
+    """Get the computation time of each fold of the submissions, ordered by
+    fold, in a single query."""
+    query = (session.query(SubmissionOnCVFold.submission_id,
+                           SubmissionOnCVFold.train_time,
+                           SubmissionOnCVFold.valid_time,
+                           SubmissionOnCVFold.test_time)
+                    .filter(SubmissionOnCVFold.submission_id.in_(
+                        submission_ids))
+                    .order_by(SubmissionOnCVFold.id))
+    df = pd.DataFrame(query.all(),
+                      columns=['submission_id', 'train', 'valid', 'test'])
+    df[['train', 'valid', 'test']] = \
+        df[['train', 'valid', 'test']].astype(float)
+    return df
+
+
+def _get_team_names(session, submission_ids):
+    """Map the submission ids to the name of their team."""
+    query = (session.query(Submission.id, Team.name)
+                    .filter(EventTeam.id == Submission.event_team_id)
+                    .filter(Team.id == EventTeam.team_id)
+                    .filter(Submission.id.in_(submission_ids)))
+    return dict(query.all())
+
+
+def _flatten_scores(df, stat):
+    """Pivot scores in a long format into the leaderboard columns named
+    ``'<stat> <public|private> <score>'``, indexed by submission id."""
+    df = (df.set_index(['submission_id', 'score'])[list(_MAP_STEP_TO_SET)]
+            .rename(columns=_MAP_STEP_TO_SET)
+            .unstack('score'))
+    df.columns = ['{} {} {}'.format(stat, dataset, score)
+                  for dataset, score in df.columns]
+    return df
+
+
+def _compute_leaderboard_rows(session, submissions, event):
+    """Compute the rows of the leaderboards of some submissions.
+
+    The scores, times, and memory of all the submissions are loaded with a
+    few queries and aggregated at once.
 
     Parameters
     ----------
     session : :class:`sqlalchemy.orm.Session`
         The session to directly perform the operation on the database.
     submissions : list of :class:`ramp_database.model.Submission`
-        The submission to report in the leaderboard.
+        The submissions to report in the leaderboard.
+    event : :class:`ramp_database.model.Event`
+        The event.
+
+    Returns
+    -------
+    rows : dataframe
+        All the columns of the leaderboards, one row per submission, indexed
+        by the submission id. The name of the submission is given without and
+        with a link in the ``'submission'`` and ``'submission link'`` columns.
+    """
+    map_score_precision = {score_type.name: score_type.precision
+                           for score_type in event.score_types}
+    submission_ids = [sub.id for sub in submissions]
+
+    df_scores_bag = _round_scores(
+        _get_last_bagged_scores(session, submission_ids),
+        map_score_precision, ['valid', 'test']
+    )
+    df_scores = _round_scores(
+        _get_fold_scores(session, submission_ids), map_score_precision,
+        ['valid', 'test']
+    )
+    scores_by_submission = df_scores.groupby(['submission_id', 'score'],
+                                             sort=False)[['valid', 'test']]
+    df_scores_mean = scores_by_submission.mean().reset_index()
+    df_scores_std = scores_by_submission.std().reset_index()
+    df_time = (_get_fold_times(session, submission_ids)
+               .groupby('submission_id')[['train', 'valid', 'test']].sum()
+               .rename(columns={'train': 'train time [s]',
+                                'valid': 'validation time [s]',
+                                'test': 'test time [s]'}))
+
+    df = pd.concat([_flatten_scores(df_scores_bag, 'bag'),
+                    _flatten_scores(df_scores_mean, 'mean'),
+                    _flatten_scores(df_scores_std, 'std'),
+                    df_time], axis=1)
+    df = df.reindex(pd.Index(submission_ids, name='submission_id'))
+
+    # load the files giving the links of the submissions in a single query
+    (session.query(Submission)
+            .options(selectinload(Submission.files))
+            .filter(Submission.id.in_(submission_ids))
+            .all())
+    df['submission ID'] = [sub.basename.replace('submission_', '')
+                           for sub in submissions]
+    team_names = _get_team_names(session, submission_ids)
+    df['team'] = [team_names[sub.id] for sub in submissions]
+    df['submission'] = [sub.name for sub in submissions]
+    df['submission link'] = [sub.name_with_link for sub in submissions]
+    df['contributivity'] = [int(round(100 * sub.contributivity))
+                            for sub in submissions]
+    df['historical contributivity'] = [
+        int(round(100 * sub.historical_contributivity))
+        for sub in submissions]
+    df['max RAM [MB]'] = [sub.max_ram for sub in submissions]
+    df['submitted at (UTC)'] = [pd.Timestamp(sub.submission_timestamp)
+                                for sub in submissions]
+    return df
+
+
+def _format_leaderboard(session, event, rows, leaderboard_type,
+                        with_links=True):
+    """Format the leaderboard from the rows of its submissions.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event : :class:`ramp_database.model.Event`
+        The event.
+    rows : dataframe
+        The rows of the submissions, as computed by
+        :func:`_compute_leaderboard_rows`.
     leaderboard_type : {'public', 'private'}
         The type of leaderboard to built.
-    event_name : str
-        The name of the event.
     with_links : bool
         Whether or not the submission name should be clickable.
 
@@ -42,72 +240,9 @@ def _compute_leaderboard(session, submissions, leaderboard_type, event_name,
     leaderboard : dataframe
         The leaderboard in a dataframe format.
     """
-    record_score = []
-    event = session.query(Event).filter_by(name=event_name).one()
-    map_score_precision = {score_type.name: score_type.precision
-                           for score_type in event.score_types}
-    for sub in submissions:
-        # take only max n bag
-        df_scores_bag = get_bagged_scores(session, sub.id)
-        highest_level = df_scores_bag.index.get_level_values('n_bag').max()
-        df_scores_bag = df_scores_bag.loc[(slice(None), highest_level), :]
-        df_scores_bag.index = df_scores_bag.index.droplevel('n_bag')
-        df_scores_bag = df_scores_bag.round(map_score_precision)
-
-        df_scores = get_scores(session, sub.id)
-        df_scores = df_scores.round(map_score_precision)
-
-        df_time = get_time(session, sub.id)
-        df_time = df_time.stack().to_frame()
-        df_time.index = df_time.index.set_names(['fold', 'step'])
-        df_time = df_time.rename(columns={0: 'time'})
-        df_time = df_time.sum(axis=0, level="step").T
-
-        df_scores_mean = df_scores.groupby('step').mean()
-        df_scores_std = df_scores.groupby('step').std()
-
-        # select only the validation and testing steps and rename them to
-        # public and private
-        map_renaming = {'valid': 'public', 'test': 'private'}
-        df_scores_mean = (df_scores_mean.loc[list(map_renaming.keys())]
-                                        .rename(index=map_renaming)
-                                        .stack().to_frame().T)
-        df_scores_std = (df_scores_std.loc[list(map_renaming.keys())]
-                                      .rename(index=map_renaming)
-                                      .stack().to_frame().T)
-        df_scores_bag = (df_scores_bag.rename(index=map_renaming)
-                                      .stack().to_frame().T)
-
-        df = pd.concat([df_scores_bag, df_scores_mean, df_scores_std], axis=1,
-                       keys=['bag', 'mean', 'std'])
-
-        df.columns = df.columns.set_names(['stat', 'set', 'score'])
-
-        # change the multi-index into a stacked index
-        df.columns = df.columns.map(lambda x: " ".join(x))
-
-        # add the aggregated time information
-        df_time.index = df.index
-        df_time = df_time.rename(
-            columns={'train': 'train time [s]',
-                     'valid': 'validation time [s]',
-                     'test': 'test time [s]'}
-        )
-        df = pd.concat([df, df_time], axis=1)
-
-        if leaderboard_type == 'private':
-            df['submission ID'] = sub.basename.replace('submission_', '')
-        df['team'] = sub.team.name
-        df['submission'] = sub.name_with_link if with_links else sub.name
-        df['contributivity'] = int(round(100 * sub.contributivity))
-        df['historical contributivity'] = int(round(
-            100 * sub.historical_contributivity))
-        df['max RAM [MB]'] = get_submission_max_ram(session, sub.id)
-        df['submitted at (UTC)'] = pd.Timestamp(sub.submission_timestamp)
-        record_score.append(df)
-
-    # stack all the records
-    df = pd.concat(record_score, axis=0, ignore_index=True, sort=False)
+    df = rows.reset_index(drop=True)
+    if with_links:
+        df['submission'] = df['submission link']
 
     # keep only second precision for the time stamp
     df['submitted at (UTC)'] = df['submitted at (UTC)'].astype('datetime64[s]')
@@ -146,9 +281,12 @@ def _compute_leaderboard(session, submissions, leaderboard_type, event_name,
     if (df[contrib_columns] == 0).all(axis=0).all():
         df = df.drop(columns=contrib_columns)
 
+    # the rows are ordered by submission id: use a stable sort such that the
+    # ties are always reported in the same order
     df = df.sort_values(
         "bag {} {}".format(leaderboard_type, event.official_score_name),
-        ascending=event.get_official_score_type(session).is_lower_the_better
+        ascending=event.get_official_score_type(session).is_lower_the_better,
+        kind='mergesort'
     )
 
     # rename the column name for the public leaderboard
@@ -159,9 +297,9 @@ def _compute_leaderboard(session, submissions, leaderboard_type, event_name,
     return df
 
 
-def _compute_competition_leaderboard(session, submissions, leaderboard_type,
-                                     event_name):
-    """Format the competition leaderboard.
+def _compute_leaderboard(session, submissions, leaderboard_type, event_name,
+                         with_links=True):
+    """Format the leaderboard.
 
     Parameters
     ----------
@@ -173,27 +311,86 @@ def _compute_competition_leaderboard(session, submissions, leaderboard_type,
         The type of leaderboard to built.
     event_name : str
         The name of the event.
+    with_links : bool
+        Whether or not the submission name should be clickable.
 
     Returns
     -------
-    competition_leaderboard : dataframe
-        The competition leaderboard in a dataframe format.
+    leaderboard : dataframe
+        The leaderboard in a dataframe format.
     """
     event = session.query(Event).filter_by(name=event_name).one()
+    rows = _compute_leaderboard_rows(session, submissions, event)
+    return _format_leaderboard(session, event, rows, leaderboard_type,
+                               with_links=with_links)
+
+
+def _select_best_submissions(rows, score_name, is_lower_the_better):
+    """Select the best submission of each team for the competition.
+
+    The best submission has the best public score. The ties are broken by
+    taking the earliest submission (at the second precision).
+
+    Parameters
+    ----------
+    rows : dataframe
+        The rows of the submissions in competition, as computed by
+        :func:`_compute_leaderboard_rows`.
+    score_name : str
+        The name of the official score.
+    is_lower_the_better : bool
+        Whether a lower score is better.
+
+    Returns
+    -------
+    best_ids : list of int
+        The ids of the best submissions.
+    """
+    if rows.empty:
+        return []
+    df = pd.DataFrame({
+        'team': rows['team'],
+        'score': rows['bag public ' + score_name],
+        'timestamp': rows['submitted at (UTC)'].astype('datetime64[s]')
+    })
+    by_team = df.groupby('team')['score']
+    best_score = by_team.transform('min' if is_lower_the_better else 'max')
+    df = df[df['score'] == best_score]
+    first_timestamp = df.groupby('team')['timestamp'].transform('min')
+    return df.index[df['timestamp'] == first_timestamp].tolist()
+
+
+def _rank_competition_leaderboard(session, event, rows):
+    """Rank the best submission of each team on the public and private sets.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event : :class:`ramp_database.model.Event`
+        The event.
+    rows : dataframe
+        The rows of the best submission of each team, see
+        :func:`_select_best_submissions`.
+
+    Returns
+    -------
+    ranked : dataframe
+        The public and private scores, ranks, and moves of the submissions,
+        from which both competition leaderboards are projected by
+        :func:`_format_competition_leaderboard`.
+    """
     score_type = event.get_official_score_type(session)
     score_name = event.official_score_name
 
-    private_leaderboard = _compute_leaderboard(session, submissions, 'private',
-                                               event_name, with_links=False)
-
-    time_list = (['train time [s]', 'validation time [s]', 'test time [s]']
-                 if leaderboard_type == 'private'
-                 else ['train time [s]', 'validation time [s]'])
+    private_leaderboard = _format_leaderboard(session, event, rows, 'private',
+                                              with_links=False)
 
     col_selected_private = (['team', 'submission'] +
                             ['bag private ' + score_name,
                              'bag public ' + score_name] +
-                            time_list +
+                            ['train time [s]', 'validation time [s]',
+                             'test time [s]'] +
                             ['submitted at (UTC)'])
     leaderboard_df = private_leaderboard[col_selected_private]
     leaderboard_df = leaderboard_df.rename(
@@ -201,35 +398,6 @@ def _compute_competition_leaderboard(session, submissions, leaderboard_type,
                  'bag public ' + score_name: 'public ' + score_name}
     )
 
-    # select best submission for each team
-    best_df = (leaderboard_df.groupby('team').min()
-               if score_type.is_lower_the_better
-               else leaderboard_df.groupby('team').max())
-    best_df = best_df[['public ' + score_name]].reset_index()
-    best_df['best'] = True
-
-    # merge to get a best indicator column then select best
-    leaderboard_df = pd.merge(
-        leaderboard_df, best_df, how='left',
-        left_on=['team', 'public ' + score_name],
-        right_on=['team', 'public ' + score_name]
-    )
-    leaderboard_df = leaderboard_df.fillna(False)
-    leaderboard_df = leaderboard_df[leaderboard_df['best']]
-    leaderboard_df = leaderboard_df.drop(columns='best')
-
-    # dealing with ties: we need the lowest timestamp
-    best_df = leaderboard_df.groupby('team').min()
-    best_df = best_df[['submitted at (UTC)']].reset_index()
-    best_df['best'] = True
-    leaderboard_df = pd.merge(
-        leaderboard_df, best_df, how='left',
-        left_on=['team', 'submitted at (UTC)'],
-        right_on=['team', 'submitted at (UTC)'])
-    leaderboard_df = leaderboard_df.fillna(False)
-    leaderboard_df = leaderboard_df[leaderboard_df['best']]
-    leaderboard_df = leaderboard_df.drop(columns='best')
-
     # sort by public score then by submission timestamp, compute rank
     leaderboard_df = leaderboard_df.sort_values(
         by=['public ' + score_name, 'submitted at (UTC)'],
@@ -246,7 +414,31 @@ def _compute_competition_leaderboard(session, submissions, leaderboard_type,
         leaderboard_df['public rank'] - leaderboard_df['private rank']
     leaderboard_df['move'] = [
         '{:+d}'.format(m) if m != 0 else '-' for m in leaderboard_df['move']]
+    return leaderboard_df
+
+
+def _format_competition_leaderboard(event, ranked, leaderboard_type):
+    """Format the competition leaderboard.
 
+    Parameters
+    ----------
+    event : :class:`ramp_database.model.Event`
+        The event.
+    ranked : dataframe
+        The ranked submissions, as computed by
+        :func:`_rank_competition_leaderboard`.
+    leaderboard_type : {'public', 'private'}
+        The type of leaderboard to built.
+
+    Returns
+    -------
+    competition_leaderboard : dataframe
+        The competition leaderboard in a dataframe format.
+    """
+    score_name = event.official_score_name
+    time_list = (['train time [s]', 'validation time [s]', 'test time [s]']
+                 if leaderboard_type == 'private'
+                 else ['train time [s]', 'validation time [s]'])
     col_selected = (
         [leaderboard_type + ' rank', 'team', 'submission',
          leaderboard_type + ' ' + score_name] +
@@ -256,7 +448,7 @@ def _compute_competition_leaderboard(session, submissions, leaderboard_type,
     if leaderboard_type == 'private':
         col_selected.insert(1, 'move')
 
-    df = leaderboard_df[col_selected]
+    df = ranked[col_selected]
     df = df.rename(columns={
         leaderboard_type + ' ' + score_name: score_name,
         leaderboard_type + ' rank': 'rank'
@@ -265,6 +457,439 @@ def _compute_competition_leaderboard(session, submissions, leaderboard_type,
     return df
 
 
+def _compute_competition_leaderboard(session, submissions, leaderboard_type,
+                                     event_name):
+    """Format the competition leaderboard.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    submissions : list of :class:`ramp_database.model.Submission`
+        The submission to report in the leaderboard.
+    leaderboard_type : {'public', 'private'}
+        The type of leaderboard to built.
+    event_name : str
+        The name of the event.
+
+    Returns
+    -------
+    competition_leaderboard : dataframe
+        The competition leaderboard in a dataframe format.
+    """
+    event = session.query(Event).filter_by(name=event_name).one()
+    rows = _compute_leaderboard_rows(session, submissions, event)
+    best_ids = _select_best_submissions(
+        rows, event.official_score_name,
+        event.get_official_score_type(session).is_lower_the_better
+    )
+    ranked = _rank_competition_leaderboard(session, event, rows.loc[best_ids])
+    return _format_competition_leaderboard(event, ranked, leaderboard_type)
+
+
+class _LeaderboardState:
+    """Leaderboard rows of the scored submissions of an event.
+
+    Attributes
+    ----------
+    rows : dataframe or None
+        The rows of the scored submissions, indexed by submission id and
+        sorted by id.
+    signatures : dict
+        The submission attributes from which each row has been computed, as
+        :class:`_SubmissionSignature`.
+    best : dict
+        The ids of the best submission(s) of each team in competition.
+    lock : :class:`threading.Lock`
+        The lock held while the state is updated, such that the leaderboards
+        of the other events are not blocked.
+    """
+
+    def __init__(self):
+        self.rows = None
+        self.signatures = {}
+        self.best = {}
+        self.lock = threading.Lock()
+
+    def competition_rows(self):
+        if self.rows is None:
+            return None
+        best_ids = sorted(id_ for ids in self.best.values() for id_ in ids)
+        return self.rows.loc[best_ids]
+
+
+# the leaderboard states of each database and event, updated by
+# _get_leaderboard_state
+_LEADERBOARD_STATES = {}
+_LEADERBOARD_STATES_LOCK = threading.Lock()
+
+# the attributes of a scored submission which determine its leaderboard rows
+_SubmissionSignature = namedtuple('_SubmissionSignature', [
+    'team', 'name', 'state', 'is_valid', 'is_in_competition',
+    'contributivity', 'historical_contributivity', 'max_ram',
+    'submission_timestamp', 'training_timestamp', 'scores'
+])
+
+
+def _get_submission_signatures(session, event):
+    """Get the attributes of the scored submissions of an event which
+    determine their leaderboard rows, in a single query.
+
+    The bagged scores are part of the signature, such that a submission
+    scored again, e.g. by another process, is detected as changed.
+    """
+    query = (session.query(Submission.id, Team.name, Submission.name,
+                           Submission.state, Submission.is_valid,
+                           Submission.is_in_competition,
+                           Submission.contributivity,
+                           Submission.historical_contributivity,
+                           Submission.max_ram,
+                           Submission.submission_timestamp,
+                           Submission.training_timestamp,
+                           SubmissionScore.valid_score_cv_bag,
+                           SubmissionScore.test_score_cv_bag)
+                    .outerjoin(SubmissionScore,
+                               SubmissionScore.submission_id == Submission.id)
+                    .filter(EventTeam.id == Submission.event_team_id)
+                    .filter(Team.id == EventTeam.team_id)
+                    .filter(EventTeam.event_id == event.id)
+                    .filter(Submission.is_public_leaderboard)
+                    .order_by(Submission.id, SubmissionScore.id))
+    attributes, scores = {}, {}
+    for row in query:
+        attributes[row[0]] = row[1:-2]
+        # NaN is not equal to itself and would always be seen as changed
+        scores.setdefault(row[0], []).extend(
+            None if score != score else score for score in row[-2:])
+    return {id_: _SubmissionSignature(*attributes[id_], tuple(scores[id_]))
+            for id_ in attributes}
+
+
+def _get_leaderboard_state(session, event):
+    """Get the up-to-date leaderboard rows of an event.
+
+    The rows are kept between calls and only the rows of the submissions
+    which have been scored, failed, or changed since the last call are
+    recomputed. Similarly, the best submission in competition is only
+    selected again for the teams with changed submissions.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event : :class:`ramp_database.model.Event`
+        The event.
+
+    Returns
+    -------
+    state : _LeaderboardState
+        The leaderboard state of the event.
+    """
+    key = (str(session.get_bind().engine.url), event.name)
+    signatures = _get_submission_signatures(session, event)
+    with _LEADERBOARD_STATES_LOCK:
+        state = _LEADERBOARD_STATES.setdefault(key, _LeaderboardState())
+    with state.lock:
+        changed_ids = [id_ for id_, signature in signatures.items()
+                       if state.signatures.get(id_) != signature]
+        removed_ids = [id_ for id_ in state.signatures
+                       if id_ not in signatures]
+        if not changed_ids and not removed_ids:
+            return state
+        changed_teams = {
+            signatures_[id_].team
+            for signatures_, ids in ((signatures, changed_ids),
+                                     (state.signatures, changed_ids),
+                                     (state.signatures, removed_ids))
+            for id_ in ids if id_ in signatures_
+        }
+        rows = state.rows
+        if rows is not None:
+            rows = rows.drop(index=changed_ids + removed_ids,
+                             errors='ignore')
+        if changed_ids:
+            submissions = (session.query(Submission)
+                                  .filter(Submission.id.in_(changed_ids))
+                                  .all())
+            new_rows = _compute_leaderboard_rows(session, submissions, event)
+            rows = (new_rows if rows is None
+                    else pd.concat([rows, new_rows], sort=False))
+        state.rows = rows.sort_index()
+        state.signatures = signatures
+
+        in_competition = [id_ for id_, signature in signatures.items()
+                          if signature.team in changed_teams and
+                          signature.is_in_competition]
+        best_ids = _select_best_submissions(
+            state.rows.loc[in_competition], event.official_score_name,
+            event.get_official_score_type(session).is_lower_the_better
+        )
+        for team in changed_teams:
+            state.best.pop(team, None)
+        for id_ in best_ids:
+            state.best.setdefault(signatures[id_].team, []).append(id_)
+        return state
+
+
+def _get_unscored_submissions(session, event):
+    """Get the new and failed submissions of an event, ordered by id, with
+    the name of their team.
+
+    The submissions are filtered in SQL and loaded with their event/team and
+    their files, needed to render the leaderboards, in two queries.
+    """
+    query = (session.query(Submission, Team.name)
+                    .join(Submission.event_team)
+                    .join(EventTeam.team)
+                    .options(contains_eager(Submission.event_team),
+                             selectinload(Submission.files))
+                    .filter(EventTeam.event_id == event.id)
+                    .filter(Submission.is_not_sandbox)
+                    .filter(or_(Submission.is_new, Submission.is_error))
+                    .order_by(Submission.id))
+    return query.all()
+
+
+def _format_unscored_leaderboard(submissions, leaderboard_type):
+    """Format the leaderboard of the new or failed submissions.
+
+    Parameters
+    ----------
+    submissions : list of tuple
+        The submissions with the name of their team, as returned by
+        :func:`_get_unscored_submissions`.
+    leaderboard_type : {'new', 'failed'}
+        The type of leaderboard to built.
+
+    Returns
+    -------
+    leaderboard : dataframe or None
+        The leaderboard in a dataframe format. None if there are no
+        submissions to report.
+    """
+    submission_filter = {'failed': 'is_error', 'new': 'is_new'}
+    submissions = [(sub, team_name) for sub, team_name in submissions
+                   if getattr(sub, submission_filter[leaderboard_type])]
+    if not submissions:
+        return None
+
+    if leaderboard_type == 'new':
+        columns = ['team', 'submission', 'submitted at (UTC)', 'state']
+    else:
+        columns = ['team', 'submission', 'submitted at (UTC)', 'error']
+
+    # we rely on the zip function ignore the submission state if the error
+    # column was not appended
+    data = [{
+        column: value for column, value in zip(
+            columns,
+            [team_name,
+             sub.name_with_link,
+             pd.Timestamp(sub.submission_timestamp),
+             (sub.state_with_link if leaderboard_type == 'failed'
+              else sub.state)])
+        } for sub, team_name in submissions]
+    return pd.DataFrame(data, columns=columns)
+
+
+def leaderboard_to_html(leaderboard):
+    """Export a leaderboard to HTML.
+
+    Parameters
+    ----------
+    leaderboard : dataframe
+        The leaderboard in a dataframe format.
+
+    Returns
+    -------
+    leaderboard : str
+        The header and the body of the HTML table of the leaderboard.
+    """
+    df_html = leaderboard.to_html(escape=False, index=False, max_cols=None,
+                                  max_rows=None, justify='left')
+    return '<thead> {} </tbody>'.format(
+        df_html.split('<thead>')[1].split('</tbody>')[0]
+    )
+
+
+def _group_by_team(rows, user_names):
+    """Split the rows of the scored submissions for each user."""
+    if rows is None:
+        return {user_name: None for user_name in user_names}
+    groups = {}
+    if any(user_name is not None for user_name in user_names):
+        groups = {team: df for team, df in rows.groupby('team', sort=False)}
+    return {user_name: rows if user_name is None else groups.get(user_name)
+            for user_name in user_names}
+
+
+def _compute_leaderboard_frames(session, event_name, variants,
+                                user_names=(None,), fingerprints=None):
+    """Compute several leaderboards of an event at once.
+
+    The leaderboards are projected from shared data: the rows of the scored
+    submissions are updated once (see :func:`_get_leaderboard_state`), the
+    new and failed submissions are queried once, and the competition ranking
+    is computed once for each user.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The event name.
+    variants : list of tuple
+        The leaderboards to render given as ``(leaderboard_type,
+        with_links)``. See :func:`get_leaderboard`.
+    user_names : list of None or str, default is (None,)
+        The users for which the leaderboards are rendered. None stands for
+        all the users.
+    fingerprints : dict or None, default is None
+        The fingerprints of the leaderboards previously rendered, i.e. the
+        attributes of the submissions that they report. The leaderboards
+        whose fingerprint did not change are not rendered again and are not
+        part of the output. The dictionary is updated with the fingerprints
+        of the rendered leaderboards. If None, all the leaderboards are
+        rendered.
+
+    Returns
+    -------
+    leaderboards : dict
+        The leaderboards in a dataframe format, or None when they are empty,
+        keyed by ``(user_name, leaderboard_type, with_links)``.
+    """
+    event = session.query(Event).filter_by(name=event_name).one()
+    leaderboard_types = {leaderboard_type for leaderboard_type, _ in variants}
+
+    unscored = {user_name: [] for user_name in user_names}
+    if leaderboard_types & {'new', 'failed'}:
+        for sub, team_name in _get_unscored_submissions(session, event):
+            for user_name in (None, team_name):
+                if user_name in unscored:
+                    unscored[user_name].append((sub, team_name))
+
+    rows = competition_rows = _group_by_team(None, user_names)
+    signatures = {}
+    if leaderboard_types - {'new', 'failed'}:
+        state = _get_leaderboard_state(session, event)
+        signatures = state.signatures
+        rows = _group_by_team(state.rows, user_names)
+        competition_rows = _group_by_team(state.competition_rows(),
+                                          user_names)
+
+    leaderboards = {}
+    for user_name in user_names:
+        ranked = None
+        for leaderboard_type, with_links in variants:
+            key = (user_name, leaderboard_type, with_links)
+            if fingerprints is not None:
+                if leaderboard_type in ['new', 'failed']:
+                    fingerprint = tuple(
+                        (sub.id, sub.state, sub.submission_timestamp)
+                        for sub, _ in unscored[user_name])
+                else:
+                    df = (rows if leaderboard_type in ['public', 'private']
+                          else competition_rows)[user_name]
+                    fingerprint = tuple(
+                        (id_, signatures[id_])
+                        for id_ in (() if df is None else df.index))
+                if fingerprints.get(key) == fingerprint:
+                    continue
+                fingerprints[key] = fingerprint
+
+            if leaderboard_type in ['new', 'failed']:
+                df = _format_unscored_leaderboard(unscored[user_name],
+                                                  leaderboard_type)
+            elif leaderboard_type in ['public', 'private']:
+                df = rows[user_name]
+                if df is not None and not df.empty:
+                    df = _format_leaderboard(session, event, df,
+                                             leaderboard_type,
+                                             with_links=with_links)
+            else:
+                df = competition_rows[user_name]
+                if df is not None and not df.empty:
+                    if ranked is None:
+                        ranked = _rank_competition_leaderboard(session, event,
+                                                               df)
+                    competition_type = ('public' if 'public' in
+                                        leaderboard_type else 'private')
+                    df = _format_competition_leaderboard(event, ranked,
+                                                         competition_type)
+            leaderboards[key] = None if df is None or df.empty else df
+    return leaderboards
+
+
+def _render_leaderboards(session, event_name, variants, user_names=(None,),
+                         fingerprints=None):
+    """Render several leaderboards of an event at once.
+
+    See :func:`_compute_leaderboard_frames` for the parameters.
+
+    Returns
+    -------
+    leaderboards : dict
+        The leaderboards in HTML format, or None when they are empty, keyed
+        by ``(user_name, leaderboard_type, with_links)``.
+    """
+    leaderboards = _compute_leaderboard_frames(
+        session, event_name, variants, user_names, fingerprints
+    )
+    return {key: None if df is None else leaderboard_to_html(df)
+            for key, df in leaderboards.items()}
+
+
+def _to_columnar(df):
+    """Convert a leaderboard to the columnar data stored in the database."""
+    data = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.astype(str)
+        values = values.astype(object)
+        data[column] = values.where(values.notna(), None).tolist()
+    return data
+
+
+def _store_leaderboards(session, event, leaderboards):
+    """Store the leaderboards of an event as columnar data.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event : :class:`ramp_database.model.Event`
+        The event.
+    leaderboards : dict
+        The leaderboards of the event, as computed by
+        :func:`_compute_leaderboard_frames`. The public and private
+        leaderboards are stored without links and with the links to the code
+        of the submissions in the ``'submission link'`` column.
+    """
+    stored = {leaderboard.leaderboard_type: leaderboard
+              for leaderboard in (session.query(Leaderboard)
+                                         .filter_by(event=event))}
+    leaderboard_types = {leaderboard_type
+                         for _, leaderboard_type, _ in leaderboards}
+    for leaderboard_type in leaderboard_types:
+        if leaderboard_type in ['public', 'private']:
+            df = leaderboards[None, leaderboard_type, False]
+            df_links = leaderboards[None, leaderboard_type, True]
+        else:
+            df = leaderboards[None, leaderboard_type, True]
+            df_links = None
+        if leaderboard_type not in stored:
+            stored[leaderboard_type] = Leaderboard(event, leaderboard_type)
+            session.add(stored[leaderboard_type])
+        if df is None:
+            stored[leaderboard_type].set_data([], {})
+            continue
+        data = _to_columnar(df)
+        if df_links is not None:
+            data['submission link'] = df_links['submission'].tolist()
+        stored[leaderboard_type].set_data(df.columns.tolist(), data)
+
+
 def get_leaderboard(session, leaderboard_type, event_name, user_name=None,
                     with_links=True):
     """Get a leaderboard.
@@ -289,69 +914,542 @@ def get_leaderboard(session, leaderboard_type, event_name, user_name=None,
     leaderboard : str
         The leaderboard in HTML format.
     """
-    q = (session.query(Submission)
-                .filter(Event.id == EventTeam.event_id)
-                .filter(Team.id == EventTeam.team_id)
-                .filter(EventTeam.id == Submission.event_team_id)
-                .filter(Event.name == event_name))
-    if user_name is not None:
-        q = q.filter(Team.name == user_name)
-    submissions = q.all()
-
-    submission_filter = {'public': 'is_public_leaderboard',
-                         'private': 'is_private_leaderboard',
-                         'failed': 'is_error',
-                         'new': 'is_new',
-                         'public competition': 'is_in_competition',
-                         'private competition': 'is_in_competition'}
-
-    submissions = [sub for sub in submissions
-                   if (getattr(sub, submission_filter[leaderboard_type]) and
-                       sub.is_not_sandbox)]
+    leaderboards = _render_leaderboards(
+        session, event_name, [(leaderboard_type, with_links)], [user_name]
+    )
+    return leaderboards[user_name, leaderboard_type, with_links]
 
-    if not submissions:
-        return None
 
-    if leaderboard_type in ['public', 'private']:
-        df = _compute_leaderboard(
-            session, submissions, leaderboard_type, event_name,
-            with_links=with_links
+# the decoded leaderboards stored in each database, and their sorted
+# versions, kept until the leaderboards are updated, see get_leaderboard_page
+_LEADERBOARD_FRAMES = {}
+
+
+def _get_leaderboard_frames(session, event_name, leaderboard_type):
+    """Get a leaderboard stored by :func:`update_leaderboards` as dataframes.
+
+    Only the update timestamp of the leaderboard is queried when its frames
+    are cached and up to date.
+
+    Returns
+    -------
+    columns : list of str or None
+        The names of the columns displayed. None if the leaderboard has not
+        been stored yet.
+    frames : dict
+        The leaderboard in its stored order, keyed by None, and sorted by
+        column, keyed by (column, ascending).
+    """
+    leaderboard = (session.query(Leaderboard.id, Leaderboard.update_timestamp)
+                          .filter(Leaderboard.event_id == Event.id)
+                          .filter(Event.name == event_name)
+                          .filter(Leaderboard.leaderboard_type ==
+                                  leaderboard_type)
+                          .one_or_none())
+    if leaderboard is None:
+        return None, {}
+    key = (str(session.get_bind().engine.url), leaderboard.id)
+    cached = _LEADERBOARD_FRAMES.get(key)
+    if cached is None or cached[0] != leaderboard.update_timestamp:
+        update_timestamp, columns, data = (
+            session.query(Leaderboard.update_timestamp, Leaderboard.columns,
+                          Leaderboard.data)
+                   .filter(Leaderboard.id == leaderboard.id)
+                   .one()
         )
-    elif leaderboard_type in ['new', 'failed']:
-        if leaderboard_type == 'new':
-            columns = ['team', 'submission', 'submitted at (UTC)', 'state']
-        else:
-            columns = ['team', 'submission', 'submitted at (UTC)', 'error']
-
-        # we rely on the zip function ignore the submission state if the error
-        # column was not appended
-        data = [{
-            column: value for column, value in zip(
-                columns,
-                [sub.event_team.team.name,
-                 sub.name_with_link,
-                 pd.Timestamp(sub.submission_timestamp),
-                 (sub.state_with_link if leaderboard_type == 'failed'
-                  else sub.state)])
-            } for sub in submissions]
-        df = pd.DataFrame(data, columns=columns)
+        cached = (update_timestamp, columns,
+                  {None: pd.DataFrame(data, columns=list(data))})
+        _LEADERBOARD_FRAMES[key] = cached
+    return cached[1], cached[2]
+
+
+def get_leaderboard_page(session, leaderboard_type, event_name,
+                         user_name=None, sort_by=None, ascending=True, page=1,
+                         per_page=50, with_links=True, timestamp=None):
+    """Get a page of a leaderboard stored by :func:`update_leaderboards`.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    leaderboard_type : {'public', 'private', 'failed', 'new', \
+'public competition', 'private competition'}
+        The type of leaderboard.
+    event_name : str
+        The event name.
+    user_name : None or str, default is None
+        The user name. If not None, only the submissions of this user are
+        reported.
+    sort_by : None or str, default is None
+        The column used to sort the leaderboard. If None, the order of the
+        stored leaderboard is kept.
+    ascending : bool, default is True
+        Whether to sort in ascending order.
+    page : int, default is 1
+        The page to return, starting at 1.
+    per_page : int, default is 50
+        The number of rows of each page.
+    with_links : bool, default is True
+        Whether or not the submission name should be clickable.
+    timestamp : datetime or None, default is None
+        If not None, the leaderboard as it was at this point in time is
+        reconstructed from the snapshots, see :func:`get_leaderboard_at`.
+
+    Returns
+    -------
+    leaderboard : dataframe or None
+        The rows of the page. None if the leaderboard has not been stored yet
+        or, at a point in time, if it was empty.
+    n_rows : int
+        The total number of rows of the leaderboard, once filtered by user.
+
+    Notes
+    -----
+    The leaderboard is decoded, and sorted by each requested column, once
+    per update and process: the following pages are sliced from the cached
+    dataframes. Filtering the rows of a user still scans all the rows of the
+    leaderboard. A leaderboard at a point in time is reconstructed and sorted
+    for each request.
+    """
+    if page < 1 or per_page < 1:
+        raise ValueError('The page and the number of rows per page should be '
+                         'positive. Got page={} and per_page={} instead.'
+                         .format(page, per_page))
+    if timestamp is not None:
+        df = get_leaderboard_at(session, event_name, timestamp,
+                                leaderboard_type, with_links)
+        if df is None:
+            return None, 0
+        columns = df.columns.tolist()
+        data = _to_columnar(df)
+        frames = {None: pd.DataFrame(data, columns=list(data))}
     else:
-        # make some extra filtering
-        submissions = [sub for sub in submissions if sub.is_public_leaderboard]
-        if not submissions:
-            return None
-        competition_type = ('public' if 'public' in leaderboard_type
-                            else 'private')
-        df = _compute_competition_leaderboard(
-            session, submissions, competition_type, event_name
-        )
+        columns, frames = _get_leaderboard_frames(session, event_name,
+                                                  leaderboard_type)
+        if columns is None:
+            return None, 0
+    if sort_by is not None and sort_by not in columns:
+        raise ValueError('The leaderboard cannot be sorted by "{}". Choose '
+                         'one of the columns {}.'.format(sort_by, columns))
 
-    df_html = df.to_html(escape=False, index=False, max_cols=None,
-                         max_rows=None, justify='left')
-    df_html = '<thead> {} </tbody>'.format(
-        df_html.split('<thead>')[1].split('</tbody>')[0]
+    sort_key = None if sort_by is None else (sort_by, ascending)
+    df = frames.get(sort_key)
+    if df is None:
+        # the sort is stable: filtering the rows of a user afterwards gives
+        # the same order as sorting them
+        df = frames[None].sort_values(sort_by, ascending=ascending,
+                                      kind='mergesort', na_position='last')
+        frames[sort_key] = df
+    if user_name is not None and 'team' in df:
+        df = df[df['team'] == user_name]
+    n_rows = len(df)
+    df = df.iloc[(page - 1) * per_page:page * per_page]
+    if with_links and 'submission link' in df:
+        df = df.assign(submission=df['submission link'])
+    return df[columns].reset_index(drop=True), n_rows
+
+
+def update_leaderboard_entries(session, event_name, submission_ids=None):
+    """Update the entries materializing the leaderboard of an event.
+
+    The scored submissions have an entry for each score of the event. See
+    :class:`ramp_database.model.LeaderboardEntry`.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The event name.
+    submission_ids : None or list of int, default is None
+        The submissions whose entries are computed again, e.g. once they have
+        been scored. If None, the entries of the submissions which entered or
+        left the leaderboard are added or removed and the entries of the
+        submissions which entered or left the competition are updated.
+    """
+    event = session.query(Event).filter_by(name=event_name).one()
+    # the rows of the scored submissions are shared with the leaderboards
+    state = _get_leaderboard_state(session, event)
+    signatures = state.signatures
+    if submission_ids is None:
+        entries = dict(session.query(LeaderboardEntry.submission_id,
+                                     LeaderboardEntry.is_in_competition)
+                              .filter(LeaderboardEntry.event_id == event.id))
+        submission_ids = [id_ for id_, signature in signatures.items()
+                          if entries.get(id_) != signature.is_in_competition]
+        submission_ids += [id_ for id_ in entries if id_ not in signatures]
+    if not submission_ids:
+        return
+
+    (session.query(LeaderboardEntry)
+            .filter(LeaderboardEntry.submission_id.in_(submission_ids))
+            .delete(synchronize_session=False))
+    scored_ids = [id_ for id_ in submission_ids if id_ in signatures]
+    if scored_ids:
+        submissions = (session.query(Submission.id,
+                                     Submission.event_team_id,
+                                     Submission.is_in_competition,
+                                     Submission.submission_timestamp)
+                              .filter(Submission.id.in_(scored_ids))
+                              .all())
+        columns = {'train_time': 'train time [s]',
+                   'valid_time': 'validation time [s]',
+                   'test_time': 'test time [s]',
+                   'max_ram': 'max RAM [MB]'}
+        for event_score_type in event.score_types:
+            for stat, dataset in product(['bag', 'mean', 'std'],
+                                         ['public', 'private']):
+                columns[event_score_type.name, stat, dataset] = \
+                    '{} {} {}'.format(stat, dataset, event_score_type.name)
+        rows = state.rows.loc[scored_ids, list(columns.values())]
+        # the missing values are stored as NULL
+        rows = rows.astype(object).where(rows.notna(), None)
+        rows.columns = list(columns)
+        rows = rows.to_dict('index')
+        entries = []
+        for sub in submissions:
+            row = rows[sub.id]
+            for event_score_type in event.score_types:
+                entry = {
+                    '{}_{}_score'.format(stat, dataset):
+                        row[event_score_type.name, stat, dataset]
+                    for stat, dataset in product(['bag', 'mean', 'std'],
+                                                 ['public', 'private'])
+                }
+                entry.update(
+                    event_id=event.id,
+                    event_team_id=sub.event_team_id,
+                    submission_id=sub.id,
+                    event_score_type_id=event_score_type.id,
+                    is_in_competition=sub.is_in_competition,
+                    train_time=row['train_time'],
+                    valid_time=row['valid_time'],
+                    test_time=row['test_time'],
+                    max_ram=row['max_ram'],
+                    submission_timestamp=sub.submission_timestamp
+                )
+                entries.append(entry)
+        session.bulk_insert_mappings(LeaderboardEntry, entries)
+    session.commit()
+
+
+def _query_leaderboard_entries(session, event_name, score_name,
+                               leaderboard_type):
+    """Query the entries of an event for a score.
+
+    Returns
+    -------
+    query : :class:`sqlalchemy.orm.Query`
+        The query of the entries.
+    score : :class:`sqlalchemy.Column`
+        The score column.
+    is_lower_the_better : bool
+        Whether the lower scores are the best.
+    """
+    if leaderboard_type not in ['public', 'private']:
+        raise ValueError("The leaderboard type should be 'public' or "
+                         "'private'. Got '{}' instead."
+                         .format(leaderboard_type))
+    event = session.query(Event).filter_by(name=event_name).one()
+    event_score_type = (session.query(EventScoreType)
+                               .filter(EventScoreType.event_id == event.id)
+                               .filter(EventScoreType.name ==
+                                       (score_name or
+                                        event.official_score_name))
+                               .one())
+    score = getattr(LeaderboardEntry,
+                    'bag_{}_score'.format(leaderboard_type))
+    query = (session.query(LeaderboardEntry)
+                    .filter(LeaderboardEntry.event_id == event.id)
+                    .filter(LeaderboardEntry.event_score_type_id ==
+                            event_score_type.id))
+    return query, score, event_score_type.is_lower_the_better
+
+
+def _order_by_score(score, is_lower_the_better):
+    """Order from the best to the worst score, the missing scores last."""
+    order = score.asc() if is_lower_the_better else score.desc()
+    return order.nullslast()
+
+
+def get_top_entries(session, event_name, n=10, score_name=None,
+                    leaderboard_type='public'):
+    """Get the best entries of the leaderboard of an event.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The event name.
+    n : int, default is 10
+        The number of entries.
+    score_name : None or str, default is None
+        The score used to rank the submissions. If None, the official score
+        of the event is used.
+    leaderboard_type : {'public', 'private'}, default is 'public'
+        Whether to rank the submissions on the public or private set.
+
+    Returns
+    -------
+    entries : list of :class:`ramp_database.model.LeaderboardEntry`
+        The best entries, from the best to the worst.
+    """
+    query, score, is_lower_the_better = _query_leaderboard_entries(
+        session, event_name, score_name, leaderboard_type)
+    return (query.order_by(_order_by_score(score, is_lower_the_better),
+                           LeaderboardEntry.submission_id)
+                 .limit(n)
+                 .all())
+
+
+def get_best_entry_per_team(session, event_name, score_name=None,
+                            leaderboard_type='public'):
+    """Get the best entry of each team in competition.
+
+    The ties are broken by taking the earliest submission.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The event name.
+    score_name : None or str, default is None
+        The score used to rank the submissions. If None, the official score
+        of the event is used.
+    leaderboard_type : {'public', 'private'}, default is 'public'
+        Whether to rank the submissions on the public or private set.
+
+    Returns
+    -------
+    entries : list of :class:`ramp_database.model.LeaderboardEntry`
+        The best entry of each team, from the best to the worst.
+    """
+    query, score, is_lower_the_better = _query_leaderboard_entries(
+        session, event_name, score_name, leaderboard_type)
+    order = _order_by_score(score, is_lower_the_better)
+    team_rank = func.row_number().over(
+        partition_by=LeaderboardEntry.event_team_id,
+        order_by=[order, LeaderboardEntry.submission_timestamp,
+                  LeaderboardEntry.submission_id]
+    ).label('team_rank')
+    ranked = (query.filter(LeaderboardEntry.is_in_competition)
+                   .with_entities(LeaderboardEntry.id, team_rank)
+                   .subquery())
+    return (session.query(LeaderboardEntry)
+                   .join(ranked, ranked.c.id == LeaderboardEntry.id)
+                   .filter(ranked.c.team_rank == 1)
+                   .order_by(order, LeaderboardEntry.submission_timestamp)
+                   .all())
+
+
+def get_submission_rank(session, submission_id, score_name=None,
+                        leaderboard_type='public'):
+    """Get the rank of a submission in the leaderboard of its event.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    submission_id : int
+        The id of the submission.
+    score_name : None or str, default is None
+        The score used to rank the submissions. If None, the official score
+        of the event is used.
+    leaderboard_type : {'public', 'private'}, default is 'public'
+        Whether to rank the submissions on the public or private set.
+
+    Returns
+    -------
+    rank : int or None
+        The rank of the submission, starting at 1, the submissions with the
+        same score sharing the same rank. None if the submission is not part
+        of the leaderboard.
+    """
+    event_name = (session.query(Event.name)
+                         .filter(Event.id == EventTeam.event_id)
+                         .filter(EventTeam.id == Submission.event_team_id)
+                         .filter(Submission.id == submission_id)
+                         .scalar())
+    if event_name is None:
+        return None
+    query, score, is_lower_the_better = _query_leaderboard_entries(
+        session, event_name, score_name, leaderboard_type)
+    value = (query.filter(LeaderboardEntry.submission_id == submission_id)
+                  .with_entities(score)
+                  .one_or_none())
+    if value is None:
+        return None
+    value, = value
+    if value is None:
+        is_better = score.isnot(None)
+    elif is_lower_the_better:
+        is_better = score < value
+    else:
+        is_better = score > value
+    return query.filter(is_better).count() + 1
+
+
+def _get_snapshot_rows(session, event, timestamp=None):
+    """Get the latest snapshot row of each submission of an event.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event : :class:`ramp_database.model.Event`
+        The event.
+    timestamp : datetime or None, default is None
+        Only the snapshots taken at or before this time are considered. If
+        None, all the snapshots are considered.
+
+    Returns
+    -------
+    rows : dict
+        The data and whether the submission is in competition, keyed by
+        submission id, of the submissions in the leaderboard.
+    """
+    latest = (session.query(LeaderboardSnapshotRow.submission_id,
+                            func.max(LeaderboardSnapshotRow.snapshot_id)
+                                .label('snapshot_id'))
+                     .filter(LeaderboardSnapshotRow.event_id == event.id))
+    if timestamp is not None:
+        latest = (latest.join(LeaderboardSnapshotRow.snapshot)
+                        .filter(LeaderboardSnapshot.timestamp <= timestamp))
+    latest = latest.group_by(LeaderboardSnapshotRow.submission_id).subquery()
+    query = (session.query(LeaderboardSnapshotRow.submission_id,
+                           LeaderboardSnapshotRow.data,
+                           LeaderboardSnapshotRow.is_in_competition)
+                    .join(latest, and_(
+                        LeaderboardSnapshotRow.submission_id ==
+                        latest.c.submission_id,
+                        LeaderboardSnapshotRow.snapshot_id ==
+                        latest.c.snapshot_id))
+                    .filter(LeaderboardSnapshotRow.event_id == event.id)
+                    .filter(LeaderboardSnapshotRow.data.isnot(None)))
+    return {submission_id: (data, is_in_competition)
+            for submission_id, data, is_in_competition in query}
+
+
+def take_leaderboard_snapshot(session, event_name):
+    """Take a snapshot of the leaderboard of an event.
+
+    Only the rows of the submissions which were added, changed, or removed
+    since the previous snapshot are stored. See
+    :class:`ramp_database.model.LeaderboardSnapshot`. The leaderboards at the
+    time of the snapshots are given by :func:`get_leaderboard_at`.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The event name.
+
+    Returns
+    -------
+    snapshot : :class:`ramp_database.model.LeaderboardSnapshot` or None
+        The snapshot. None if the leaderboard did not change since the
+        previous snapshot.
+    """
+    event = session.query(Event).filter_by(name=event_name).one()
+    state = _get_leaderboard_state(session, event)
+    previous = _get_snapshot_rows(session, event)
+
+    current = {}
+    if state.rows is not None:
+        data = _to_columnar(state.rows)
+        for idx, submission_id in enumerate(state.rows.index):
+            current[submission_id] = (
+                {column: values[idx] for column, values in data.items()},
+                state.signatures[submission_id].is_in_competition
+            )
+    changes = [
+        {'submission_id': submission_id, 'data': row_data,
+         'is_in_competition': is_in_competition}
+        for submission_id, (row_data, is_in_competition) in current.items()
+        if previous.get(submission_id) != (row_data, is_in_competition)
+    ]
+    changes += [
+        {'submission_id': submission_id, 'data': None,
+         'is_in_competition': False}
+        for submission_id in previous if submission_id not in current
+    ]
+    if not changes:
+        return None
+
+    snapshot = LeaderboardSnapshot(event=event,
+                                   timestamp=datetime.datetime.utcnow(),
+                                   n_changes=len(changes))
+    session.add(snapshot)
+    session.flush()
+    for change in changes:
+        change.update(snapshot_id=snapshot.id, event_id=event.id)
+    session.bulk_insert_mappings(LeaderboardSnapshotRow, changes)
+    session.commit()
+    return snapshot
+
+
+def get_leaderboard_at(session, event_name, timestamp,
+                       leaderboard_type='public', with_links=True):
+    """Get a leaderboard of an event as it was at some point in time.
+
+    The leaderboard is reconstructed from the latest row of each submission
+    recorded by the snapshots taken until then, see
+    :func:`take_leaderboard_snapshot`, without querying the scores.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The event name.
+    timestamp : datetime
+        The point in time, in UTC.
+    leaderboard_type : {'public', 'private', 'public competition', \
+'private competition'}, default is 'public'
+        The type of leaderboard.
+    with_links : bool, default is True
+        Whether or not the submission name should be clickable in the public
+        and private leaderboards.
+
+    Returns
+    -------
+    leaderboard : dataframe or None
+        The leaderboard in a dataframe format. None if the leaderboard was
+        empty.
+    """
+    if leaderboard_type not in ['public', 'private', 'public competition',
+                                'private competition']:
+        raise ValueError('The leaderboard "{}" is not recorded by the '
+                         'snapshots.'.format(leaderboard_type))
+    event = session.query(Event).filter_by(name=event_name).one()
+    snapshot_rows = _get_snapshot_rows(session, event, timestamp)
+    if not snapshot_rows:
+        return None
+    submission_ids = sorted(snapshot_rows)
+    rows = pd.DataFrame.from_records(
+        [snapshot_rows[id_][0] for id_ in submission_ids],
+        index=pd.Index(submission_ids, name='submission_id')
     )
-    return df_html
+    rows['submitted at (UTC)'] = pd.to_datetime(rows['submitted at (UTC)'])
+
+    if leaderboard_type in ['public', 'private']:
+        return _format_leaderboard(session, event, rows, leaderboard_type,
+                                   with_links=with_links)
+    in_competition = [id_ for id_ in submission_ids
+                      if snapshot_rows[id_][1]]
+    best_ids = _select_best_submissions(
+        rows.loc[in_competition], event.official_score_name,
+        event.get_official_score_type(session).is_lower_the_better
+    )
+    if not best_ids:
+        return None
+    ranked = _rank_competition_leaderboard(session, event,
+                                           rows.loc[sorted(best_ids)])
+    return _format_competition_leaderboard(
+        event, ranked, leaderboard_type.split()[0])
 
 
 def update_leaderboards(session, event_name, new_only=False):
@@ -366,32 +1464,94 @@ def update_leaderboards(session, event_name, new_only=False):
     new_only : bool, default is False
         Whether or not to update the whole leaderboards or only the new
         submissions. You can turn this option to True when adding a new
-        submission in the database.
+        submission in the database. Updating the whole leaderboards also
+        updates the leaderboard entries, see
+        :func:`update_leaderboard_entries`, and takes a snapshot of the
+        changes of the leaderboard, see :func:`take_leaderboard_snapshot`.
     """
     event = session.query(Event).filter_by(name=event_name).one()
+    variants = [('new', True)]
     if not new_only:
-        event.private_leaderboard_html = get_leaderboard(
-            session, 'private', event_name
-        )
-        event.public_leaderboard_html_with_links = get_leaderboard(
-            session, 'public', event_name
-        )
-        event.public_leaderboard_html_no_links = get_leaderboard(
-            session, 'public', event_name, with_links=False
-        )
-        event.failed_leaderboard_html = get_leaderboard(
-            session, 'failed', event_name
-        )
-        event.public_competition_leaderboard_html = get_leaderboard(
-            session, 'public competition', event_name
-        )
-        event.private_competition_leaderboard_html = get_leaderboard(
-            session, 'private competition', event_name
-        )
-    event.new_leaderboard_html = get_leaderboard(
-        session, 'new', event_name
+        update_leaderboard_entries(session, event_name)
+        variants += [('private', True), ('public', True), ('public', False),
+                     ('failed', True), ('public competition', True),
+                     ('private competition', True),
+                     # the public and private leaderboards are stored
+                     # without links
+                     ('private', False)]
+    leaderboards = _compute_leaderboard_frames(session, event_name, variants)
+    _store_leaderboards(session, event, leaderboards)
+    leaderboards = {key: None if df is None else leaderboard_to_html(df)
+                    for key, df in leaderboards.items()}
+    if not new_only:
+        event.private_leaderboard_html = \
+            leaderboards[None, 'private', True]
+        event.public_leaderboard_html_with_links = \
+            leaderboards[None, 'public', True]
+        event.public_leaderboard_html_no_links = \
+            leaderboards[None, 'public', False]
+        event.failed_leaderboard_html = \
+            leaderboards[None, 'failed', True]
+        event.public_competition_leaderboard_html = \
+            leaderboards[None, 'public competition', True]
+        event.private_competition_leaderboard_html = \
+            leaderboards[None, 'private competition', True]
+    event.new_leaderboard_html = leaderboards[None, 'new', True]
+    session.commit()
+    if not new_only:
+        take_leaderboard_snapshot(session, event_name)
+
+
+# the fingerprints of the leaderboards of the teams stored in each database
+# and event, see _render_leaderboards
+_TEAM_LEADERBOARD_FINGERPRINTS = {}
+
+
+def _update_event_team_leaderboards(session, event_name, event_teams,
+                                    new_only):
+    """Update the leaderboards of some teams of an event.
+
+    The leaderboards of all the teams are rendered from the same data and
+    only the leaderboards reporting changed submissions are rendered and
+    written back, in a single bulk update.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The event name.
+    event_teams : list of tuple
+        The ids of the event teams to update with the name of their team.
+    new_only : bool
+        Whether or not to update the whole leaderboards or only the new
+        submissions.
+    """
+    variants = [('new', True)]
+    if not new_only:
+        variants += [('public', True), ('failed', True)]
+    map_type_to_column = {'new': 'new_leaderboard_html',
+                          'public': 'leaderboard_html',
+                          'failed': 'failed_leaderboard_html'}
+    key = (str(session.get_bind().engine.url), event_name)
+    with _LEADERBOARD_STATES_LOCK:
+        fingerprints = dict(_TEAM_LEADERBOARD_FINGERPRINTS.get(key, {}))
+    leaderboards = _render_leaderboards(
+        session, event_name, variants,
+        [user_name for _, user_name in event_teams], fingerprints
     )
+    event_team_ids = {user_name: event_team_id
+                      for event_team_id, user_name in event_teams}
+    mappings = {}
+    for (user_name, leaderboard_type, _), html in leaderboards.items():
+        event_team_id = event_team_ids[user_name]
+        mapping = mappings.setdefault(event_team_id, {'id': event_team_id})
+        mapping[map_type_to_column[leaderboard_type]] = html
+    session.bulk_update_mappings(EventTeam, list(mappings.values()))
     session.commit()
+    with _LEADERBOARD_STATES_LOCK:
+        _TEAM_LEADERBOARD_FINGERPRINTS.setdefault(key, {}).update(
+            fingerprints)
 
 
 def update_user_leaderboards(session, event_name, user_name,
@@ -412,17 +1572,8 @@ def update_user_leaderboards(session, event_name, user_name,
         submission in the database.
     """
     event_team = get_event_team_by_name(session, event_name, user_name)
-    if not new_only:
-        event_team.leaderboard_html = get_leaderboard(
-            session, 'public', event_name, user_name
-        )
-        event_team.failed_leaderboard_html = get_leaderboard(
-            session, 'failed', event_name, user_name
-        )
-    event_team.new_leaderboard_html = get_leaderboard(
-        session, 'new', event_name, user_name
-    )
-    session.commit()
+    _update_event_team_leaderboards(session, event_name,
+                                    [(event_team.id, user_name)], new_only)
 
 
 def update_all_user_leaderboards(session, event_name, new_only=False):
@@ -439,18 +1590,241 @@ def update_all_user_leaderboards(session, event_name, new_only=False):
         submissions. You can turn this option to True when adding a new
         submission in the database.
     """
+    event_teams = (session.query(EventTeam.id, Team.name)
+                          .filter(Team.id == EventTeam.team_id)
+                          .filter(EventTeam.event_id == Event.id)
+                          .filter(Event.name == event_name)
+                          .all())
+    _update_event_team_leaderboards(session, event_name, event_teams,
+                                    new_only)
+
+
+# the formats of the leaderboard exports with their media type
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+def _get_export_columns(event):
+    """Get the columns of the leaderboard export of an event with their
+    type."""
+    columns = [('team', 'string'), ('submission', 'string'),
+               ('submission ID', 'int'), ('in competition', 'bool'),
+               ('submitted at (UTC)', 'timestamp'), ('fold', 'int'),
+               ('train time [s]', 'float'), ('validation time [s]', 'float'),
+               ('test time [s]', 'float'), ('max RAM [MB]', 'float')]
+    columns += [('{} {}'.format(step, score_type.name), 'float')
+                for score_type in sorted(event.score_types,
+                                         key=lambda x: x.id)
+                for step in ['train', 'valid', 'test']]
+    return columns
+
+
+def iter_leaderboard_export(session, event_name, chunk_size=10000):
+    """Iterate over the full leaderboard of an event by chunks.
+
+    The leaderboard reports the scores, times, and memory of each fold of
+    the scored submissions. The rows are read through a server-side cursor
+    such that only a chunk is held in memory at once.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The event name.
+    chunk_size : int, default is 10000
+        The number of rows of each chunk.
+
+    Yields
+    ------
+    leaderboard : dataframe
+        The rows of a chunk, one per submission and fold, ordered by
+        submission and fold. A single empty chunk is yielded if there are no
+        scored submissions.
+    """
     event = session.query(Event).filter_by(name=event_name).one()
-    event_teams = session.query(EventTeam).filter_by(event=event).all()
-    for event_team in event_teams:
-        user_name = event_team.team.name
-        if not new_only:
-            event_team.leaderboard_html = get_leaderboard(
-                session, 'public', event_name, user_name
-            )
-            event_team.failed_leaderboard_html = get_leaderboard(
-                session, 'failed', event_name, user_name
-            )
-        event_team.new_leaderboard_html = get_leaderboard(
-            session, 'new', event_name, user_name
-        )
-    session.commit()
+    columns = [column for column, _ in _get_export_columns(event)]
+    fold_index = {cv_fold.id: idx for idx, cv_fold in
+                  enumerate(sorted(event.cv_folds, key=lambda x: x.id))}
+    query = (session.query(Submission.id, Team.name, Submission.name,
+                           Submission.is_in_competition,
+                           Submission.submission_timestamp,
+                           Submission.max_ram,
+                           SubmissionOnCVFold.cv_fold_id,
+                           SubmissionOnCVFold.train_time,
+                           SubmissionOnCVFold.valid_time,
+                           SubmissionOnCVFold.test_time,
+                           EventScoreType.name,
+                           SubmissionScoreOnCVFold.train_score,
+                           SubmissionScoreOnCVFold.valid_score,
+                           SubmissionScoreOnCVFold.test_score)
+                    .join(SubmissionOnCVFold,
+                          SubmissionOnCVFold.submission_id == Submission.id)
+                    .join(SubmissionScoreOnCVFold,
+                          SubmissionScoreOnCVFold.submission_on_cv_fold_id ==
+                          SubmissionOnCVFold.id)
+                    .join(SubmissionScore,
+                          SubmissionScore.id ==
+                          SubmissionScoreOnCVFold.submission_score_id)
+                    .join(EventScoreType,
+                          EventScoreType.id ==
+                          SubmissionScore.event_score_type_id)
+                    .filter(EventTeam.id == Submission.event_team_id)
+                    .filter(Team.id == EventTeam.team_id)
+                    .filter(EventTeam.event_id == event.id)
+                    .filter(Submission.is_public_leaderboard)
+                    .order_by(Submission.id, SubmissionOnCVFold.cv_fold_id,
+                              EventScoreType.id)
+                    .yield_per(chunk_size))
+
+    # the scores of a fold are spread over several rows which are gathered
+    # in a single row of the export
+    records, record, key = [], None, None
+    for (submission_id, team_name, submission_name, is_in_competition,
+         submission_timestamp, max_ram, cv_fold_id, train_time, valid_time,
+         test_time, score_name, train_score, valid_score,
+         test_score) in query:
+        if (submission_id, cv_fold_id) != key:
+            if len(records) >= chunk_size:
+                yield pd.DataFrame(records, columns=columns)
+                records = []
+            key = (submission_id, cv_fold_id)
+            record = {
+                'team': team_name, 'submission': submission_name,
+                'submission ID': submission_id,
+                'in competition': is_in_competition,
+                'submitted at (UTC)': submission_timestamp,
+                'fold': fold_index[cv_fold_id],
+                'train time [s]': train_time,
+                'validation time [s]': valid_time,
+                'test time [s]': test_time, 'max RAM [MB]': max_ram
+            }
+            records.append(record)
+        record['train ' + score_name] = train_score
+        record['valid ' + score_name] = valid_score
+        record['test ' + score_name] = test_score
+    if records or key is None:
+        yield pd.DataFrame(records, columns=columns)
+
+
+class _DrainBuffer:
+    """Write-only file object whose content is taken out once written."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _get_arrow_schema(event):
+    """Get the Arrow schema of the leaderboard export of an event."""
+    import pyarrow as pa
+    types = {'string': pa.string(), 'int': pa.int64(), 'bool': pa.bool_(),
+             'timestamp': pa.timestamp('us'), 'float': pa.float64()}
+    return pa.schema([(column, types[column_type])
+                      for column, column_type in _get_export_columns(event)])
+
+
+def stream_leaderboard_export(session, event_name, export_format='csv',
+                              chunk_size=10000):
+    """Stream the full leaderboard of an event in a file format.
+
+    The Parquet and Arrow formats require ``pyarrow``. See
+    :func:`iter_leaderboard_export` for the content of the leaderboard.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The event name.
+    export_format : {'csv', 'parquet', 'arrow'}, default is 'csv'
+        The file format: CSV, Parquet (a row group per chunk) or Arrow IPC
+        stream.
+    chunk_size : int, default is 10000
+        The number of rows read and written at once.
+
+    Returns
+    -------
+    stream : iterator of bytes
+        The successive parts of the file.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError("The export format should be one of {}. Got '{}' "
+                         "instead.".format(sorted(EXPORT_FORMATS),
+                                           export_format))
+    chunks = iter_leaderboard_export(session, event_name,
+                                     chunk_size=chunk_size)
+    if export_format == 'csv':
+        return _stream_csv(chunks)
+    try:
+        import pyarrow  # noqa
+    except ImportError:
+        raise ImportError("pyarrow is required to export a leaderboard in "
+                          "the '{}' format.".format(export_format))
+    event = session.query(Event).filter_by(name=event_name).one()
+    return _stream_arrow(chunks, _get_arrow_schema(event), export_format)
+
+
+def _stream_csv(chunks):
+    """Write the chunks of a leaderboard in CSV."""
+    for idx, df in enumerate(chunks):
+        yield df.to_csv(index=False, header=idx == 0).encode('utf-8')
+
+
+def _stream_arrow(chunks, schema, export_format):
+    """Write the chunks of a leaderboard in Parquet or Arrow IPC."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _DrainBuffer()
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    for df in chunks:
+        writer.write_table(pa.Table.from_pandas(df, schema=schema,
+                                                preserve_index=False))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export_leaderboard(session, event_name, path, export_format='csv',
+                       chunk_size=10000):
+    """Export the full leaderboard of an event in a file.
+
+    See :func:`stream_leaderboard_export`.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    event_name : str
+        The event name.
+    path : str
+        The path of the file.
+    export_format : {'csv', 'parquet', 'arrow'}, default is 'csv'
+        The file format.
+    chunk_size : int, default is 10000
+        The number of rows read and written at once.
+    """
+    stream = stream_leaderboard_export(session, event_name, export_format,
+                                       chunk_size=chunk_size)
+    with open(path, 'wb') as f:
+        for data in stream:
+            f.write(data)
@@ -2,12 +2,13 @@ from collections import defaultdict
 import datetime
 import logging
 import os
-import shutil
 
 import numpy as np
 import pandas as pd
 
-from sqlalchemy.orm import defer
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
 
 from ..exceptions import DuplicateSubmissionError
 from ..exceptions import MissingExtensionError
@@ -16,17 +17,25 @@ from ..exceptions import TooEarlySubmissionError
 from ..exceptions import UnknownStateError
 
 from ..model.submission import submission_states
+from ..model import Event
+from ..model import EventTeam
 from ..model import Submission
 from ..model import SubmissionFile
 from ..model import SubmissionFileTypeExtension
 from ..model import SubmissionOnCVFold
+from ..model import SubmissionScoreOnCVFold
 from ..model import SubmissionSimilarity
+from ..model import Team
 from ..model import UserInteraction
 
+from ._file_store import get_file_store_dir
+from ._file_store import remove_files
+from ._file_store import store_file
 from ._query import select_event_by_name
 from ._query import select_event_team_by_name
 from ._query import select_extension_by_name
-from ._query import select_submissions_by_state
+from ._query import select_submission_files_by_ids
+from ._query import select_submission_ids_by_state
 from ._query import select_submission_by_id
 from ._query import select_submission_by_name
 from ._query import select_submission_file_type_by_name
@@ -38,8 +47,42 @@ logger = logging.getLogger('RAMP-DATABASE')
 
 # Add functions: add information to the database
 # TODO: move the queries in "_query"
+def _add_submission_on_cv_folds(session, submission, cv_folds):
+    """Add the CV folds of a new submission and their scores in a few
+    statements."""
+    table = SubmissionOnCVFold.__table__
+    session.execute(
+        table.insert()
+             .values([{'submission_id': submission.id,
+                       'cv_fold_id': cv_fold.id,
+                       'full_train_y_pred': None,
+                       'test_y_pred': None} for cv_fold in cv_folds])
+    )
+    # RETURNING is not supported by all the dialects, e.g. SQLite: the ids
+    # are read back instead
+    submission_on_cv_folds = session.execute(
+        select([table.c.id])
+        .where(table.c.submission_id == submission.id)
+        .order_by(table.c.cv_fold_id)
+    ).fetchall()
+    scores = [
+        {'submission_on_cv_fold_id': submission_on_cv_fold_id,
+         'submission_score_id': score.id,
+         'train_score': score.event_score_type.worst,
+         'valid_score': score.event_score_type.worst,
+         'test_score': score.event_score_type.worst}
+        for submission_on_cv_fold_id, in submission_on_cv_folds
+        for score in submission.scores
+    ]
+    if scores:
+        session.execute(
+            SubmissionScoreOnCVFold.__table__.insert().values(scores)
+        )
+    session.expire(submission, ['on_cv_folds'])
+
+
 def add_submission(session, event_name, team_name, submission_name,
-                   submission_path):
+                   submission_path, refresh_leaderboards=True):
     """Create a submission in the database and returns an handle.
 
     Parameters
@@ -56,6 +99,13 @@ def add_submission(session, event_name, team_name, submission_name,
         The path of the files associated to the current submission. It will
         corresponds to the key `ramp_kit_subissions_dir` of the dictionary
         created with :func:`ramp_utils.generate_ramp_config`.
+    refresh_leaderboards : bool, default=True
+        Whether to update the leaderboards of the new submissions. When
+        adding several submissions, the leaderboards can be updated once
+        with :func:`ramp_database.tools.leaderboard.update_leaderboards`
+        after adding all of them. The submissions made from the frontend do
+        not refresh the leaderboards: the dispatcher refreshes them when it
+        fetches the new submissions.
 
     Returns
     -------
@@ -71,12 +121,13 @@ def add_submission(session, event_name, team_name, submission_name,
                          .first())
 
     # create a new submission
-    if submission is None:
-        all_submissions = (session.query(Submission)
+    is_new_submission = submission is None
+    if is_new_submission:
+        last_submission = (session.query(Submission)
                                   .filter(Submission.event_team == event_team)
-                                  .order_by(Submission.submission_timestamp)
-                                  .all())
-        last_submission = None if not all_submissions else all_submissions[-1]
+                                  .order_by(
+                                      Submission.submission_timestamp.desc())
+                                  .first())
         # check for non-admin user if they wait enough to make a new submission
         if (team.admin.access_level != 'admin' and last_submission is not None
                 and last_submission.is_not_sandbox):
@@ -94,11 +145,13 @@ def add_submission(session, event_name, team_name, submission_name,
         submission = Submission(
             name=submission_name, event_team=event_team, session=session
         )
-        for cv_fold in event.cv_folds:
-            submission_on_cv_fold = SubmissionOnCVFold(submission=submission,
-                                                       cv_fold=cv_fold)
-            session.add(submission_on_cv_fold)
         session.add(submission)
+        session.flush()
+        if event.cv_folds:
+            _add_submission_on_cv_folds(session, submission, event.cv_folds)
+        # the sandbox submission of each team is not counted
+        if submission.is_not_sandbox:
+            event.n_submissions = Event.n_submissions + 1
 
     # the submission already exist
     else:
@@ -155,12 +208,13 @@ def add_submission(session, event_name, team_name, submission_name,
             )
 
         # check if it is a resubmission
-        submission_file = (session.query(SubmissionFile)
-                                  .filter(SubmissionFile.workflow_element ==
-                                          workflow_element)
-                                  .filter(SubmissionFile.submission ==
-                                          submission)
-                                  .one_or_none())
+        submission_file = None if is_new_submission else (
+            session.query(SubmissionFile)
+                   .filter(SubmissionFile.workflow_element ==
+                           workflow_element)
+                   .filter(SubmissionFile.submission == submission)
+                   .one_or_none()
+        )
         # TODO: handle if resubmitted file changed extension
         if submission_file is None:
             submission_file_type = select_submission_file_type_by_name(
@@ -178,7 +232,6 @@ def add_submission(session, event_name, team_name, submission_name,
                 submission_file_type_extension=type_extension
             )
             session.add(submission_file)
-            event.set_n_submissions()
 
     def is_editable(filename, workflow):
         """Whether or not the file format is editable on the frontend."""
@@ -187,23 +240,28 @@ def add_submission(session, event_name, team_name, submission_name,
                 return element.is_editable
         return True
 
-    # copy the submission file in the submission folder
+    # link the submission files from the file store into the submission
+    # folder: the files already stored are not copied again
+    store_dir = get_file_store_dir(event.path_ramp_submissions)
     if os.path.exists(submission.path):
-        shutil.rmtree(submission.path)
+        remove_files(store_dir, submission.path)
     os.makedirs(submission.path)
     for filename in submission.f_names:
         src = os.path.join(submission_path, filename)
         dst = os.path.join(submission.path, filename)
-        shutil.copy2(src=src, dst=dst)
+        store_file(store_dir, src, dst)
 
     # for remembering it in the sandbox view
     event_team.last_submission_name = submission_name
     session.commit()
 
-    from .leaderboard import update_leaderboards
-    from .leaderboard import update_user_leaderboards
-    update_leaderboards(session, event_name, new_only=True)
-    update_user_leaderboards(session, event_name, team.name, new_only=True)
+    # the sandbox submissions are not reported in the leaderboards
+    if refresh_leaderboards and submission.is_not_sandbox:
+        from .leaderboard import update_leaderboards
+        from .leaderboard import update_user_leaderboards
+        update_leaderboards(session, event_name, new_only=True)
+        update_user_leaderboards(session, event_name, team.name,
+                                 new_only=True)
     return submission
 
 
@@ -238,7 +296,7 @@ def add_submission_similarity(session, credit_type, user, source_submission,
 
 
 # Getter functions: get information from the database
-def get_submissions(session, event_name, state='new'):
+def get_submissions(session, event_name, state='new', lightweight=False):
     """Get information about submissions from an event with a specific state
     optionally.
 
@@ -255,6 +313,9 @@ def get_submissions(session, event_name, state='new'):
         The state of the requested submissions. If None, the state of the
         submissions will be ignored and all submissions for an event will be
         fetched.
+    lightweight : bool, default=False
+        Whether to only get the id and the name of the submissions, without
+        querying their files.
 
     Returns
     -------
@@ -264,7 +325,7 @@ def get_submissions(session, event_name, state='new'):
         * an integer containing the id of the submission;
         * a string with the name of the submission in the database;
         * a list of string representing the file associated with the
-          submission.
+          submission. Not reported when ``lightweight=True``.
 
     See also
     --------
@@ -274,16 +335,27 @@ def get_submissions(session, event_name, state='new'):
     if state is not None and state not in STATES:
         raise UnknownStateError("Unrecognized state : '{}'".format(state))
 
-    submissions = select_submissions_by_state(session, event_name, state)
+    submissions = select_submission_ids_by_state(session, event_name, state)
 
     if not submissions:
         return []
 
-    submission_id = [sub.id for sub in submissions]
-    submission_files = [sub.files for sub in submissions]
-    submission_basename = [sub.basename for sub in submissions]
-    filenames = [[f.path for f in files] for files in submission_files]
-    return list(zip(submission_id, submission_basename, filenames))
+    basenames = {sub_id: Submission.get_basename(sub_id)
+                 for sub_id, _ in submissions}
+    if lightweight:
+        return [(sub_id, basenames[sub_id]) for sub_id, _ in submissions]
+
+    # the files are queried by id rather than by state: the state of the
+    # submissions can change in between, e.g. when fetched by the dispatcher
+    filenames = defaultdict(list)
+    paths = dict(submissions)
+    for sub_id, file_type, extension in select_submission_files_by_ids(
+            session, list(paths)):
+        filenames[sub_id].append(os.path.join(
+            paths[sub_id], basenames[sub_id], file_type + '.' + extension
+        ))
+    return [(sub_id, basenames[sub_id], filenames[sub_id])
+            for sub_id, _ in submissions]
 
 
 def get_submission_by_id(session, submission_id):
@@ -391,7 +463,8 @@ def get_predictions(session, submission_id):
     Returns
     -------
     predictions : pd.DataFrame
-        A pandas dataframe containing the predictions on each fold.
+        A pandas dataframe containing the predictions on each fold. The
+        predictions stored on disk are read-only memory-mapped arrays.
     """
     results = defaultdict(list)
     all_cv_folds = (session.query(SubmissionOnCVFold)
@@ -423,8 +496,6 @@ def get_time(session, submission_id):
     results = defaultdict(list)
     all_cv_folds = (session.query(SubmissionOnCVFold)
                            .filter_by(submission_id=submission_id)
-                           .options(defer("full_train_y_pred"),
-                                    defer("test_y_pred"))
                            .all())
     all_cv_folds = sorted(all_cv_folds, key=lambda x: x.id)
     for fold_id, cv_fold in enumerate(all_cv_folds):
@@ -453,8 +524,6 @@ def get_scores(session, submission_id):
     index = []
     all_cv_folds = (session.query(SubmissionOnCVFold)
                            .filter_by(submission_id=submission_id)
-                           .options(defer("full_train_y_pred"),
-                                    defer("test_y_pred"))
                            .all())
     all_cv_folds = sorted(all_cv_folds, key=lambda x: x.id)
     for fold_id, cv_fold in enumerate(all_cv_folds):
@@ -519,6 +588,28 @@ def get_submission_max_ram(session, submission_id):
     return submission.max_ram
 
 
+def get_submission_memory_profile(session, submission_id):
+    """Get the memory profile of a submission during processing.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    submission_id : int
+        The id of the submission.
+
+    Returns
+    -------
+    memory_profile : ndarray, shape (2, n_points) or None
+        The time in seconds (first row) and the memory in MB (second row)
+        used by the submission. None if the memory was not profiled.
+    """
+    submission = select_submission_by_id(session, submission_id)
+    if not submission.has_memory_profile:
+        return None
+    return submission.memory_profile
+
+
 def get_submission_error_msg(session, submission_id):
     """Get the error message after that a submission failed to be processed.
 
@@ -574,24 +665,30 @@ def get_source_submissions(session, submission_id):
         List of the submissions connected with the submission to be trained.
     """
     submission = select_submission_by_id(session, submission_id)
-    submissions = (session.query(Submission)
-                          .filter_by(event_team=submission.event_team)
-                          .all())
-    # there is for the moment a single admin
-    users = [submission.team.admin]
-    for user in users:
-        user_interactions = \
-            (session.query(UserInteraction)
-                    .filter_by(user=user, interaction='looking at submission')
-                    .all())
-        submissions += [user_interaction.submission
-                        for user_interaction in user_interactions
-                        if user_interaction.event == submission.event]
-    submissions = list(set(submissions))
-    submissions = [s for s in submissions
-                   if s.submission_timestamp < submission.submission_timestamp]
-    submissions.sort(key=lambda x: x.submission_timestamp, reverse=True)
-    return submissions
+    # the submissions at which the admin of the team, for the moment the only
+    # user of a team, looked during the event
+    source_event_team = aliased(EventTeam)
+    looked_at = (session.query(UserInteraction.submission_id)
+                        .join(EventTeam,
+                              EventTeam.id == UserInteraction.event_team_id)
+                        .join(source_event_team,
+                              source_event_team.event_id == EventTeam.event_id)
+                        .join(Team, Team.id == source_event_team.team_id)
+                        .filter(source_event_team.id ==
+                                submission.event_team_id)
+                        .filter(UserInteraction.user_id == Team.admin_id)
+                        .filter(UserInteraction.interaction ==
+                                'looking at submission')
+                        .distinct())
+    return (session.query(Submission)
+                   .filter(or_(Submission.event_team_id ==
+                               submission.event_team_id,
+                               Submission.id.in_(looked_at.subquery())))
+                   .filter(Submission.submission_timestamp <
+                           submission.submission_timestamp)
+                   .order_by(Submission.submission_timestamp.desc(),
+                             Submission.id.desc())
+                   .all())
 
 
 # Setter functions: set information in the database
@@ -618,42 +715,164 @@ def set_submission_state(session, submission_id, state):
         * 'testing_error': testing finished abnormally;
         * 'training': training is running normally;
         * 'scored': submission scored.
+
+        The leaderboard entries of the submission are updated when it enters
+        or leaves the 'scored' state.
     """
     if state not in STATES:
         raise UnknownStateError("Unrecognized state : '{}'".format(state))
 
     submission = select_submission_by_id(session, submission_id)
+    was_scored = submission.state == 'scored'
     submission.set_state(state, session)
     session.commit()
+    if was_scored or state == 'scored':
+        from .leaderboard import update_leaderboard_entries
+        update_leaderboard_entries(session, submission.event.name,
+                                   [submission_id])
+
+
+def set_submission_states(session, submission_ids, state):
+    """Set the state of several submissions at once.
+
+    The submissions and their CV folds are updated by two statements in a
+    single transaction, with the same side effects as
+    :func:`set_submission_state`.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    submission_ids : list of int
+        The ids of the submissions.
+    state : str
+        The state of the submissions. See :func:`set_submission_state` for
+        the possible states.
+
+    Returns
+    -------
+    n_submissions : int
+        The number of submissions updated.
+    """
+    if state not in STATES:
+        raise UnknownStateError("Unrecognized state : '{}'".format(state))
+    submission_ids = list(submission_ids)
+    if not submission_ids:
+        return 0
+
+    # the leaderboard entries are updated for the submissions entering or
+    # leaving the 'scored' state
+    submissions = (session.query(Submission.id, Submission.state, Event.name)
+                          .filter(Submission.id.in_(submission_ids))
+                          .filter(Submission.event_team_id == EventTeam.id)
+                          .filter(EventTeam.event_id == Event.id)
+                          .all())
+    to_rank = defaultdict(list)
+    for submission_id, previous_state, event_name in submissions:
+        if previous_state == 'scored' or state == 'scored':
+            to_rank[event_name].append(submission_id)
+
+    values = {'state': state}
+    if state == 'sent_to_training':
+        values['sent_to_training_timestamp'] = datetime.datetime.utcnow()
+    elif state == 'training':
+        values['training_timestamp'] = datetime.datetime.utcnow()
+    (session.query(Submission)
+            .filter(Submission.id.in_(submission_ids))
+            .update(values, synchronize_session=False))
+    (session.query(SubmissionOnCVFold)
+            .filter(SubmissionOnCVFold.submission_id.in_(submission_ids))
+            .update({'state': state}, synchronize_session=False))
+    # the committed updates expire the instances loaded in the session
+    session.commit()
+
+    if to_rank:
+        from .leaderboard import update_leaderboard_entries
+        for event_name, event_submission_ids in to_rank.items():
+            update_leaderboard_entries(session, event_name,
+                                       event_submission_ids)
+    return len(submissions)
+
+
+def _store_y_pred(path_results, step):
+    """Store the predictions of a fold as an uncompressed ``.npy`` file.
+
+    The compressed ``.npz`` file written by the worker is replaced by an
+    ``.npy`` file which can be memory-mapped. The files are written by the
+    code of the participants and are therefore never unpickled: the
+    predictions stored as arrays of Python objects are rejected.
+
+    Returns
+    -------
+    path : str
+        The absolute path of the ``.npy`` file.
+
+    Raises
+    ------
+    ValueError
+        If the predictions are stored as an array of Python objects.
+    """
+    path = os.path.abspath(
+        os.path.join(path_results, 'y_pred_{}.npy'.format(step))
+    )
+    path_npz = os.path.join(path_results, 'y_pred_{}.npz'.format(step))
+    if os.path.isfile(path_npz):
+        try:
+            with np.load(path_npz) as data:
+                y_pred = data['y_pred']
+        except ValueError as e:
+            raise ValueError(
+                'The predictions stored in {} are an array of Python objects '
+                'which cannot be loaded safely. The predictions should be a '
+                'numerical array.'.format(path_npz)
+            ) from e
+        # write under a temporary name such that the file is never partially
+        # written
+        path_tmp = path[:-len('.npy')] + '.tmp.npy'
+        np.save(path_tmp, y_pred, allow_pickle=False)
+        os.replace(path_tmp, path)
+        os.remove(path_npz)
+    elif not os.path.isfile(path):
+        raise FileNotFoundError(
+            'No predictions found in {}'.format(path_results)
+        )
+    return path
 
 
 def set_predictions(session, submission_id, path_predictions):
     """Set the predictions in the database.
 
+    The predictions of each fold are stored on disk as uncompressed ``.npy``
+    files, replacing the ``.npz`` files written by the worker, and only their
+    paths are stored in the database. The predictions are then loaded as
+    read-only memory-mapped arrays, without being copied in the database nor
+    in memory.
+
     Parameters
     ----------
-    config : dict
-        Configuration file containing the information to connect to the
-        dataset. If you are using the configuration provided by ramp, it
-        corresponds to the the `sqlalchemy` key.
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
     submission_id : int
         The id of the submission.
     path_predictions : str
         The path where the results files are located.
+
+    Raises
+    ------
+    ValueError
+        If some predictions are stored as an array of Python objects.
     """
     all_cv_folds = (session.query(SubmissionOnCVFold)
                            .filter_by(submission_id=submission_id)
-                           .options(defer("full_train_y_pred"),
-                                    defer("test_y_pred"))
                            .all())
     all_cv_folds = sorted(all_cv_folds, key=lambda x: x.id)
     for fold_id, cv_fold in enumerate(all_cv_folds):
         path_results = os.path.join(path_predictions,
                                     'fold_{}'.format(fold_id))
-        cv_fold.full_train_y_pred = np.load(
-            os.path.join(path_results, 'y_pred_train.npz'))['y_pred']
-        cv_fold.test_y_pred = np.load(
-            os.path.join(path_results, 'y_pred_test.npz'))['y_pred']
+        cv_fold.full_train_y_pred = None
+        cv_fold.test_y_pred = None
+        cv_fold.full_train_y_pred_path = _store_y_pred(path_results, 'train')
+        cv_fold.test_y_pred_path = _store_y_pred(path_results, 'test')
     session.commit()
 
 
@@ -671,8 +890,6 @@ def set_time(session, submission_id, path_predictions):
     """
     all_cv_folds = (session.query(SubmissionOnCVFold)
                            .filter_by(submission_id=submission_id)
-                           .options(defer("full_train_y_pred"),
-                                    defer("test_y_pred"))
                            .all())
     all_cv_folds = sorted(all_cv_folds, key=lambda x: x.id)
     for fold_id, cv_fold in enumerate(all_cv_folds):
@@ -702,8 +919,6 @@ def set_scores(session, submission_id, path_predictions):
     """
     all_cv_folds = (session.query(SubmissionOnCVFold)
                            .filter_by(submission_id=submission_id)
-                           .options(defer("full_train_y_pred"),
-                                    defer("test_y_pred"))
                            .all())
     all_cv_folds = sorted(all_cv_folds, key=lambda x: x.id)
     for fold_id, cv_fold in enumerate(all_cv_folds):
@@ -768,6 +983,31 @@ def set_submission_max_ram(session, submission_id, max_ram_mb):
     session.commit()
 
 
+def set_submission_memory_profile(session, submission_id, timestamps,
+                                  memory):
+    """Set the memory profile of a submission during processing.
+
+    The max amount of RAM used by the submission is updated as well.
+
+    Parameters
+    ----------
+    session : :class:`sqlalchemy.orm.Session`
+        The session to directly perform the operation on the database.
+    submission_id : int
+        The id of the submission.
+    timestamps : array-like, shape (n_points,)
+        The time in seconds since the beginning of the processing.
+    memory : array-like, shape (n_points,)
+        The amount of RAM in MB used at each time.
+    """
+    memory_profile = np.array([timestamps, memory], dtype=np.float32)
+    submission = select_submission_by_id(session, submission_id)
+    submission.memory_profile = memory_profile
+    if memory_profile.size:
+        submission.max_ram = float(memory_profile[1].max())
+    session.commit()
+
+
 def set_submission_error_msg(session, submission_id, error_msg):
     """Set the error message after that a submission failed to be processed.
 
@@ -815,8 +1055,6 @@ def score_submission(session, submission_id):
     # manually if needed for submission in various error states.
     all_cv_folds = (session.query(SubmissionOnCVFold)
                            .filter_by(submission_id=submission_id)
-                           .options(defer("full_train_y_pred"),
-                                    defer("test_y_pred"))
                            .all())
     all_cv_folds = sorted(all_cv_folds, key=lambda x: x.id)
     for submission_on_cv_fold in all_cv_folds:
@@ -850,6 +1088,10 @@ def score_submission(session, submission_id):
     submission.state = 'scored'
     session.commit()
 
+    from .leaderboard import update_leaderboard_entries
+    update_leaderboard_entries(session, submission.event.name,
+                               [submission_id])
+
 
 def submit_starting_kits(session, event_name, team_name, path_submission):
     """Submit all starting kits for a given event.
@@ -883,9 +1125,15 @@ def submit_starting_kits(session, event_name, team_name, path_submission):
                            if submission_name != event.ramp_sandbox_name
                            else submission_name + '_test')
         submission = add_submission(session, event_name, team_name,
-                                    submission_name, from_submission_path)
+                                    submission_name, from_submission_path,
+                                    refresh_leaderboards=False)
         logger.info('Copying the submission files into the deployment folder')
         logger.info('Adding {}'.format(submission))
     # revert the minimum duration between two submissions
     event.min_duration_between_submissions = min_duration_between_submissions
     session.commit()
+
+    from .leaderboard import update_leaderboards
+    from .leaderboard import update_user_leaderboards
+    update_leaderboards(session, event_name, new_only=True)
+    update_user_leaderboards(session, event_name, team_name, new_only=True)
@@ -0,0 +1,250 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from numpy.testing import assert_allclose
+
+from rampwf.score_types import Accuracy
+from rampwf.score_types import NegativeLogLikelihood
+from rampwf.utils.combine import blend_on_fold
+
+from ramp_utils import generate_ramp_config
+from ramp_utils import read_config
+from ramp_utils.testing import database_config_template
+from ramp_utils.testing import ramp_config_template
+
+from ramp_engine.dispatcher import Dispatcher
+
+from ramp_database.model import HistoricalContributivity
+from ramp_database.model import Model
+from ramp_database.model import Submission
+from ramp_database.model import SubmissionSimilarity
+
+from ramp_database.utils import setup_db
+from ramp_database.utils import session_scope
+from ramp_database.testing import create_toy_db
+
+from ramp_database.tools.contributivity import _greedy_forward_selection
+from ramp_database.tools.contributivity import _is_averaging
+from ramp_database.tools.contributivity import _make_batch_scorer
+from ramp_database.tools.contributivity import compute_contributivity
+from ramp_database.tools.event import get_event
+
+
+@pytest.fixture(scope='module')
+def session_scored_db(database_connection):
+    database_config = read_config(database_config_template())
+    ramp_config = ramp_config_template()
+    try:
+        deployment_dir = create_toy_db(database_config, ramp_config)
+        dispatcher = Dispatcher(
+            database_config, read_config(ramp_config), n_workers=-1,
+            hunger_policy='exit'
+        )
+        dispatcher.launch()
+        with session_scope(database_config['sqlalchemy']) as session:
+            yield session
+    finally:
+        shutil.rmtree(deployment_dir, ignore_errors=True)
+        db, _ = setup_db(database_config['sqlalchemy'])
+        Model.metadata.drop_all(db)
+
+
+def _get_predictions_dir():
+    return generate_ramp_config(
+        read_config(ramp_config_template()))['ramp_predictions_dir']
+
+
+def test_is_averaging():
+    from rampwf.prediction_types import make_detection
+    from rampwf.prediction_types import make_multiclass
+    from rampwf.prediction_types import make_regression
+    # the predictions are probed through their public interface only
+    for Predictions, y_true in [
+            (make_multiclass(label_names=[0, 1, 2]), [0, 1, 2, 1, 0]),
+            (make_regression(), [0.5, 1.5, 2., 3.5, 1.])]:
+        assert _is_averaging(Predictions,
+                             Predictions(y_true=np.array(y_true)).y_pred)
+
+    class MedianPredictions(make_regression()):
+        @classmethod
+        def combine(cls, predictions_list, index_list=None):
+            return cls(y_pred=np.median(
+                [predictions.y_pred for predictions in predictions_list],
+                axis=0))
+
+    y_true = MedianPredictions(y_true=np.array([0.5, 1.5, 2., 3.5])).y_pred
+    assert not _is_averaging(MedianPredictions, y_true)
+    Predictions = make_detection()
+    y_true = np.empty(2, dtype=object)
+    y_true[:] = [[(1, 1, 1, 1)], []]
+    assert not _is_averaging(Predictions, Predictions(y_true=y_true).y_pred)
+
+
+@pytest.mark.parametrize("score_type", [Accuracy(), NegativeLogLikelihood()])
+@pytest.mark.parametrize("batch_size", [None, 2])
+def test_greedy_forward_selection(score_type, batch_size):
+    # the vectorized selection is the one of rampwf
+    from rampwf.prediction_types import make_multiclass
+    Predictions = make_multiclass(label_names=[0, 1, 2])
+    rng = np.random.RandomState(0)
+    y_true = rng.randint(3, size=50)
+    stack = rng.dirichlet(np.ones(3), size=(7, 50))
+    ground_truths = Predictions(y_true=y_true)
+    score_batch = _make_batch_scorer(score_type, ground_truths, Predictions)
+    selection, score = _greedy_forward_selection(
+        stack, score_batch, score_type.is_lower_the_better,
+        max_n_ensemble=80, batch_size=batch_size
+    )
+    expected_selection = blend_on_fold(
+        [Predictions(y_pred=y_pred) for y_pred in stack], ground_truths,
+        score_type
+    )
+    assert selection == list(expected_selection)
+    expected_score = score_type.score_function(
+        ground_truths, Predictions.combine(
+            [Predictions(y_pred=y_pred) for y_pred in stack], selection)
+    )
+    assert score == pytest.approx(expected_score)
+
+
+def test_compute_contributivity(session_scored_db):
+    session = session_scored_db
+    event_name = 'iris_test'
+    compute_contributivity(session, event_name)
+
+    event = get_event(session, event_name)
+    submissions = (session.query(Submission)
+                          .filter(Submission.is_public_leaderboard)
+                          .filter(Submission.event_team.has(event=event))
+                          .order_by(Submission.id)
+                          .all())
+    assert len(submissions) > 1
+    # the ensembles are the ones built by rampwf
+    problem_module = event.problem.module
+    Predictions = problem_module.Predictions
+    score_type = problem_module.score_types[0]
+    _, y_train = problem_module.get_train_data(
+        path=event.problem.path_ramp_data)
+    expected = np.zeros((len(submissions), len(event.cv_folds)))
+    for fold_idx, cv_fold in enumerate(sorted(event.cv_folds,
+                                              key=lambda x: x.id)):
+        predictions_list = [
+            next(fold for fold in sub.on_cv_folds
+                 if fold.cv_fold_id == cv_fold.id).valid_predictions
+            for sub in submissions
+        ]
+        selection = blend_on_fold(
+            predictions_list, Predictions(y_true=y_train[cv_fold.test_is]),
+            score_type
+        )
+        for idx in selection:
+            expected[idx, fold_idx] += 1 / len(selection)
+    expected = expected.mean(axis=1)
+    contributivity = [sub.contributivity for sub in submissions]
+    assert_allclose(contributivity, expected)
+    assert sum(contributivity) == pytest.approx(1)
+    historical_contributivity = [sub.historical_contributivity
+                                 for sub in submissions]
+    assert_allclose(historical_contributivity, contributivity)
+    for sub in submissions:
+        assert sub.contributivity == pytest.approx(
+            np.mean([fold.contributivity for fold in sub.on_cv_folds]))
+    n_best = sum(fold.best for sub in submissions for fold in sub.on_cv_folds)
+    assert n_best == len(event.cv_folds)
+    for step in ('valid', 'test'):
+        for name in ('combined', 'foldwise'):
+            score = getattr(event, 'combined_{}_{}_score'.format(name, step))
+            assert 0 <= score <= 1
+
+    # the changes are recorded in the historical contributivities
+    n_records = session.query(HistoricalContributivity).count()
+    assert n_records == sum(c > 0 for c in contributivity)
+    compute_contributivity(session, event_name, batch_size=1)
+    assert session.query(HistoricalContributivity).count() == n_records
+
+    # a submission crediting another one shares its historical contributivity
+    target = max(submissions, key=lambda sub: sub.contributivity)
+    source = next(sub for sub in submissions if sub is not target)
+    similarity = SubmissionSimilarity(
+        type='target_credit', user=target.event_team.team.admin,
+        source_submission=source, target_submission=target, similarity=0.5
+    )
+    session.add(similarity)
+    session.commit()
+    compute_contributivity(session, event_name)
+    assert target.contributivity > 0
+    assert target.historical_contributivity == pytest.approx(
+        target.contributivity / 2)
+    assert source.historical_contributivity == pytest.approx(
+        source.contributivity + target.contributivity / 2)
+    session.delete(similarity)
+    session.commit()
+
+    # the submissions not ensembled do not contribute
+    for sub in submissions[1:]:
+        sub.is_to_ensemble = False
+    session.commit()
+    compute_contributivity(session, event_name)
+    assert submissions[0].contributivity == pytest.approx(1)
+    assert all(sub.contributivity == 0 for sub in submissions[1:])
+    assert (event.combined_combined_valid_score ==
+            event.combined_foldwise_valid_score)
+    for sub in submissions[1:]:
+        sub.is_to_ensemble = True
+    session.commit()
+
+
+def test_compute_contributivity_legacy_predictions(session_scored_db):
+    # the predictions stored in the database before being stored on disk are
+    # still ensembled
+    session = session_scored_db
+    compute_contributivity(session, 'iris_test')
+    event = get_event(session, 'iris_test')
+    submissions = (session.query(Submission)
+                          .filter(Submission.is_public_leaderboard)
+                          .filter(Submission.event_team.has(event=event))
+                          .all())
+    contributivity = {sub.id: sub.contributivity for sub in submissions}
+    folds = [fold for sub in submissions for fold in sub.on_cv_folds]
+    paths = {}
+    try:
+        for fold in folds:
+            paths[fold.id] = (fold.full_train_y_pred_path,
+                              fold.test_y_pred_path)
+            y_pred_train = np.array(fold.full_train_y_pred)
+            y_pred_test = np.array(fold.test_y_pred)
+            fold.full_train_y_pred = y_pred_train
+            fold.test_y_pred = y_pred_test
+        session.commit()
+        assert all(fold.full_train_y_pred_path is None for fold in folds)
+        compute_contributivity(session, 'iris_test')
+        for sub in submissions:
+            assert sub.contributivity == pytest.approx(contributivity[sub.id])
+    finally:
+        for fold in folds:
+            fold.full_train_y_pred = None
+            fold.test_y_pred = None
+            fold.full_train_y_pred_path, fold.test_y_pred_path = \
+                paths[fold.id]
+        session.commit()
+
+
+def test_compute_contributivity_missing_predictions(session_scored_db,
+                                                    tmpdir):
+    # without the predictions, no submission can be ensembled
+    session = session_scored_db
+    predictions_dir = _get_predictions_dir()
+    shutil.move(predictions_dir, str(tmpdir.join('predictions')))
+    try:
+        compute_contributivity(session, 'iris_test')
+    finally:
+        shutil.move(str(tmpdir.join('predictions')), predictions_dir)
+    event = get_event(session, 'iris_test')
+    assert event.combined_combined_valid_score is None
+    assert event.combined_foldwise_test_score is None
+    assert all(sub.contributivity == 0 and not any(
+        fold.contributivity or fold.best for fold in sub.on_cv_folds)
+        for event_team in event.event_teams
+        for sub in event_team.submissions)
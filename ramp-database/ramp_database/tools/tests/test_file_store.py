@@ -0,0 +1,126 @@
+import errno
+import os
+
+import pytest
+
+from ramp_database.tools import _file_store
+from ramp_database.tools._file_store import get_file_store_dir
+from ramp_database.tools._file_store import remove_files
+from ramp_database.tools._file_store import store_file
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _list_blobs(store_dir):
+    return sorted(filename for _, _, filenames in os.walk(store_dir)
+                  for filename in filenames)
+
+
+def test_store_file(tmpdir):
+    store_dir = get_file_store_dir(str(tmpdir))
+    _write(os.path.join(str(tmpdir), 'kit', 'estimator.py'), 'estimator')
+    _write(os.path.join(str(tmpdir), 'kit', 'data.csv'), 'data')
+    _write(os.path.join(str(tmpdir), 'other', 'estimator.py'), 'other')
+    _write(os.path.join(str(tmpdir), 'other', 'data.csv'), 'data')
+
+    digests = {}
+    for name in ['kit', 'other']:
+        os.makedirs(os.path.join(str(tmpdir), 'submission_' + name))
+        for filename in ['estimator.py', 'data.csv']:
+            digests[name, filename] = store_file(
+                store_dir, os.path.join(str(tmpdir), name, filename),
+                os.path.join(str(tmpdir), 'submission_' + name, filename)
+            )
+    # the files with the same content share the same blob
+    assert digests['kit', 'data.csv'] == digests['other', 'data.csv']
+    assert _list_blobs(store_dir) == sorted({
+        digests['kit', 'estimator.py'], digests['other', 'estimator.py'],
+        digests['kit', 'data.csv']
+    })
+    kit_data = os.stat(os.path.join(str(tmpdir), 'submission_kit',
+                                    'data.csv'))
+    other_data = os.stat(os.path.join(str(tmpdir), 'submission_other',
+                                      'data.csv'))
+    assert kit_data.st_ino == other_data.st_ino
+    assert kit_data.st_nlink == 3
+    assert _read(os.path.join(str(tmpdir), 'submission_other',
+                              'estimator.py')) == 'other'
+
+    # the blobs are removed with the last file referencing them
+    remove_files(store_dir, os.path.join(str(tmpdir), 'submission_kit'))
+    assert not os.path.exists(os.path.join(str(tmpdir), 'submission_kit'))
+    assert _list_blobs(store_dir) == sorted({
+        digests['other', 'estimator.py'], digests['kit', 'data.csv']
+    })
+    remove_files(store_dir, os.path.join(str(tmpdir), 'submission_other'))
+    assert _list_blobs(store_dir) == []
+
+
+def test_store_file_blob_removed_concurrently(tmpdir, monkeypatch):
+    # the blob found in the store is removed by another process before being
+    # linked to the destination: it is stored again
+    store_dir = get_file_store_dir(str(tmpdir))
+    src = os.path.join(str(tmpdir), 'kit', 'estimator.py')
+    _write(src, 'estimator')
+    os.makedirs(os.path.join(str(tmpdir), 'submission_1'))
+    os.makedirs(os.path.join(str(tmpdir), 'submission_2'))
+    store_file(store_dir, src,
+               os.path.join(str(tmpdir), 'submission_1', 'estimator.py'))
+
+    os_link = os.link
+    removed = []
+
+    def link(src, dst):
+        if not removed and dst.startswith(os.path.join(str(tmpdir),
+                                                       'submission_2')):
+            remove_files(store_dir, os.path.join(str(tmpdir),
+                                                 'submission_1'))
+            removed.append(src)
+        return os_link(src, dst)
+
+    monkeypatch.setattr(_file_store.os, 'link', link)
+    dst = os.path.join(str(tmpdir), 'submission_2', 'estimator.py')
+    digest = store_file(store_dir, src, dst)
+    assert removed
+    assert _read(dst) == 'estimator'
+    assert os.stat(dst).st_nlink == 2
+    assert _list_blobs(store_dir) == [digest]
+
+
+def test_store_file_without_hard_links(tmpdir, monkeypatch):
+    # the files are copied when the file system does not support hard links
+    def link(src, dst):
+        raise OSError(errno.EPERM, 'Operation not permitted')
+
+    monkeypatch.setattr(_file_store.os, 'link', link)
+    store_dir = get_file_store_dir(str(tmpdir))
+    src = os.path.join(str(tmpdir), 'kit', 'estimator.py')
+    _write(src, 'estimator')
+    for name in ['submission_1', 'submission_2']:
+        dst = os.path.join(str(tmpdir), name, 'estimator.py')
+        os.makedirs(os.path.dirname(dst))
+        digest = store_file(store_dir, src, dst)
+        assert _read(dst) == 'estimator'
+        assert os.stat(dst).st_nlink == 1
+    assert _list_blobs(store_dir) == [digest]
+
+
+def test_store_file_error(tmpdir, monkeypatch):
+    def link(src, dst):
+        raise OSError(errno.EACCES, 'Permission denied')
+
+    monkeypatch.setattr(_file_store.os, 'link', link)
+    src = os.path.join(str(tmpdir), 'kit', 'estimator.py')
+    _write(src, 'estimator')
+    with pytest.raises(OSError, match='Permission denied'):
+        store_file(get_file_store_dir(str(tmpdir)), src,
+                   os.path.join(str(tmpdir), 'estimator.py'))
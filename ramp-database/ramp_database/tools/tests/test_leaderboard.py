@@ -1,6 +1,15 @@
+import datetime
+import io
 import shutil
+import threading
+from contextlib import contextmanager
 
+import numpy as np
+import pandas as pd
 import pytest
+from sqlalchemy import event as sqlalchemy_event
+
+from numpy.testing import assert_allclose
 
 from ramp_utils import read_config
 from ramp_utils.testing import database_config_template
@@ -15,12 +24,33 @@ from ramp_database.utils import session_scope
 from ramp_database.testing import create_toy_db
 
 from ramp_database.model import EventTeam
+from ramp_database.model import Leaderboard
+from ramp_database.model import LeaderboardEntry
+from ramp_database.model import LeaderboardSnapshot
+from ramp_database.model import Submission
 
 from ramp_database.tools.event import get_event
+from ramp_database.tools.submission import get_bagged_scores
+from ramp_database.tools.submission import get_scores
+from ramp_database.tools.submission import get_time
+from ramp_database.tools.submission import set_submission_state
 from ramp_database.tools.team import get_event_team_by_name
 
+from ramp_database.tools import leaderboard
+from ramp_database.tools.leaderboard import _compute_leaderboard
+from ramp_database.tools.leaderboard import _get_leaderboard_state
+from ramp_database.tools.leaderboard import _render_leaderboards
+from ramp_database.tools.leaderboard import get_best_entry_per_team
 from ramp_database.tools.leaderboard import get_leaderboard
+from ramp_database.tools.leaderboard import get_leaderboard_at
+from ramp_database.tools.leaderboard import get_leaderboard_page
+from ramp_database.tools.leaderboard import get_submission_rank
+from ramp_database.tools.leaderboard import get_top_entries
+from ramp_database.tools.leaderboard import iter_leaderboard_export
+from ramp_database.tools.leaderboard import stream_leaderboard_export
+from ramp_database.tools.leaderboard import take_leaderboard_snapshot
 from ramp_database.tools.leaderboard import update_all_user_leaderboards
+from ramp_database.tools.leaderboard import update_leaderboard_entries
 from ramp_database.tools.leaderboard import update_leaderboards
 from ramp_database.tools.leaderboard import update_user_leaderboards
 
@@ -53,6 +83,23 @@ def session_toy_function(database_connection):
         Model.metadata.drop_all(db)
 
 
+@contextmanager
+def count_statements(session):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    sqlalchemy_event.listen(engine, 'before_cursor_execute',
+                            before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        sqlalchemy_event.remove(engine, 'before_cursor_execute',
+                                before_cursor_execute)
+
+
 def test_update_leaderboard_functions(session_toy_function):
     event_name = 'iris_test'
     user_name = 'test_user'
@@ -195,7 +242,8 @@ def test_get_leaderboard(session_toy_db):
         assert private_term not in leaderboard_public
         assert private_term in leaderboard_private
 
-    # check the column name in each leaderboard
+    # check the column name in each leaderboard: the dispatcher computed the
+    # contributivity of the submissions
     assert """<th>submission ID</th>
       <th>team</th>
       <th>submission</th>
@@ -223,6 +271,8 @@ def test_get_leaderboard(session_toy_db):
       <th>bag private f1_70</th>
       <th>mean private f1_70</th>
       <th>std private f1_70</th>
+      <th>contributivity</th>
+      <th>historical contributivity</th>
       <th>train time [s]</th>
       <th>validation time [s]</th>
       <th>test time [s]</th>
@@ -234,6 +284,8 @@ def test_get_leaderboard(session_toy_db):
       <th>error</th>
       <th>nll</th>
       <th>f1_70</th>
+      <th>contributivity</th>
+      <th>historical contributivity</th>
       <th>train time [s]</th>
       <th>validation time [s]</th>
       <th>max RAM [MB]</th>
@@ -260,3 +312,502 @@ def test_get_leaderboard(session_toy_db):
       <th>validation time [s]</th>
       <th>test time [s]</th>
       <th>submitted at (UTC)</th>""" in competition_private
+
+
+def test_compute_leaderboard_aggregation(session_toy_db):
+    # the submissions have been trained in test_get_leaderboard: check that
+    # the aggregated scores and times match the ones of each submission
+    event = get_event(session_toy_db, 'iris_test')
+    submissions = [sub for sub in session_toy_db.query(Submission).all()
+                   if sub.event == event and sub.is_private_leaderboard]
+    assert submissions
+    map_score_precision = {score_type.name: score_type.precision
+                           for score_type in event.score_types}
+    df = _compute_leaderboard(session_toy_db, submissions, 'private',
+                              'iris_test', with_links=False)
+    df = df.set_index('submission ID')
+    assert len(df) == len(submissions)
+    for sub in submissions:
+        row = df.loc[sub.basename.replace('submission_', '')]
+        assert row['team'] == sub.team.name
+        assert row['submission'] == sub.name
+
+        df_scores = get_scores(session_toy_db, sub.id)
+        df_scores = df_scores.round(map_score_precision)
+        df_bag = get_bagged_scores(session_toy_db, sub.id)
+        n_bag = df_bag.index.get_level_values('n_bag').max()
+        df_bag = df_bag.round(map_score_precision)
+        for step, dataset in (('valid', 'public'), ('test', 'private')):
+            for score_name in map_score_precision:
+                scores = df_scores.loc[(slice(None), step), score_name]
+                assert_allclose(
+                    row['mean {} {}'.format(dataset, score_name)],
+                    scores.mean())
+                assert_allclose(
+                    row['std {} {}'.format(dataset, score_name)],
+                    scores.std())
+                assert_allclose(
+                    row['bag {} {}'.format(dataset, score_name)],
+                    df_bag.loc[(step, n_bag), score_name])
+
+        df_time = get_time(session_toy_db, sub.id).sum()
+        assert_allclose(row['train time [s]'], df_time['train'])
+        assert_allclose(row['validation time [s]'], df_time['valid'])
+        assert_allclose(row['test time [s]'], df_time['test'])
+
+
+def test_get_leaderboard_page(session_toy_db):
+    # the submissions have been trained in test_get_leaderboard
+    update_leaderboards(session_toy_db, 'iris_test')
+    event = get_event(session_toy_db, 'iris_test')
+    assert {leaderboard.leaderboard_type
+            for leaderboard in event.leaderboards} == {
+        'public', 'private', 'failed', 'new', 'public competition',
+        'private competition'}
+
+    df, n_rows = get_leaderboard_page(session_toy_db, 'public', 'iris_test')
+    assert n_rows == 4
+    assert df.shape[0] == 4
+    assert df.columns.tolist()[:3] == ['team', 'submission', 'acc']
+    assert all(name.startswith('<a href=') for name in df['submission'])
+    # the stored order is the order of the leaderboard
+    assert df['acc'].is_monotonic_decreasing
+
+    df, _ = get_leaderboard_page(session_toy_db, 'public', 'iris_test',
+                                 with_links=False)
+    assert not any(name.startswith('<a href=') for name in df['submission'])
+
+    df, n_rows = get_leaderboard_page(session_toy_db, 'public', 'iris_test',
+                                      sort_by='acc', ascending=True,
+                                      page=2, per_page=3)
+    assert n_rows == 4
+    assert df.shape[0] == 1
+    df_all, _ = get_leaderboard_page(session_toy_db, 'public', 'iris_test')
+    assert df['acc'].iloc[0] == df_all['acc'].max()
+
+    df, n_rows = get_leaderboard_page(session_toy_db, 'private', 'iris_test',
+                                      user_name='test_user')
+    assert n_rows == 2
+    assert (df['team'] == 'test_user').all()
+    assert 'bag private acc' in df.columns
+
+    df, n_rows = get_leaderboard_page(session_toy_db, 'new', 'iris_test')
+    assert n_rows == 0
+    assert df.empty
+    df, n_rows = get_leaderboard_page(session_toy_db, 'failed', 'iris_test')
+    assert n_rows == 2
+    df, n_rows = get_leaderboard_page(session_toy_db, 'private competition',
+                                      'iris_test')
+    assert n_rows == 2
+    assert df['rank'].tolist() == [1, 2]
+
+    assert get_leaderboard_page(session_toy_db, 'public',
+                                'unknown_event') == (None, 0)
+    with pytest.raises(ValueError, match='cannot be sorted'):
+        get_leaderboard_page(session_toy_db, 'public', 'iris_test',
+                             sort_by='unknown')
+    with pytest.raises(ValueError, match='should be positive'):
+        get_leaderboard_page(session_toy_db, 'public', 'iris_test', page=0)
+
+
+def test_get_leaderboard_page_cached(session_toy_db):
+    # the stored leaderboard is decoded and sorted once per update
+    update_leaderboards(session_toy_db, 'iris_test')
+    expected, n_rows = get_leaderboard_page(session_toy_db, 'public',
+                                            'iris_test', sort_by='acc')
+    with count_statements(session_toy_db) as statements:
+        df, _ = get_leaderboard_page(session_toy_db, 'public', 'iris_test',
+                                     sort_by='acc', page=2, per_page=2)
+    assert len(statements) == 1
+    assert 'leaderboards.data' not in statements[0]
+    pd.testing.assert_frame_equal(df, expected.iloc[2:4].reset_index(
+        drop=True))
+
+    event = get_event(session_toy_db, 'iris_test')
+    leaderboard = (session_toy_db.query(Leaderboard)
+                                 .filter_by(event=event,
+                                            leaderboard_type='public')
+                                 .one())
+    leaderboard.set_data(['team'], {'team': ['test_user']})
+    session_toy_db.commit()
+    try:
+        df, n_rows = get_leaderboard_page(session_toy_db, 'public',
+                                          'iris_test', sort_by='team')
+        assert n_rows == 1
+        assert df['team'].tolist() == ['test_user']
+    finally:
+        update_leaderboards(session_toy_db, 'iris_test')
+    assert get_leaderboard_page(session_toy_db, 'public', 'iris_test',
+                                sort_by='acc')[1] == 4
+
+
+def test_render_leaderboards(session_toy_db):
+    # the submissions have been trained in test_get_leaderboard: all the
+    # leaderboards rendered at once should be the same as the leaderboards
+    # rendered separately
+    variants = [(leaderboard_type, with_links)
+                for leaderboard_type in ['public', 'private', 'failed', 'new',
+                                         'public competition',
+                                         'private competition']
+                for with_links in [True, False]]
+    user_names = [None, 'test_user', 'test_user_2', 'unknown_user']
+    leaderboards = _render_leaderboards(session_toy_db, 'iris_test',
+                                        variants, user_names)
+    assert len(leaderboards) == len(variants) * len(user_names)
+    for user_name in user_names:
+        for leaderboard_type, with_links in variants:
+            assert (leaderboards[user_name, leaderboard_type, with_links] ==
+                    get_leaderboard(session_toy_db, leaderboard_type,
+                                    'iris_test', user_name,
+                                    with_links=with_links))
+    assert leaderboards['unknown_user', 'public', True] is None
+
+
+def test_get_leaderboard_incremental_update(session_toy_db):
+    # the submissions have been trained in test_get_leaderboard: the rows of
+    # the leaderboards are kept between calls and should follow the changes
+    # of the submissions
+    event_team = get_event_team_by_name(session_toy_db, 'iris_test',
+                                        'test_user')
+    submissions = [sub for sub in event_team.submissions
+                   if sub.state == 'scored']
+    assert len(submissions) == 2
+    assert get_leaderboard(session_toy_db, 'public', 'iris_test',
+                           'test_user').count('<tr>') == 2
+
+    for sub in submissions:
+        sub.is_in_competition = False
+    session_toy_db.commit()
+    for leaderboard_type in ('public competition', 'private competition'):
+        leaderboard = get_leaderboard(session_toy_db, leaderboard_type,
+                                      'iris_test')
+        assert leaderboard.count('<tr>') == 1
+        assert '<td>test_user</td>' not in leaderboard
+    # the public leaderboard is not affected by the competition
+    assert get_leaderboard(session_toy_db, 'public', 'iris_test',
+                           'test_user').count('<tr>') == 2
+
+    submissions[0].state = 'training_error'
+    session_toy_db.commit()
+    assert get_leaderboard(session_toy_db, 'public', 'iris_test',
+                           'test_user').count('<tr>') == 1
+    assert get_leaderboard(session_toy_db, 'private',
+                           'iris_test').count('<tr>') == 3
+
+    submissions[0].state = 'scored'
+    for sub in submissions:
+        sub.is_in_competition = True
+    session_toy_db.commit()
+    assert get_leaderboard(session_toy_db, 'private',
+                           'iris_test').count('<tr>') == 4
+    assert get_leaderboard(session_toy_db, 'public competition',
+                           'iris_test').count('<tr>') == 2
+
+
+def test_get_leaderboard_rescored_submission(session_toy_db):
+    # the submissions have been trained in test_get_leaderboard: a submission
+    # scored again, e.g. by another process, keeps its state and timestamps
+    # but its row is computed again
+    event = get_event(session_toy_db, 'iris_test')
+    get_leaderboard(session_toy_db, 'private', 'iris_test')
+    submission = (session_toy_db.query(Submission)
+                                .filter(Submission.is_public_leaderboard)
+                                .order_by(Submission.id)
+                                .first())
+    score = submission.scores[0]
+    column = 'bag public {}'.format(score.score_name)
+    valid_score_cv_bag = score.valid_score_cv_bag
+    valid_score_cv_bags = score.valid_score_cv_bags
+    state = leaderboard._get_leaderboard_state(session_toy_db, event)
+    assert state.rows.loc[submission.id, column] != 0.5
+
+    score.valid_score_cv_bag = 0.5
+    score.valid_score_cv_bags = np.append(valid_score_cv_bags[:-1], 0.5)
+    session_toy_db.commit()
+    try:
+        state = leaderboard._get_leaderboard_state(session_toy_db, event)
+        assert state.rows.loc[submission.id, column] == 0.5
+    finally:
+        score.valid_score_cv_bag = valid_score_cv_bag
+        score.valid_score_cv_bags = valid_score_cv_bags
+        session_toy_db.commit()
+
+
+def test_update_all_user_leaderboards_unchanged_teams(session_toy_db):
+    # the submissions have been trained in test_get_leaderboard: the
+    # leaderboards of the teams without changed submissions are not rendered
+    # again
+    update_all_user_leaderboards(session_toy_db, 'iris_test')
+    event_team = get_event_team_by_name(session_toy_db, 'iris_test',
+                                        'test_user')
+    other_event_team = get_event_team_by_name(session_toy_db, 'iris_test',
+                                              'test_user_2')
+    for et in (event_team, other_event_team):
+        assert et.leaderboard_html
+        et.leaderboard_html = 'not updated'
+    session_toy_db.commit()
+
+    submission = [sub for sub in event_team.submissions
+                  if sub.state == 'scored'][0]
+    submission.state = 'training_error'
+    session_toy_db.commit()
+    update_all_user_leaderboards(session_toy_db, 'iris_test')
+    assert event_team.leaderboard_html != 'not updated'
+    assert event_team.leaderboard_html.count('<tr>') == 1
+    assert other_event_team.leaderboard_html == 'not updated'
+
+    submission.state = 'scored'
+    session_toy_db.commit()
+    update_user_leaderboards(session_toy_db, 'iris_test', 'test_user')
+    assert event_team.leaderboard_html.count('<tr>') == 2
+    update_all_user_leaderboards(session_toy_db, 'iris_test')
+    assert event_team.leaderboard_html.count('<tr>') == 2
+
+
+def test_leaderboard_entries(session_toy_db):
+    # the submissions have been trained in test_get_leaderboard and their
+    # entries were added when they have been scored
+    event = get_event(session_toy_db, 'iris_test')
+    entries = (session_toy_db.query(LeaderboardEntry)
+                             .filter_by(event_id=event.id).all())
+    assert len(entries) == 4 * len(event.score_types)
+
+    df, _ = get_leaderboard_page(session_toy_db, 'private', 'iris_test',
+                                 with_links=False)
+    df = df.set_index(['team', 'submission'])
+    top_entries = get_top_entries(session_toy_db, 'iris_test', n=3,
+                                  leaderboard_type='private')
+    assert len(top_entries) == 3
+    scores = [entry.bag_private_score for entry in top_entries]
+    assert scores == sorted(scores, reverse=True)
+    for entry in top_entries:
+        row = df.loc[(entry.event_team.team.name, entry.submission.name)]
+        assert entry.bag_private_score == pytest.approx(
+            row['bag private acc'], abs=1e-2)
+    # the error is better when lower
+    top_entries = get_top_entries(session_toy_db, 'iris_test', n=10,
+                                  score_name='error')
+    scores = [entry.bag_public_score for entry in top_entries]
+    assert len(scores) == 4
+    assert scores == sorted(scores)
+
+    for leaderboard_type in ['public', 'private']:
+        best_entries = get_best_entry_per_team(
+            session_toy_db, 'iris_test', leaderboard_type=leaderboard_type)
+        df, _ = get_leaderboard_page(
+            session_toy_db, leaderboard_type + ' competition', 'iris_test')
+        assert ([entry.event_team.team.name for entry in best_entries] ==
+                df['team'].tolist())
+
+    ranks = [get_submission_rank(session_toy_db, entry.submission_id,
+                                 score_name='error')
+             for entry in top_entries]
+    assert ranks == sorted(ranks)
+    assert ranks[0] == 1
+    failed_submission = (session_toy_db.query(Submission)
+                                       .filter_by(state='training_error')
+                                       .first())
+    assert get_submission_rank(session_toy_db, failed_submission.id) is None
+    with pytest.raises(ValueError, match='leaderboard type'):
+        get_top_entries(session_toy_db, 'iris_test', leaderboard_type='new')
+
+    # the entries follow the changes of the submissions
+    submission = top_entries[0].submission
+    set_submission_state(session_toy_db, submission.id, 'training_error')
+    assert get_submission_rank(session_toy_db, submission.id) is None
+    assert len(get_top_entries(session_toy_db, 'iris_test')) == 3
+    set_submission_state(session_toy_db, submission.id, 'scored')
+    assert get_submission_rank(session_toy_db, submission.id,
+                               score_name='error') == 1
+
+    submission.is_in_competition = False
+    session_toy_db.commit()
+    update_leaderboard_entries(session_toy_db, 'iris_test')
+    assert all(entry.submission_id != submission.id
+               for entry in get_best_entry_per_team(session_toy_db,
+                                                    'iris_test'))
+    submission.is_in_competition = True
+    session_toy_db.commit()
+    update_leaderboard_entries(session_toy_db, 'iris_test')
+    assert len(session_toy_db.query(LeaderboardEntry)
+                             .filter_by(submission_id=submission.id)
+                             .all()) == len(event.score_types)
+
+
+def test_get_leaderboard_state_per_event(session_toy_db):
+    # the update of the leaderboard of an event does not block the
+    # leaderboards of the other events
+    event = get_event(session_toy_db, 'iris_test')
+    state = _get_leaderboard_state(session_toy_db, event)
+    for id_, signature in state.signatures.items():
+        submission = session_toy_db.query(Submission).get(id_)
+        assert signature.team == submission.team.name
+        assert signature.is_in_competition == submission.is_in_competition
+
+    leaderboards = []
+    with state.lock:
+        thread = threading.Thread(target=lambda: leaderboards.append(
+            get_leaderboard(session_toy_db, 'public', 'boston_housing_test')
+        ))
+        thread.start()
+        thread.join(timeout=60)
+    assert not thread.is_alive()
+    assert len(leaderboards) == 1
+
+
+@pytest.mark.parametrize(
+    "leaderboard_type", ['public', 'private', 'failed']
+)
+def test_get_leaderboard_bounded_statements(session_toy_db,
+                                            leaderboard_type):
+    # the submissions have been trained in test_get_leaderboard: the number
+    # of statements to render a leaderboard does not depend on the number of
+    # submissions reported
+    def n_statements():
+        leaderboard._LEADERBOARD_STATES.clear()
+        session_toy_db.expire_all()
+        with count_statements(session_toy_db) as statements:
+            html = get_leaderboard(session_toy_db, leaderboard_type,
+                                   'iris_test')
+        return html.count('<tr>'), len(statements)
+
+    n_rows, n_queries = n_statements()
+    submissions = (session_toy_db.query(Submission)
+                                 .filter(Submission.is_public_leaderboard)
+                                 .all())
+    state = 'scored' if leaderboard_type == 'failed' else 'training_error'
+    changed = (session_toy_db.query(Submission)
+                             .filter(Submission.state == state)
+                             .filter(Submission.is_not_sandbox)
+                             .all())
+    assert changed
+    for sub in changed:
+        sub.state = 'training_error' if state == 'scored' else 'scored'
+    session_toy_db.commit()
+    try:
+        n_rows_changed, n_queries_changed = n_statements()
+        assert n_rows_changed != n_rows
+        assert n_queries_changed == n_queries
+    finally:
+        for sub in changed:
+            sub.state = state
+        session_toy_db.commit()
+    assert (session_toy_db.query(Submission)
+                          .filter(Submission.is_public_leaderboard)
+                          .count() == len(submissions))
+
+
+def test_iter_leaderboard_export(session_toy_db):
+    # the submissions have been trained in test_get_leaderboard
+    event = get_event(session_toy_db, 'iris_test')
+    chunks = list(iter_leaderboard_export(session_toy_db, 'iris_test',
+                                          chunk_size=3))
+    assert all(0 < df.shape[0] <= 3 for df in chunks)
+    df = pd.concat(chunks, ignore_index=True)
+    n_folds = len(event.cv_folds)
+    assert df.shape[0] == 4 * n_folds
+    assert df.columns.tolist()[:6] == [
+        'team', 'submission', 'submission ID', 'in competition',
+        'submitted at (UTC)', 'fold']
+    for submission_id, df_sub in df.groupby('submission ID'):
+        assert df_sub['fold'].tolist() == list(range(n_folds))
+        scores = get_scores(session_toy_db, submission_id)
+        for step in ['train', 'valid', 'test']:
+            for score_type in event.score_types:
+                assert_allclose(
+                    df_sub['{} {}'.format(step, score_type.name)],
+                    scores.xs(step, level='step')[score_type.name])
+        times = get_time(session_toy_db, submission_id)
+        assert_allclose(df_sub['train time [s]'], times['train'])
+
+    # the chunks hold all the scores of a fold
+    chunks = list(iter_leaderboard_export(session_toy_db, 'iris_test',
+                                          chunk_size=1))
+    assert len(chunks) == 4 * n_folds
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), df)
+
+
+@pytest.mark.parametrize("export_format", ['csv', 'parquet', 'arrow'])
+def test_stream_leaderboard_export(session_toy_db, export_format):
+    if export_format != 'csv':
+        pytest.importorskip('pyarrow')
+    expected = pd.concat(iter_leaderboard_export(session_toy_db,
+                                                 'iris_test'),
+                         ignore_index=True)
+    data = b''.join(stream_leaderboard_export(session_toy_db, 'iris_test',
+                                              export_format, chunk_size=5))
+    if export_format == 'csv':
+        df = pd.read_csv(io.BytesIO(data),
+                         parse_dates=['submitted at (UTC)'])
+    elif export_format == 'parquet':
+        df = pd.read_parquet(io.BytesIO(data))
+    else:
+        import pyarrow as pa
+        df = pa.ipc.open_stream(data).read_all().to_pandas()
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+
+def test_stream_leaderboard_export_error(session_toy_db):
+    with pytest.raises(ValueError, match='export format'):
+        stream_leaderboard_export(session_toy_db, 'iris_test', 'xlsx')
+
+
+def test_leaderboard_snapshots(session_toy_db):
+    # the submissions have been trained in test_get_leaderboard and a
+    # snapshot was taken each time the leaderboards were updated
+    event = get_event(session_toy_db, 'iris_test')
+    update_leaderboards(session_toy_db, 'iris_test')
+    snapshots = (session_toy_db.query(LeaderboardSnapshot)
+                               .filter_by(event_id=event.id)
+                               .order_by(LeaderboardSnapshot.id)
+                               .all())
+    assert snapshots
+    assert take_leaderboard_snapshot(session_toy_db, 'iris_test') is None
+    before = snapshots[-1].timestamp
+
+    for leaderboard_type in ['public', 'private', 'public competition',
+                             'private competition']:
+        expected, n_rows = get_leaderboard_page(
+            session_toy_db, leaderboard_type, 'iris_test', with_links=False)
+        df, n_rows_at = get_leaderboard_page(
+            session_toy_db, leaderboard_type, 'iris_test', with_links=False,
+            timestamp=before)
+        assert n_rows_at == n_rows
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+    # only the submission leaving the leaderboard is recorded
+    submission = (session_toy_db.query(Submission)
+                                .filter(Submission.is_public_leaderboard)
+                                .first())
+    set_submission_state(session_toy_db, submission.id, 'training_error')
+    try:
+        update_leaderboards(session_toy_db, 'iris_test')
+        snapshot = (session_toy_db.query(LeaderboardSnapshot)
+                                  .filter_by(event_id=event.id)
+                                  .order_by(LeaderboardSnapshot.id.desc())
+                                  .first())
+        assert snapshot.n_changes == 1
+        after = snapshot.timestamp
+        df_before = get_leaderboard_at(session_toy_db, 'iris_test', before,
+                                       with_links=False)
+        df_after = get_leaderboard_at(session_toy_db, 'iris_test', after,
+                                      with_links=False)
+        key = (submission.event_team.team.name, submission.name)
+        assert key in zip(df_before['team'], df_before['submission'])
+        assert key not in zip(df_after['team'], df_after['submission'])
+        assert len(df_after) == len(df_before) - 1
+    finally:
+        set_submission_state(session_toy_db, submission.id, 'scored')
+        update_leaderboards(session_toy_db, 'iris_test')
+
+    # the submission is back in the latest snapshot
+    df = get_leaderboard_at(session_toy_db, 'iris_test',
+                            datetime.datetime.utcnow(), with_links=False)
+    pd.testing.assert_frame_equal(df, df_before)
+    assert get_leaderboard_at(session_toy_db, 'iris_test',
+                              datetime.datetime(2000, 1, 1)) is None
+    assert get_leaderboard_page(session_toy_db, 'public', 'iris_test',
+                                timestamp=datetime.datetime(2000, 1, 1)) == (
+        None, 0)
+    with pytest.raises(ValueError, match='not recorded by the snapshots'):
+        get_leaderboard_at(session_toy_db, 'iris_test', before, 'failed')
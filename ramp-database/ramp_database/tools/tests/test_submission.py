@@ -3,6 +3,9 @@ import os
 import shutil
 
 import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import event as sqlalchemy_event
+from sqlalchemy.orm import sessionmaker
 
 import numpy as np
 from numpy.testing import assert_allclose
@@ -23,6 +26,7 @@ from ramp_database.exceptions import UnknownStateError
 from ramp_database.model import Event
 from ramp_database.model import Model
 from ramp_database.model import Submission
+from ramp_database.model import SubmissionOnCVFold
 from ramp_database.model import SubmissionSimilarity
 from ramp_database.testing import add_events
 from ramp_database.testing import add_problems
@@ -30,6 +34,7 @@ from ramp_database.testing import add_users
 from ramp_database.testing import create_toy_db
 from ramp_database.testing import create_test_db
 from ramp_database.testing import ramp_config_iris
+from ramp_database.testing import setup_files_extension_type
 from ramp_database.testing import sign_up_teams_to_events
 from ramp_database.utils import setup_db
 from ramp_database.utils import session_scope
@@ -37,6 +42,7 @@ from ramp_database.utils import session_scope
 from ramp_database.tools.user import add_user_interaction
 from ramp_database.tools.user import get_user_by_name
 
+from ramp_database.tools import submission as submission_module
 from ramp_database.tools.submission import add_submission
 from ramp_database.tools.submission import add_submission_similarity
 
@@ -50,6 +56,7 @@ from ramp_database.tools.submission import get_submission_by_name
 from ramp_database.tools.submission import get_submission_state
 from ramp_database.tools.submission import get_submission_error_msg
 from ramp_database.tools.submission import get_submission_max_ram
+from ramp_database.tools.submission import get_submission_memory_profile
 from ramp_database.tools.submission import get_submissions
 from ramp_database.tools.submission import get_time
 
@@ -58,7 +65,9 @@ from ramp_database.tools.submission import set_predictions
 from ramp_database.tools.submission import set_scores
 from ramp_database.tools.submission import set_submission_error_msg
 from ramp_database.tools.submission import set_submission_max_ram
+from ramp_database.tools.submission import set_submission_memory_profile
 from ramp_database.tools.submission import set_submission_state
+from ramp_database.tools.submission import set_submission_states
 from ramp_database.tools.submission import set_time
 
 from ramp_database.tools.submission import score_submission
@@ -150,6 +159,121 @@ def test_add_submission_create_new_submission(base_db):
     assert submission_file.extension == 'py'
     assert (os.path.join('submission_000000005',
                          'estimator.py') in submission_file.path)
+    # the CV folds and their scores were created
+    assert len(submission.on_cv_folds) == len(event.cv_folds)
+    for submission_on_cv_fold in submission.on_cv_folds:
+        assert submission_on_cv_fold.state == 'new'
+        assert submission_on_cv_fold.contributivity == 0
+        assert len(submission_on_cv_fold.scores) == len(event.score_types)
+        for score in submission_on_cv_fold.scores:
+            assert score.valid_score == score.event_score_type.worst
+
+
+@pytest.fixture
+def sqlite_db(tmpdir):
+    ramp_config = generate_ramp_config(read_config(ramp_config_template()))
+    deployment_dir = os.path.commonpath(
+        [ramp_config['ramp_kit_dir'], ramp_config['ramp_data_dir']]
+    )
+    shutil.rmtree(deployment_dir, ignore_errors=True)
+    os.makedirs(ramp_config['ramp_submissions_dir'])
+    db = create_engine('sqlite:///' + str(tmpdir.join('databoard.db')))
+    Model.metadata.create_all(db)
+    session = sessionmaker(db)()
+    try:
+        setup_files_extension_type(session)
+        yield session
+    finally:
+        session.close()
+        db.dispose()
+        shutil.rmtree(deployment_dir, ignore_errors=True)
+
+
+def test_add_submission_sqlite(sqlite_db):
+    # the CV folds are created without RETURNING, which SQLite does not
+    # support
+    session = sqlite_db
+    event_name, username = _setup_sign_up(session)
+    ramp_config = generate_ramp_config(read_config(ramp_config_template()))
+    path_submission = os.path.join(
+        os.path.dirname(ramp_config['ramp_sandbox_dir']),
+        'random_forest_10_10'
+    )
+    submission = add_submission(session, event_name, username,
+                                'random_forest_10_10', path_submission)
+    event = session.query(Event).filter(Event.name == event_name).one()
+    assert len(submission.on_cv_folds) == len(event.cv_folds)
+    for submission_on_cv_fold in submission.on_cv_folds:
+        assert len(submission_on_cv_fold.scores) == len(event.score_types)
+
+
+def test_add_submission_constant_statements(base_db):
+    # the number of statements to add a submission does not depend on the
+    # number of submissions of the event
+    session = base_db
+    event_name, username = _setup_sign_up(session)
+    ramp_config = generate_ramp_config(read_config(ramp_config_template()))
+    path_submission = os.path.join(
+        os.path.dirname(ramp_config['ramp_sandbox_dir']),
+        'random_forest_10_10'
+    )
+    event = session.query(Event).filter(Event.name == event_name).one()
+    event.min_duration_between_submissions = 0
+    session.commit()
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    n_statements = []
+    engine = session.get_bind()
+    for idx in range(4):
+        statements.clear()
+        session.expire_all()
+        sqlalchemy_event.listen(engine, 'before_cursor_execute',
+                                before_cursor_execute)
+        try:
+            add_submission(session, event_name, username,
+                           'submission_{}'.format(idx), path_submission)
+        finally:
+            sqlalchemy_event.remove(engine, 'before_cursor_execute',
+                                    before_cursor_execute)
+        n_statements.append(len(statements))
+    assert len(set(n_statements[1:])) == 1
+    assert event.n_submissions == 4
+
+
+def test_add_submission_shared_files(base_db):
+    # the submissions with the same files share them on disk
+    session = base_db
+    event_name, username = _setup_sign_up(session)
+    ramp_config = generate_ramp_config(read_config(ramp_config_template()))
+    path_submission = os.path.join(
+        os.path.dirname(ramp_config['ramp_sandbox_dir']),
+        'random_forest_10_10'
+    )
+    event = session.query(Event).filter(Event.name == event_name).one()
+    event.min_duration_between_submissions = 0
+    session.commit()
+    submissions = [
+        add_submission(session, event_name, username, name, path_submission)
+        for name in ['submission_1', 'submission_2']
+    ]
+    paths = [sub.files[0].path for sub in submissions]
+    assert os.stat(paths[0]).st_ino == os.stat(paths[1]).st_ino
+
+    # editing the code of a submission does not change the others
+    code = submissions[1].files[0].get_code()
+    submissions[0].files[0].set_code('# edited')
+    assert submissions[0].files[0].get_code() == '# edited'
+    assert submissions[1].files[0].get_code() == code
+
+    # the resubmitted files are linked again
+    add_submission(session, event_name, username, 'submission_1',
+                   path_submission)
+    assert submissions[0].files[0].get_code() == code
+    assert os.stat(paths[0]).st_ino == os.stat(paths[1]).st_ino
 
 
 def test_add_submission_too_early_submission(base_db):
@@ -303,6 +427,61 @@ def test_get_submissions(session_scope_module, state, expected_id):
         assert path_file in sub_path[0]
 
 
+def test_get_submissions_state_changed(session_scope_module, monkeypatch):
+    # a submission moved into the state while the submissions are queried,
+    # e.g. by the dispatcher, is ignored
+    session = session_scope_module
+    select_submission_ids_by_state = \
+        submission_module.select_submission_ids_by_state
+
+    def select_then_change_state(session, event_name, state):
+        submissions = select_submission_ids_by_state(session, event_name,
+                                                     state)
+        set_submission_state(session, 1, 'new')
+        return submissions
+
+    monkeypatch.setattr(submission_module, 'select_submission_ids_by_state',
+                        select_then_change_state)
+    try:
+        submissions = get_submissions(session, 'iris_test', state='new')
+    finally:
+        set_submission_state(session, 1, 'trained')
+    assert 1 not in [sub_id for sub_id, _, _ in submissions]
+    assert all(files for _, _, files in submissions)
+
+
+@pytest.mark.parametrize("lightweight", [False, True])
+def test_get_submissions_statements(session_scope_module, lightweight):
+    # the submissions and their files are fetched in a constant number of
+    # statements, without loading the submissions
+    session = session_scope_module
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    session.expire_all()
+    engine = session.get_bind()
+    sqlalchemy_event.listen(engine, 'before_cursor_execute',
+                            before_cursor_execute)
+    try:
+        submissions = get_submissions(session, 'iris_test', state=None,
+                                      lightweight=lightweight)
+    finally:
+        sqlalchemy_event.remove(engine, 'before_cursor_execute',
+                                before_cursor_execute)
+    assert len(submissions) > 2
+    assert len(statements) == (1 if lightweight else 2)
+
+    for sub_info in submissions:
+        sub = get_submission_by_id(session, sub_info[0])
+        assert sub_info[1] == sub.basename
+        if lightweight:
+            assert len(sub_info) == 2
+        else:
+            assert sub_info[2] == [f.path for f in sub.files]
+
+
 def test_get_submission_unknown_state(session_scope_module):
     with pytest.raises(UnknownStateError, match='Unrecognized state'):
         get_submissions(session_scope_module, 'iris_test', state='whatever')
@@ -346,6 +525,36 @@ def test_set_submission_state_unknown_state(session_scope_module):
         set_submission_state(session_scope_module, 2, 'unknown')
 
 
+def test_set_submission_states(session_scope_module):
+    session = session_scope_module
+    submission_ids = [5, 6, 7]
+    submissions = [get_submission_by_id(session, sub_id)
+                   for sub_id in submission_ids]
+    assert all(sub.sent_to_training_timestamp is None for sub in submissions)
+    try:
+        n_submissions = set_submission_states(session, submission_ids,
+                                              'sent_to_training')
+        assert n_submissions == len(submission_ids)
+        # the instances loaded in the session are up to date
+        for sub in submissions:
+            assert sub.state == 'sent_to_training'
+            assert sub.sent_to_training_timestamp is not None
+            assert sub.training_timestamp is None
+            assert all(cv_fold.state == 'sent_to_training'
+                       for cv_fold in sub.on_cv_folds)
+        assert get_submission_state(session, 8) == 'new'
+
+        set_submission_states(session, submission_ids, 'training')
+        for sub in submissions:
+            assert get_submission_state(session, sub.id) == 'training'
+            assert sub.training_timestamp is not None
+    finally:
+        set_submission_states(session, submission_ids, 'new')
+    assert set_submission_states(session, [], 'new') == 0
+    with pytest.raises(UnknownStateError, match='Unrecognized state'):
+        set_submission_states(session, submission_ids, 'unknown')
+
+
 def test_check_time(session_scope_module):
     # check both set_time and get_time function
     submission_id = 1
@@ -401,14 +610,16 @@ def test_check_bagged_scores(session_scope_module):
     assert_frame_equal(scores, expected_df, check_less_precise=True)
 
 
-def test_check_predictions(session_scope_module):
+def test_check_predictions(session_scope_module, tmpdir):
     # check both set_predictions and get_predictions
     submission_id = 1
-    path_results = os.path.join(HERE, 'data', 'iris_predictions')
+    path_data = os.path.join(HERE, 'data', 'iris_predictions')
+    path_results = os.path.join(str(tmpdir), 'iris_predictions')
+    shutil.copytree(path_data, path_results)
     set_predictions(session_scope_module, submission_id, path_results)
     predictions = get_predictions(session_scope_module, submission_id)
     for fold_idx in range(2):
-        path_fold = os.path.join(path_results, 'fold_{}'.format(fold_idx))
+        path_fold = os.path.join(path_data, 'fold_{}'.format(fold_idx))
         expected_y_pred_train = np.load(
             os.path.join(path_fold, 'y_pred_train.npz')
         )['y_pred']
@@ -419,6 +630,51 @@ def test_check_predictions(session_scope_module):
                         expected_y_pred_train)
         assert_allclose(predictions.loc[fold_idx, 'y_pred_test'],
                         expected_y_pred_test)
+        # the predictions are memory-mapped from the .npy files replacing
+        # the .npz files
+        assert isinstance(predictions.loc[fold_idx, 'y_pred_train'],
+                          np.memmap)
+        assert isinstance(predictions.loc[fold_idx, 'y_pred_test'],
+                          np.memmap)
+        path_fold = os.path.join(path_results, 'fold_{}'.format(fold_idx))
+        assert sorted(name for name in os.listdir(path_fold)
+                      if name.startswith('y_pred')) == ['y_pred_test.npy',
+                                                        'y_pred_train.npy']
+
+    # the predictions are stored again when the files were already converted
+    set_predictions(session_scope_module, submission_id, path_results)
+    predictions = get_predictions(session_scope_module, submission_id)
+    assert_allclose(predictions.loc[0, 'y_pred_train'],
+                    np.load(os.path.join(path_results, 'fold_0',
+                                         'y_pred_train.npy')))
+
+    # the predictions stored in the database are still loaded
+    cv_fold = (session_scope_module.query(SubmissionOnCVFold)
+                                   .filter_by(submission_id=submission_id)
+                                   .order_by(SubmissionOnCVFold.id)
+                                   .first())
+    cv_fold.full_train_y_pred = np.array(expected_y_pred_train)
+    session_scope_module.commit()
+    assert cv_fold.full_train_y_pred_path is None
+    predictions = get_predictions(session_scope_module, submission_id)
+    assert not isinstance(predictions.loc[0, 'y_pred_train'], np.memmap)
+    assert_allclose(predictions.loc[0, 'y_pred_train'],
+                    expected_y_pred_train)
+
+
+def test_set_predictions_object_array(session_scope_module, tmpdir):
+    # the predictions are written by the code of the participants and are
+    # never unpickled
+    submission_id = 1
+    path_results = os.path.join(str(tmpdir), 'iris_predictions')
+    shutil.copytree(os.path.join(HERE, 'data', 'iris_predictions'),
+                    path_results)
+    path_npz = os.path.join(path_results, 'fold_0', 'y_pred_train.npz')
+    np.savez(path_npz, y_pred=np.array([object()], dtype=object))
+    with pytest.raises(ValueError, match='array of Python objects'):
+        set_predictions(session_scope_module, submission_id, path_results)
+    session_scope_module.rollback()
+    assert os.path.isfile(path_npz)
 
 
 def test_check_submission_max_ram(session_scope_module):
@@ -430,6 +686,25 @@ def test_check_submission_max_ram(session_scope_module):
     assert amount_ram == pytest.approx(expected_ram)
 
 
+def test_check_submission_memory_profile(session_scope_module):
+    # check both get_submission_memory_profile and
+    # set_submission_memory_profile
+    submission_id = 2
+    assert get_submission_memory_profile(
+        session_scope_module, submission_id) is None
+    timestamps = [0., 0.5, 1.]
+    memory = [50., 120., 80.]
+    set_submission_memory_profile(session_scope_module, submission_id,
+                                  timestamps, memory)
+    memory_profile = get_submission_memory_profile(session_scope_module,
+                                                   submission_id)
+    assert memory_profile.shape == (2, 3)
+    assert_allclose(memory_profile, [timestamps, memory])
+    # the peak of the profile gives the max amount of RAM
+    amount_ram = get_submission_max_ram(session_scope_module, submission_id)
+    assert amount_ram == pytest.approx(120.)
+
+
 def test_check_submission_error_msg(session_scope_module):
     # check both get_submission_error_msg and set_submission_error_msg
     submission_id = 1
@@ -441,7 +716,7 @@ def test_check_submission_error_msg(session_scope_module):
 
 
 @pytest.mark.filterwarnings('ignore:F-score is ill-defined and being set')
-def test_score_submission(session_scope_module):
+def test_score_submission(session_scope_module, tmpdir):
     submission_id = 9
     multi_index = pd.MultiIndex.from_product(
         [[0, 1], ['train', 'valid', 'test']], names=['fold', 'step']
@@ -453,7 +728,9 @@ def test_score_submission(session_scope_module):
          'f1_70': [0.333333, 0.33333, 0.666667, 0.33333, 0.33333, 0.666667]},
         index=multi_index
     )
-    path_results = os.path.join(HERE, 'data', 'iris_predictions')
+    path_results = os.path.join(str(tmpdir), 'iris_predictions')
+    shutil.copytree(os.path.join(HERE, 'data', 'iris_predictions'),
+                    path_results)
     with pytest.raises(ValueError, match='Submission state must be "tested"'):
         score_submission(session_scope_module, submission_id)
     set_submission_state(session_scope_module, submission_id, 'tested')
@@ -488,6 +765,32 @@ def test_get_source_submission(session_scope_module):
     assert submissions
     assert all([sub.event_team.event.name == event.name
                 for sub in submissions])
+    # case 3: a submission looked at several times is listed once, and the
+    # submissions are selected in a single statement
+    add_user_interaction(
+        session_scope_module, user=user, interaction='looking at submission',
+        event=event, submission=get_submission_by_id(session_scope_module, 2)
+    )
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = session_scope_module.get_bind()
+    sqlalchemy_event.listen(engine, 'before_cursor_execute',
+                            before_cursor_execute)
+    try:
+        submissions = get_source_submissions(session_scope_module,
+                                             submission_id)
+    finally:
+        sqlalchemy_event.remove(engine, 'before_cursor_execute',
+                                before_cursor_execute)
+    # the submission itself and its source submissions
+    assert len(statements) == 2
+    assert get_submission_by_id(session_scope_module, 2) in submissions
+    assert len(submissions) == len(set(submissions))
+    timestamps = [sub.submission_timestamp for sub in submissions]
+    assert timestamps == sorted(timestamps, reverse=True)
 
 
 def test_add_submission_similarity(session_scope_module):
@@ -4,18 +4,98 @@ the RAMP database.
 """
 
 from contextlib import contextmanager
+import os
+import threading
 
 import bcrypt
 
 from sqlalchemy import create_engine
+from sqlalchemy import inspect
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine.url import URL
 
 from .model import Model
 
 
+# the options of the pool of connections which can be given in the
+# configuration, along with the information to connect to the database
+POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle',
+                'pool_pre_ping')
+
+# the engines, and their pools of connections, shared by the process
+_ENGINES = {}
+_ENGINES_PID = None
+_ENGINES_LOCK = threading.Lock()
+# pools inherited from the parent process, kept referenced such that their
+# connections are never closed (nor garbage collected) by a forked process
+_INHERITED_POOLS = []
+
+
+def get_engine(config):
+    """Get the sqlalchemy engine and session connected to a database.
+
+    The engines are created once per configuration and process, and then
+    shared, such that the connections to a database are pooled. The schema of
+    the database is not created: use :func:`setup_db` for this purpose.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration file containing the information to connect to the
+        dataset. If you are using the configuration provided by ramp, it
+        corresponds to the the `sqlalchemy` key. The options of the pool of
+        connections, i.e. `pool_size`, `max_overflow`, `pool_timeout`,
+        `pool_recycle` and `pool_pre_ping`, can be given as well.
+
+    Returns
+    -------
+    db : :class:`sqlalchemy.Engine`
+        The engine to connect to the database.
+    Session : :class:`sqlalchemy.orm.Session`
+        Configured Session class which can later be used to communicate with
+        the database.
+    """
+    global _ENGINES_PID
+    key = tuple(sorted(config.items()))
+    with _ENGINES_LOCK:
+        # the connections cannot be shared with a forked process: the
+        # inherited engines get a new pool while the pool of the parent is
+        # kept untouched, since closing its connections would close the
+        # sessions of the parent
+        if _ENGINES_PID != os.getpid():
+            for db, _ in _ENGINES.values():
+                _INHERITED_POOLS.append(db.pool)
+                db.pool = db.pool.recreate()
+            _ENGINES_PID = os.getpid()
+        if key not in _ENGINES:
+            # create the URL from the configuration
+            db_url = URL(**{name: value for name, value in config.items()
+                            if name not in POOL_OPTIONS})
+            db = create_engine(
+                db_url, **{name: value for name, value in config.items()
+                           if name in POOL_OPTIONS}
+            )
+            _ENGINES[key] = db, sessionmaker(db)
+        return _ENGINES[key]
+
+
+def dispose_engines():
+    """Close the connections of the engines shared by the process.
+
+    The engines are created again by :func:`get_engine` when needed.
+    """
+    with _ENGINES_LOCK:
+        for db, _ in _ENGINES.values():
+            db.dispose()
+        _ENGINES.clear()
+
+
 def setup_db(config):
-    """Create a sqlalchemy engine and session to interact with the database.
+    """Create the tables of the database and connect to it.
+
+    The tables are created if they do not exist yet. The existing tables are
+    left unchanged: use :func:`upgrade_db` to add the missing columns and
+    indexes.
 
     Parameters
     ----------
@@ -32,20 +112,76 @@ def setup_db(config):
         Configured Session class which can later be used to communicate with
         the database.
     """
-    # create the URL from the configuration
-    db_url = URL(**config)
-    db = create_engine(db_url)
-    Session = sessionmaker(db)
+    db, Session = get_engine(config)
     # Link the relational model to the database
     Model.metadata.create_all(db)
 
     return db, Session
 
 
+def upgrade_db(config):
+    """Add the tables, columns and indexes missing from a database.
+
+    :func:`setup_db` creates the missing tables but leaves the existing tables
+    unchanged. The columns and the indexes declared by the model and missing
+    from the existing tables are added: nothing is dropped or altered, such
+    that the upgrade can be run several times.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration file containing the information to connect to the
+        dataset. If you are using the configuration provided by ramp, it
+        corresponds to the the `sqlalchemy` key.
+
+    Returns
+    -------
+    changes : list of str
+        The description of the columns and indexes which were added.
+    """
+    db, _ = setup_db(config)
+    inspector = inspect(db)
+    preparer = db.dialect.identifier_preparer
+    changes = []
+    with db.begin() as conn:
+        for table in Model.metadata.sorted_tables:
+            columns = {column['name']
+                       for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                if not column.nullable:
+                    raise ValueError(
+                        'The column {}.{} is not nullable and cannot be '
+                        'added to the existing rows.'
+                        .format(table.name, column.name)
+                    )
+                conn.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    preparer.format_table(table),
+                    preparer.format_column(column),
+                    column.type.compile(dialect=db.dialect)
+                ))
+                changes.append('Added the column {}.{}'
+                               .format(table.name, column.name))
+            indexes = {index['name']
+                       for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda x: x.name):
+                if index.name in indexes:
+                    continue
+                index.create(conn)
+                changes.append('Added the index {} on {}'
+                               .format(index.name, table.name))
+    return changes
+
+
 @contextmanager
 def session_scope(config):
     """Connect to a database and provide a session to make some operation.
 
+    The connection is taken from the pool of the engine shared by the process,
+    see :func:`get_engine`. The tables of the database should have been
+    created beforehand with :func:`setup_db`.
+
     Parameters
     ----------
     config : dict
@@ -58,7 +194,7 @@ def session_scope(config):
     session : :class:`sqlalchemy.orm.Session`
         The session to directly perform the operation on the database.
     """
-    db, Session = setup_db(config)
+    db, Session = get_engine(config)
     with db.connect() as conn:
         session = Session(bind=conn)
         try:
@@ -36,6 +36,7 @@ INSTALL_REQUIRES = ['bcrypt', 'click', 'gitpython', 'nbconvert', 'numpy',
                     'pandas', 'psycopg2-binary', 'sqlalchemy']
 EXTRAS_REQUIRE = {
     'tests': ['pytest', 'pytest-cov'],
+    'export': ['pyarrow'],
     'docs': ['sphinx', 'sphinx_rtd_theme', 'numpydoc']
 }
 PACKAGE_DATA = {
@@ -1,15 +1,22 @@
 from __future__ import print_function, absolute_import, unicode_literals
 import os
+import io
+import json
 import time
+import hashlib
 import logging
 import subprocess
 import re
 import codecs
+import tarfile
 
 # amazon api
 import botocore  # noqa
 import boto3
 
+from . import memory_profile
+from .transport import BaseTransport
+
 
 __all__ = [
     'launch_ec2_instances',
@@ -17,8 +24,10 @@ __all__ = [
     'list_ec2_instance_ids',
     'status_of_ec2_instance',
     'upload_submission',
+    'stage_ramp_kit',
     'download_log',
     'download_predictions',
+    'download_memory_profile',
     'launch_train',
     'abort_training',
 ]
@@ -52,6 +61,13 @@ CHECK_FINISHED_TRAINING_INTERVAL_SECS_FIELD = (
 LOCAL_LOG_FOLDER_FIELD = 'logs_dir'
 TRAIN_LOOP_INTERVAL_SECS_FIELD = 'train_loop_interval_secs'
 MEMORY_PROFILING_FIELD = 'memory_profiling'
+MAX_CONCURRENT_TRANSFERS_FIELD = 'max_concurrent_transfers'
+STAGE_RAMP_KIT_FIELD = 'stage_ramp_kit'
+TRANSPORT_FIELD = 'transport'
+INSTANCE_VCPUS_FIELD = 'instance_vcpus'
+INSTANCE_MEMORY_FIELD = 'instance_memory'
+SUBMISSION_VCPUS_FIELD = 'submission_vcpus'
+SUBMISSION_MEMORY_FIELD = 'submission_memory'
 
 HOOKS_SECTION = 'hooks'
 HOOK_START_TRAINING = 'start_training'
@@ -81,14 +97,34 @@ ALL_FIELDS = [
     LOCAL_LOG_FOLDER_FIELD,
     TRAIN_LOOP_INTERVAL_SECS_FIELD,
     MEMORY_PROFILING_FIELD,
+    MAX_CONCURRENT_TRANSFERS_FIELD,
+    STAGE_RAMP_KIT_FIELD,
+    TRANSPORT_FIELD,
+    INSTANCE_VCPUS_FIELD,
+    INSTANCE_MEMORY_FIELD,
+    SUBMISSION_VCPUS_FIELD,
+    SUBMISSION_MEMORY_FIELD,
     HOOKS_SECTION,
 ]
 ALL_FIELDS = set(ALL_FIELDS)
-REQUIRED_FIELDS = ALL_FIELDS - {HOOKS_SECTION}
+REQUIRED_FIELDS = ALL_FIELDS - {
+    HOOKS_SECTION, MAX_CONCURRENT_TRANSFERS_FIELD, STAGE_RAMP_KIT_FIELD,
+    TRANSPORT_FIELD, INSTANCE_VCPUS_FIELD, INSTANCE_MEMORY_FIELD,
+    SUBMISSION_VCPUS_FIELD, SUBMISSION_MEMORY_FIELD
+}
 
 # constants
 RAMP_AWS_BACKEND_TAG = 'ramp_aws_backend_instance'
 SUBMISSIONS_FOLDER = 'submissions'
+DATA_FOLDER = 'data'
+RAMP_KIT_HASH_FILENAME = '.ramp_kit_hash'
+MEMORY_PROFILE_FILENAME = 'memory_profile.json'
+# folders of the ramp-kit which are not staged on the instances
+RAMP_KIT_EXCLUDED_FOLDERS = ('.git', SUBMISSIONS_FOLDER, DATA_FOLDER)
+
+# cache of the content hash of the staged folders, keyed by the folders and
+# invalidated when the size or modification time of a file changes
+_FOLDER_HASH_CACHE = {}
 
 
 def _wait_until_train_finished(config, instance_id, submission_name):
@@ -123,64 +159,12 @@ def launch_ec2_instances(config, nb=1):
     if ami_name:
         ami_image_id = _get_image_id(config, ami_name)
 
-    instance_type = config[INSTANCE_TYPE_FIELD]
-    key_name = config[KEY_NAME_FIELD]
-    security_group = config[SECURITY_GROUP_FIELD]
-
     logger.info('Launching {} new ec2 instance(s)...'.format(nb))
-
-    # tag all instances using RAMP_AWS_BACKEND_TAG to be able
-    # to list all instances later
-    tags = [{
-        'ResourceType': 'instance',
-        'Tags': [
-            {'Key': RAMP_AWS_BACKEND_TAG, 'Value': '1'},
-        ]
-    }]
-    sess = _get_boto_session(config)
-    client = sess.client('ec2')
-    resource = sess.resource('ec2')
-    instances = resource.create_instances(
-        ImageId=ami_image_id,
-        MinCount=nb,
-        MaxCount=nb,
-        InstanceType=instance_type,
-        KeyName=key_name,
-        TagSpecifications=tags,
-        SecurityGroups=[security_group],
-    )
-    # Wait until AMI is okay
-    waiter = client.get_waiter('instance_status_ok')
-    try:
-        waiter.wait(InstanceIds=[instance.id for instance in instances])
-    except botocore.exceptions.WaiterError:
-        return None
-    return instances
+    return _get_transport(config).launch_instances(config, ami_image_id, nb)
 
 
 def _get_image_id(config, image_name):
-    sess = _get_boto_session(config)
-    client = sess.client('ec2')
-    result = client.describe_images(Filters=[
-        {
-            'Name': 'name',
-            'Values': [
-                image_name
-            ]
-        }
-    ])
-    images = result['Images']
-    if len(images) == 0:
-        raise ValueError(
-            'No image corresponding to the name "{}"'.format(image_name))
-    elif len(images) > 1:
-        raise ValueError(
-            'Multiple images corresponding to the name "{}".'
-            ' Please fix that'.format(image_name))
-    else:
-        image = images[0]
-        image_id = image['ImageId']
-        return image_id
+    return _get_transport(config).get_image_id(config, image_name)
 
 
 def terminate_ec2_instance(config, instance_id):
@@ -196,10 +180,8 @@ def terminate_ec2_instance(config, instance_id):
     instance_id : str
         instance id
     """
-    sess = _get_boto_session(config)
-    resource = sess.resource('ec2')
     logger.info('Killing the instance {}...'.format(instance_id))
-    return resource.instances.filter(InstanceIds=[instance_id]).terminate()
+    return _get_transport(config).terminate_instance(config, instance_id)
 
 
 def list_ec2_instance_ids(config):
@@ -217,19 +199,7 @@ def list_ec2_instance_ids(config):
 
     list of str
     """
-    sess = _get_boto_session(config)
-    client = sess.client('ec2')
-    instances = client.describe_instances(
-        Filters=[
-            {'Name': 'tag:' + RAMP_AWS_BACKEND_TAG, 'Values': ['1']},
-            {'Name': 'instance-state-name', 'Values': ['running']},
-        ]
-    )
-    instance_ids = [
-        inst['Instances'][0]['InstanceId']
-        for inst in instances['Reservations']
-    ]
-    return instance_ids
+    return _get_transport(config).list_instance_ids(config)
 
 
 def status_of_ec2_instance(config, instance_id):
@@ -252,14 +222,7 @@ def status_of_ec2_instance(config, instance_id):
     if can return None if the instance has just been launched and is
     not even ready to give the status.
     """
-    sess = _get_boto_session(config)
-    client = sess.client('ec2')
-    responses = client.describe_instance_status(
-        InstanceIds=[instance_id])['InstanceStatuses']
-    if len(responses) == 1:
-        return responses[0]
-    else:
-        return None
+    return _get_transport(config).instance_status(config, instance_id)
 
 
 def upload_submission(config, instance_id, submission_name,
@@ -282,7 +245,100 @@ def upload_submission(config, instance_id, submission_name,
     submission_path = os.path.join(submissions_dir, submission_name)
     ramp_kit_folder = config[REMOTE_RAMP_KIT_FOLDER_FIELD]
     dest_folder = os.path.join(ramp_kit_folder, SUBMISSIONS_FOLDER)
-    return _upload(config, instance_id, submission_path, dest_folder)
+    return _upload_archive(config, instance_id, submission_path, dest_folder)
+
+
+def stage_ramp_kit(config, instance_id, kit_dir, data_dir):
+    """
+    Stage the ramp-kit and the data of an event on an ec2 instance.
+    The content of the kit and the data is hashed and the hash is stored
+    on the instance once the synchronisation succeeded. The synchronisation
+    is skipped when the instance already holds the same content.
+
+    Parameters
+    ----------
+
+    config : dict
+        configuration
+
+    instance_id : str
+        instance id
+
+    kit_dir : str
+        local folder of the ramp-kit
+
+    data_dir : str
+        local folder of the ramp-data. The files in its `data` folder are
+        staged in the `data` folder of the remote ramp-kit.
+
+    Returns
+    -------
+
+    the exit status of the synchronisation
+    """
+    ramp_kit_folder = config[REMOTE_RAMP_KIT_FOLDER_FIELD]
+    local_data_folder = os.path.join(data_dir, DATA_FOLDER)
+    content_hash = _compute_folder_hash(kit_dir, local_data_folder,
+                                        exclude=RAMP_KIT_EXCLUDED_FOLDERS)
+    hash_path = os.path.join(ramp_kit_folder, RAMP_KIT_HASH_FILENAME)
+    cmd = 'cat {} 2>/dev/null || true'.format(hash_path)
+    remote_hash = _run(config, instance_id, cmd, return_output=True)
+    if remote_hash.decode('utf-8').strip() == content_hash:
+        logger.info('The ramp-kit is already staged on instance "{}"'
+                    .format(instance_id))
+        return 0
+
+    logger.info('Staging the ramp-kit on instance "{}"..'.format(instance_id))
+    # the folders are excluded at the top level only, as in the hash, and
+    # the excluded folders of the remote ramp-kit, e.g. the submissions, are
+    # not removed by --delete
+    excluded = ' '.join('--exclude /' + folder
+                        for folder in RAMP_KIT_EXCLUDED_FOLDERS)
+    exit_status = _upload(config, instance_id, kit_dir.rstrip('/') + '/',
+                          ramp_kit_folder, options='--delete ' + excluded)
+    if exit_status != 0:
+        return exit_status
+    exit_status = _upload(config, instance_id, local_data_folder + '/',
+                          os.path.join(ramp_kit_folder, DATA_FOLDER),
+                          options='--delete')
+    if exit_status != 0:
+        return exit_status
+    cmd = 'mkdir -p {} && echo {} > {}'.format(
+        os.path.join(ramp_kit_folder, SUBMISSIONS_FOLDER), content_hash,
+        hash_path)
+    return _run(config, instance_id, cmd)
+
+
+def _compute_folder_hash(*folders, exclude=()):
+    """
+    Compute a hash of the relative paths and content of the files
+    contained in `folders`. The sub-folders named in `exclude` are ignored.
+    """
+    files = []
+    for folder_idx, folder in enumerate(folders):
+        for root, dirs, filenames in os.walk(folder):
+            dirs[:] = sorted(d for d in dirs
+                             if not (root == folder and d in exclude))
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                stat = os.stat(path)
+                files.append((folder_idx, os.path.relpath(path, folder),
+                              stat.st_size, stat.st_mtime))
+    key = (folders, tuple(exclude))
+    cached = _FOLDER_HASH_CACHE.get(key)
+    if cached is not None and cached[0] == files:
+        return cached[1]
+
+    sha = hashlib.sha256()
+    for folder_idx, relative_path, _, _ in files:
+        sha.update('{}:{}'.format(folder_idx, relative_path).encode('utf-8'))
+        path = os.path.join(folders[folder_idx], relative_path)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+    content_hash = sha.hexdigest()
+    _FOLDER_HASH_CACHE[key] = (files, content_hash)
+    return content_hash
 
 
 def download_log(config, instance_id, submission_name, folder=None):
@@ -396,13 +452,73 @@ def _get_submission_max_ram(config, submission_name):
     dest_path = os.path.join(
         config[LOCAL_LOG_FOLDER_FIELD], submission_name)
     filename = os.path.join(dest_path, 'mprof.dat')
-    max_mem = 0.
-    for line in codecs.open(filename, encoding='utf-8').readlines()[1:]:
-        _, mem, _ = line.split()
-        max_mem = max(max_mem, float(mem))
+    # the file is read line by line to not load it entirely in memory
+    with codecs.open(filename, encoding='utf-8') as f:
+        max_mem, _, _ = memory_profile.reduce_memory_profile(f)
     return max_mem
 
 
+def download_memory_profile(config, instance_id, submission_name,
+                            folder=None,
+                            n_points=memory_profile.DEFAULT_N_POINTS):
+    """
+    Compute the peak and a downsampled series of the memory used by a
+    submission directly on an ec2 instance and store them in a JSON file
+    in a local folder `folder`. Contrary to `download_mprof_data`, only the
+    reduced profile is transferred.
+    If `folder` is not given, then the file is stored in the predictions
+    folder of the submission, given by the value in config corresponding to
+    `LOCAL_PREDICTIONS_FOLDER_FIELD`.
+    IMPORTANT: memory_profiler >= 0.52.0 should be installed in the
+    remote instances.
+
+    Parameters
+    ----------
+
+    config : dict
+        configuration
+
+    instance_id : str
+        instance id
+
+    submission_name : str
+        submission name
+
+    folder : str or None
+        folder where to store the memory profile
+
+    n_points : int
+        maximum number of points of the downsampled series
+
+    Returns
+    -------
+
+    dict with the peak memory in MB (`max_ram`), and the downsampled series
+    (`timestamps` in seconds and `memory` in MB)
+    """
+    ramp_kit_folder = config[REMOTE_RAMP_KIT_FOLDER_FIELD]
+    source_path = os.path.join(
+        ramp_kit_folder,
+        SUBMISSIONS_FOLDER,
+        submission_name,
+        'mprof.dat')
+    # the reduction is implemented in a module depending only on the standard
+    # library such that its source can be executed remotely
+    with codecs.open(memory_profile.__file__, encoding='utf-8') as f:
+        script = f.read().encode('utf-8')
+    cmd = 'python - {} {}'.format(source_path, n_points)
+    output = _run(config, instance_id, cmd, return_output=True, input=script)
+    profile = json.loads(output.decode('utf-8'))
+    if folder is None:
+        folder = os.path.join(
+            config[LOCAL_PREDICTIONS_FOLDER_FIELD], submission_name)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(os.path.join(folder, MEMORY_PROFILE_FILENAME), 'w') as f:
+        json.dump(profile, f)
+    return profile
+
+
 def download_predictions(config, instance_id, submission_name, folder=None):
     """
     Download the predictions from an ec2 instance into a local folder `folder`.
@@ -457,7 +573,7 @@ def _get_remote_training_output_folder(config, instance_id, submission_name):
     return path
 
 
-def launch_train(config, instance_id, submission_name):
+def launch_train(config, instance_id, submission_name, cpus=None):
     """
     Launch the training of a submission on an ec2 instance.
     A screen named `submission_folder_name` (see below)
@@ -472,6 +588,11 @@ def launch_train(config, instance_id, submission_name):
 
     submission_id : int
         submission id
+
+    cpus : list of int or None
+        the CPUs to which the training is bound, such that several
+        submissions can be trained concurrently on the same instance. If
+        None, the training can use all the CPUs of the instance.
     """
     ramp_kit_folder = config[REMOTE_RAMP_KIT_FOLDER_FIELD]
     values = {
@@ -493,6 +614,13 @@ def launch_train(config, instance_id, submission_name):
         run_cmd = (
             "mprof run --output={submission_folder}/mprof.dat "
             "--include-children " + run_cmd)
+    if cpus is not None:
+        # bind the training and its children to the CPUs and prevent the
+        # numerical libraries to start more threads than available CPUs
+        run_cmd = (
+            "OMP_NUM_THREADS={n_cpus} taskset -c {cpus} ".format(
+                n_cpus=len(cpus), cpus=','.join(str(cpu) for cpu in cpus))
+            + run_cmd)
     cmd = (
         "screen -dm -S {submission} sh -c '. ~/.profile;"
         "cd {ramp_kit_folder};"
@@ -527,7 +655,7 @@ def abort_training(config, instance_id, submission_name):
     return _run(config, instance_id, cmd)
 
 
-def _upload(config, instance_id, source, dest):
+def _upload(config, instance_id, source, dest, options=''):
     """
     Upload a file to an ec2 instance
 
@@ -542,14 +670,19 @@ def _upload(config, instance_id, source, dest):
 
     dest : str
         remote file or folder
+
+    options : str
+        additional options given to rsync
     """
-    dest = '{user}@{ip}:' + dest
-    return _rsync(config, instance_id, source, dest)
+    return _get_transport(config).upload(config, instance_id, source, dest,
+                                         options=options)
 
 
-def _download(config, instance_id, source, dest):
+def _upload_archive(config, instance_id, source, dest):
     """
-    Download a file from an ec2 instance
+    Upload a folder to an ec2 instance as a single compressed stream.
+    Contrary to `_upload`, a single connection is used whatever the number
+    of files in the folder.
 
     Parameters
     ----------
@@ -558,57 +691,47 @@ def _download(config, instance_id, source, dest):
         instance id
 
     source : str
-        remote file or folder
+        local folder
 
     dest : str
-        local file or folder
+        remote folder in which `source` will be extracted
+    """
+    archive = _make_archive(source)
+    cmd = 'mkdir -p {dest} && tar xzf - -C {dest}'.format(dest=dest)
+    return _run(config, instance_id, cmd, input=archive)
 
+
+def _make_archive(folder):
+    """
+    Return the content of a gzip compressed tar archive of `folder`.
     """
-    source = '{user}@{ip}:' + source
-    return _rsync(config, instance_id, source, dest)
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        archive.add(folder, arcname=os.path.basename(folder.rstrip('/')))
+    return buffer.getvalue()
 
 
-def _rsync(config, instance_id, source, dest):
+def _download(config, instance_id, source, dest):
     """
-    Run rsync from/to an ec2 instance
+    Download a file from an ec2 instance
 
     Parameters
     ----------
 
-    config : dict
-        configuration
-
     instance_id : str
         instance id
 
     source : str
-        source file or folder
+        remote file or folder
 
     dest : str
-        dest file or folder
+        local file or folder
 
     """
-    key_path = config[KEY_PATH_FIELD]
-    ami_username = config[AMI_USER_NAME_FIELD]
-
-    sess = _get_boto_session(config)
-    resource = sess.resource('ec2')
-    inst = resource.Instance(instance_id)
-    ip = inst.public_ip_address
-    fmt = {'user': ami_username, 'ip': ip}
-    values = {
-        'user': ami_username,
-        'ip': ip,
-        'cmd': "ssh -o 'StrictHostKeyChecking no' -i " + key_path,
-        'source': source.format(**fmt),
-        'dest': dest.format(**fmt),
-    }
-    cmd = "rsync -e \"{cmd}\" -avzP {source} {dest}".format(**values)
-    logger.debug(cmd)
-    return subprocess.call(cmd, shell=True)
+    return _get_transport(config).download(config, instance_id, source, dest)
 
 
-def _run(config, instance_id, cmd, return_output=False):
+def _run(config, instance_id, cmd, return_output=False, input=None):
     """
     Run a shell command remotely on an ec2 instance and
     return either the exit status if `return_output` is False
@@ -629,6 +752,9 @@ def _run(config, instance_id, cmd, return_output=False):
     return_output : bool
         whether to return the standard output
 
+    input : bytes or None
+        data sent to the standard input of the command
+
     Returns
     -------
 
@@ -637,25 +763,9 @@ def _run(config, instance_id, cmd, return_output=False):
     If `return_output` is False, then an int containing
     the exit status of the command.
     """
-    key_path = config[KEY_PATH_FIELD]
-    ami_username = config[AMI_USER_NAME_FIELD]
-
-    sess = _get_boto_session(config)
-    resource = sess.resource('ec2')
-    inst = resource.Instance(instance_id)
-    ip = inst.public_ip_address
-    values = {
-        'user': ami_username,
-        'ip': ip,
-        'ssh': "ssh -o 'StrictHostKeyChecking no' -i " + key_path,
-        'cmd': cmd,
-    }
-    cmd = "{ssh} {user}@{ip} \"{cmd}\"".format(**values)
-    logger.debug(cmd)
-    if return_output:
-        return subprocess.check_output(cmd, shell=True)
-    else:
-        return subprocess.call(cmd, shell=True)
+    return _get_transport(config).run(config, instance_id, cmd,
+                                      return_output=return_output,
+                                      input=input)
 
 
 def _is_ready(config, instance_id):
@@ -740,31 +850,198 @@ def _tag_instance_by_submission(config, instance_id, submission_name):
 
 
 def _add_or_update_tag(config, instance_id, key, value):
-    sess = _get_boto_session(config)
-    client = sess.client('ec2')
-    tags = [
-        {'Key': key, 'Value': value},
-    ]
-    return client.create_tags(Resources=[instance_id], Tags=tags)
+    return _get_transport(config).create_tags(config, instance_id,
+                                              {key: value})
 
 
 def _get_tags(config, instance_id):
-    sess = _get_boto_session(config)
-    client = sess.client('ec2')
-    filters = [
-        {'Name': 'resource-id', 'Values': [instance_id]}
-    ]
-    response = client.describe_tags(Filters=filters)
-    for t in response['Tags']:
-        t['Key'], t['Value']
-    return {t['Key']: t['Value'] for t in response['Tags']}
+    return _get_transport(config).describe_tags(config, instance_id)
 
 
 def _delete_tag(config, instance_id, key):
-    sess = _get_boto_session(config)
-    client = sess.client('ec2')
-    tags = [{'Key': key}]
-    return client.delete_tags(Resources=[instance_id], Tags=tags)
+    return _get_transport(config).delete_tags(config, instance_id, [key])
+
+
+class EC2Transport(BaseTransport):
+    """
+    Transport relying on boto3 to handle the ec2 instances and on ssh and
+    rsync to reach them.
+    """
+
+    def get_image_id(self, config, image_name):
+        sess = _get_boto_session(config)
+        client = sess.client('ec2')
+        result = client.describe_images(Filters=[
+            {
+                'Name': 'name',
+                'Values': [
+                    image_name
+                ]
+            }
+        ])
+        images = result['Images']
+        if len(images) == 0:
+            raise ValueError(
+                'No image corresponding to the name "{}"'.format(image_name))
+        elif len(images) > 1:
+            raise ValueError(
+                'Multiple images corresponding to the name "{}".'
+                ' Please fix that'.format(image_name))
+        else:
+            image = images[0]
+            image_id = image['ImageId']
+            return image_id
+
+    def launch_instances(self, config, image_id, nb):
+        instance_type = config[INSTANCE_TYPE_FIELD]
+        key_name = config[KEY_NAME_FIELD]
+        security_group = config[SECURITY_GROUP_FIELD]
+
+        # tag all instances using RAMP_AWS_BACKEND_TAG to be able
+        # to list all instances later
+        tags = [{
+            'ResourceType': 'instance',
+            'Tags': [
+                {'Key': RAMP_AWS_BACKEND_TAG, 'Value': '1'},
+            ]
+        }]
+        sess = _get_boto_session(config)
+        client = sess.client('ec2')
+        resource = sess.resource('ec2')
+        instances = resource.create_instances(
+            ImageId=image_id,
+            MinCount=nb,
+            MaxCount=nb,
+            InstanceType=instance_type,
+            KeyName=key_name,
+            TagSpecifications=tags,
+            SecurityGroups=[security_group],
+        )
+        # Wait until AMI is okay
+        waiter = client.get_waiter('instance_status_ok')
+        try:
+            waiter.wait(InstanceIds=[instance.id for instance in instances])
+        except botocore.exceptions.WaiterError:
+            return None
+        return instances
+
+    def terminate_instance(self, config, instance_id):
+        sess = _get_boto_session(config)
+        resource = sess.resource('ec2')
+        return resource.instances.filter(InstanceIds=[instance_id]).terminate()
+
+    def list_instance_ids(self, config):
+        sess = _get_boto_session(config)
+        client = sess.client('ec2')
+        instances = client.describe_instances(
+            Filters=[
+                {'Name': 'tag:' + RAMP_AWS_BACKEND_TAG, 'Values': ['1']},
+                {'Name': 'instance-state-name', 'Values': ['running']},
+            ]
+        )
+        instance_ids = [
+            inst['Instances'][0]['InstanceId']
+            for inst in instances['Reservations']
+        ]
+        return instance_ids
+
+    def instance_status(self, config, instance_id):
+        sess = _get_boto_session(config)
+        client = sess.client('ec2')
+        responses = client.describe_instance_status(
+            InstanceIds=[instance_id])['InstanceStatuses']
+        if len(responses) == 1:
+            return responses[0]
+        else:
+            return None
+
+    def create_tags(self, config, instance_id, tags):
+        sess = _get_boto_session(config)
+        client = sess.client('ec2')
+        tags = [{'Key': key, 'Value': value} for key, value in tags.items()]
+        return client.create_tags(Resources=[instance_id], Tags=tags)
+
+    def describe_tags(self, config, instance_id):
+        sess = _get_boto_session(config)
+        client = sess.client('ec2')
+        filters = [
+            {'Name': 'resource-id', 'Values': [instance_id]}
+        ]
+        response = client.describe_tags(Filters=filters)
+        return {t['Key']: t['Value'] for t in response['Tags']}
+
+    def delete_tags(self, config, instance_id, keys):
+        sess = _get_boto_session(config)
+        client = sess.client('ec2')
+        tags = [{'Key': key} for key in keys]
+        return client.delete_tags(Resources=[instance_id], Tags=tags)
+
+    def run(self, config, instance_id, cmd, return_output=False, input=None):
+        values = {
+            'user': config[AMI_USER_NAME_FIELD],
+            'ip': self._get_ip(config, instance_id),
+            'ssh': self._get_ssh(config),
+            'cmd': cmd,
+        }
+        cmd = "{ssh} {user}@{ip} \"{cmd}\"".format(**values)
+        logger.debug(cmd)
+        if return_output:
+            return subprocess.check_output(cmd, shell=True, input=input)
+        else:
+            return subprocess.run(cmd, shell=True, input=input).returncode
+
+    def upload(self, config, instance_id, source, dest, options=''):
+        dest = '{user}@{ip}:' + dest
+        return self._rsync(config, instance_id, source, dest, options)
+
+    def download(self, config, instance_id, source, dest, options=''):
+        source = '{user}@{ip}:' + source
+        return self._rsync(config, instance_id, source, dest, options)
+
+    def _rsync(self, config, instance_id, source, dest, options):
+        fmt = {
+            'user': config[AMI_USER_NAME_FIELD],
+            'ip': self._get_ip(config, instance_id),
+        }
+        values = {
+            'cmd': self._get_ssh(config),
+            'source': source.format(**fmt),
+            'dest': dest.format(**fmt),
+            'options': options,
+        }
+        cmd = "rsync -e \"{cmd}\" -avzP {options} {source} {dest}".format(
+            **values)
+        logger.debug(cmd)
+        return subprocess.call(cmd, shell=True)
+
+    @staticmethod
+    def _get_ip(config, instance_id):
+        sess = _get_boto_session(config)
+        resource = sess.resource('ec2')
+        return resource.Instance(instance_id).public_ip_address
+
+    @staticmethod
+    def _get_ssh(config):
+        return "ssh -o 'StrictHostKeyChecking no' -i " + config[KEY_PATH_FIELD]
+
+
+available_transports = {'ec2': EC2Transport}
+
+
+def _get_transport(config):
+    """
+    Get the transport to use given the configuration. The `transport` entry
+    can be either the name of a transport or an instance of
+    :class:`ramp_engine.aws.transport.BaseTransport`.
+    """
+    transport = config.get(TRANSPORT_FIELD, 'ec2')
+    if isinstance(transport, BaseTransport):
+        return transport
+    if transport not in available_transports:
+        raise ValueError(
+            'The transport "{}" is not available. Choose one of {}'
+            .format(transport, sorted(available_transports)))
+    return available_transports[transport]()
 
 
 def _get_boto_session(config):
@@ -841,3 +1118,14 @@ def validate_config(config):
                 raise ValueError(
                     'Invalid hook name : {}, hooks should be one of '
                     'these : {}'.format(hook_name, hook_names))
+    for instance_field, submission_field in (
+            (INSTANCE_VCPUS_FIELD, SUBMISSION_VCPUS_FIELD),
+            (INSTANCE_MEMORY_FIELD, SUBMISSION_MEMORY_FIELD)):
+        if submission_field in conf and instance_field not in conf:
+            raise ValueError(
+                'The field "{}" requires the field "{}" to be specified'
+                .format(submission_field, instance_field))
+        if conf.get(submission_field, 0) > conf.get(instance_field, 0):
+            raise ValueError(
+                'The field "{}" cannot be greater than the field "{}"'
+                .format(submission_field, instance_field))
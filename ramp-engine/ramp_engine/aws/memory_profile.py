@@ -0,0 +1,87 @@
+"""
+Streaming reduction of the memory profiles written by ``mprof run``.
+
+This module only depends on the Python standard library: its source is sent
+to the instances and executed there, such that only the reduced profile is
+downloaded instead of the full ``mprof.dat`` file.
+
+Usage on the instance::
+
+    python - <path to mprof.dat> [n_points] < memory_profile.py
+"""
+import json
+import sys
+
+DEFAULT_N_POINTS = 200
+
+
+def reduce_memory_profile(lines, n_points=DEFAULT_N_POINTS):
+    """Compute the peak and a downsampled series of a memory profile.
+
+    The lines are processed one at a time and at most ``n_points`` samples
+    are kept in memory. Each point of the series is the maximum memory used
+    during a time span: when the series is full, consecutive points are
+    merged pairwise, doubling the time span represented by each point.
+    Therefore, the peak of the series is the peak of the profile.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        The lines of a ``mprof.dat`` file. Only the ``MEM`` lines are used.
+    n_points : int, default=200
+        The maximum number of points of the downsampled series.
+
+    Returns
+    -------
+    max_ram : float
+        The peak memory in MB.
+    timestamps : list of float
+        The start of the time span of each point, in seconds from the first
+        sample.
+    memory : list of float
+        The maximum memory in MB during the time span of each point.
+    """
+    if n_points < 2:
+        raise ValueError('n_points should be at least 2. Got {} instead.'
+                         .format(n_points))
+    max_ram = 0.
+    start = None
+    series = []
+    bucket_size, bucket_count = 1, 0
+    for line in lines:
+        fields = line.split()
+        if len(fields) != 3 or fields[0] != 'MEM':
+            continue
+        mem, timestamp = float(fields[1]), float(fields[2])
+        if start is None:
+            start = timestamp
+        max_ram = max(max_ram, mem)
+        if bucket_count == 0:
+            series.append([timestamp - start, mem])
+        else:
+            series[-1][1] = max(series[-1][1], mem)
+        bucket_count += 1
+        if bucket_count == bucket_size:
+            bucket_count = 0
+            if len(series) == n_points:
+                merged = [[first[0], max(first[1], second[1])]
+                          for first, second in zip(series[::2], series[1::2])]
+                if len(series) % 2:
+                    merged.append(series[-1])
+                series = merged
+                bucket_size *= 2
+    timestamps = [timestamp for timestamp, _ in series]
+    memory = [mem for _, mem in series]
+    return max_ram, timestamps, memory
+
+
+def main(argv):
+    n_points = int(argv[2]) if len(argv) > 2 else DEFAULT_N_POINTS
+    with open(argv[1]) as f:
+        max_ram, timestamps, memory = reduce_memory_profile(f, n_points)
+    json.dump({'max_ram': max_ram, 'timestamps': timestamps,
+               'memory': memory}, sys.stdout)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,391 @@
+"""
+Local stand-in of Amazon EC2 and ssh which can be used to test and benchmark
+the AWS backend without an Amazon account.
+
+The instances are folders of the local disk in which the commands are
+executed using local subprocesses. The ``screen`` sessions used to train the
+submissions, the ``taskset`` command binding them to CPUs, and the
+``ramp_test_submission`` command are emulated by small scripts installed in
+each instance.
+"""
+import json
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from collections import namedtuple
+
+from .api import RAMP_AWS_BACKEND_TAG
+from .api import REMOTE_RAMP_KIT_FOLDER_FIELD
+from .transport import BaseTransport
+
+__all__ = ['FakeEC2Transport']
+
+FakeInstance = namedtuple('FakeInstance', ['id'])
+
+_SCREEN_SCRIPT = '''#!{python}
+import os
+import shlex
+import signal
+import subprocess
+import sys
+
+screens_dir = os.path.join(os.environ['HOME'], '.screens')
+os.makedirs(screens_dir, exist_ok=True)
+args = sys.argv[1:]
+if args[0] == '-ls':
+    for name in sorted(os.listdir(screens_dir)):
+        with open(os.path.join(screens_dir, name)) as f:
+            print('\\t{{}}.{{}}\\t(Detached)'.format(f.read().strip(), name))
+elif args[0] == '-dm':
+    # screen -dm -S name cmd...
+    name, cmd = args[2], args[3:]
+    path = os.path.join(screens_dir, name)
+    with open(path, 'w') as f:
+        f.write('0')
+    proc = subprocess.Popen(
+        ['sh', '-c', '"$@"; rm -f ' + shlex.quote(path), 'screen'] + cmd,
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    try:
+        # the file does not exist anymore if the command already finished
+        fd = os.open(path, os.O_WRONLY | os.O_TRUNC)
+    except OSError:
+        pass
+    else:
+        os.write(fd, str(proc.pid).encode())
+        os.close(fd)
+elif args[0] == '-S' and args[2:] == ['-X', 'quit']:
+    path = os.path.join(screens_dir, args[1])
+    if not os.path.exists(path):
+        sys.exit(1)
+    with open(path) as f:
+        pid = int(f.read())
+    if pid:
+        os.killpg(pid, signal.SIGTERM)
+    os.remove(path)
+'''
+
+# taskset -c <cpus> cmd...: the CPUs are recorded in the environment of the
+# command instead of being set
+_TASKSET_SCRIPT = '''#!/bin/sh
+export FAKE_TASKSET_CPUS="$2"
+shift 2
+exec "$@"
+'''
+
+_RAMP_TEST_SUBMISSION_SCRIPT = '''#!{python}
+import argparse
+import json
+import os
+import sys
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--submission')
+parser.add_argument('--save-y-preds', action='store_true')
+args = parser.parse_args()
+with open(os.path.join(os.environ['HOME'], '.fake_training.json')) as f:
+    settings = json.load(f)
+
+print('Training submissions/{{}} ...'.format(args.submission))
+if 'FAKE_TASKSET_CPUS' in os.environ:
+    print('CPUs: {{}}'.format(os.environ['FAKE_TASKSET_CPUS']))
+sys.stdout.flush()
+time.sleep(settings['train_duration'])
+if args.submission in settings['error_submissions']:
+    raise ValueError('Training of {{}} failed'.format(args.submission))
+for fold_idx in range(settings['n_folds']):
+    fold_dir = os.path.join('submissions', args.submission, 'training_output',
+                            'fold_{{}}'.format(fold_idx))
+    os.makedirs(fold_dir, exist_ok=True)
+    for name in ('y_pred_train.npz', 'y_pred_test.npz'):
+        with open(os.path.join(fold_dir, name), 'wb') as f:
+            f.write(os.urandom(settings['prediction_size']))
+print('----------------------------')
+print('Training submissions/{{}} done'.format(args.submission))
+'''
+
+
+class FakeEC2Transport(BaseTransport):
+    """Transport emulating EC2 and ssh on the local machine.
+
+    Each instance is a folder ``root_dir/<instance_id>`` which is used as the
+    home directory when running commands. The absolute path of the remote
+    ramp-kit is mapped inside this folder.
+
+    Parameters
+    ----------
+    root_dir : str
+        Folder in which the instances are created.
+    image_dir : str, default=None
+        Folder copied in each instance at launch, emulating the content of
+        the AMI. The paths are given relatively to the root of the file
+        system of the instance. If None, the instances start empty.
+    latency : float or dict, default=0
+        Time in seconds spent in each call to the transport, emulating the
+        network. A dict mapping the name of the methods (e.g.
+        ``'launch_instances'``, ``'run'``, ``'upload'``) to a latency can be
+        given to set different latencies by operation.
+    train_duration : float, default=0
+        Time in seconds spent by the emulated ``ramp_test_submission``.
+    error_submissions : list of str, default=()
+        Submissions for which the emulated training fails.
+    n_folds : int, default=2
+        Number of folds for which predictions are written.
+    prediction_size : int, default=1024
+        Size in bytes of each emulated prediction file.
+
+    Attributes
+    ----------
+    calls : :class:`collections.Counter`
+        The number of calls for each method of the transport.
+    """
+
+    def __init__(self, root_dir, image_dir=None, latency=0, train_duration=0,
+                 error_submissions=(), n_folds=2, prediction_size=1024):
+        self.root_dir = root_dir
+        self.image_dir = image_dir
+        self.latency = latency
+        self.train_duration = train_duration
+        self.error_submissions = list(error_submissions)
+        self.n_folds = n_folds
+        self.prediction_size = prediction_size
+        self.calls = Counter()
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        if isinstance(self.latency, dict):
+            latency = self.latency.get(operation, 0)
+        else:
+            latency = self.latency
+        if latency:
+            time.sleep(latency)
+
+    def _get_instance(self, instance_id, running=True):
+        with self._lock:
+            instance = self._instances.get(instance_id)
+        if instance is None:
+            raise ValueError(
+                'The instance ID "{}" does not exist'.format(instance_id))
+        if running and instance['state'] != 'running':
+            return None
+        return instance
+
+    def _local_path(self, config, instance, path):
+        """Map a path of the instance on the local file system."""
+        return os.path.join(instance['root'], path.lstrip('/'))
+
+    def _rewrite(self, config, instance, cmd):
+        remote_folder = config[REMOTE_RAMP_KIT_FOLDER_FIELD]
+        return cmd.replace(
+            remote_folder, self._local_path(config, instance, remote_folder))
+
+    def _list_screens(self, instance):
+        screens_dir = os.path.join(instance['root'], '.screens')
+        if not os.path.isdir(screens_dir):
+            return {}
+        screens = {}
+        for name in os.listdir(screens_dir):
+            try:
+                with open(os.path.join(screens_dir, name)) as f:
+                    screens[name] = int(f.read() or 0)
+            except (IOError, ValueError):
+                continue
+        return screens
+
+    def get_image_id(self, config, image_name):
+        self._call('get_image_id')
+        return 'ami-{}'.format(image_name)
+
+    def launch_instances(self, config, image_id, nb):
+        self._call('launch_instances')
+        instances = []
+        for _ in range(nb):
+            with self._lock:
+                instance_id = 'i-{:017x}'.format(len(self._instances))
+                root = os.path.join(self.root_dir, instance_id)
+                self._instances[instance_id] = {
+                    'state': 'pending', 'root': root, 'image_id': image_id,
+                    'tags': {RAMP_AWS_BACKEND_TAG: '1'},
+                }
+            self._provision(root)
+            with self._lock:
+                self._instances[instance_id]['state'] = 'running'
+            instances.append(FakeInstance(instance_id))
+        return instances
+
+    def _provision(self, root):
+        if self.image_dir is not None:
+            shutil.copytree(self.image_dir, root, symlinks=True)
+        bin_dir = os.path.join(root, 'bin')
+        os.makedirs(bin_dir, exist_ok=True)
+        open(os.path.join(root, '.profile'), 'a').close()
+        os.symlink(sys.executable, os.path.join(bin_dir, 'python'))
+        for name, script in (('screen', _SCREEN_SCRIPT),
+                             ('taskset', _TASKSET_SCRIPT),
+                             ('ramp_test_submission',
+                              _RAMP_TEST_SUBMISSION_SCRIPT)):
+            path = os.path.join(bin_dir, name)
+            with open(path, 'w') as f:
+                f.write(script.format(python=sys.executable))
+            os.chmod(path, 0o755)
+        settings = {
+            'train_duration': self.train_duration,
+            'error_submissions': self.error_submissions,
+            'n_folds': self.n_folds,
+            'prediction_size': self.prediction_size,
+        }
+        with open(os.path.join(root, '.fake_training.json'), 'w') as f:
+            json.dump(settings, f)
+
+    def terminate_instance(self, config, instance_id):
+        self._call('terminate_instance')
+        instance = self._get_instance(instance_id, running=False)
+        with self._lock:
+            if instance['state'] == 'terminated':
+                return
+            instance['state'] = 'terminated'
+        for pid in self._list_screens(instance).values():
+            if pid:
+                try:
+                    os.killpg(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+        shutil.rmtree(instance['root'], ignore_errors=True)
+
+    def list_instance_ids(self, config):
+        self._call('list_instance_ids')
+        with self._lock:
+            return [instance_id
+                    for instance_id, instance in self._instances.items()
+                    if instance['state'] == 'running' and
+                    instance['tags'].get(RAMP_AWS_BACKEND_TAG) == '1']
+
+    def instance_status(self, config, instance_id):
+        self._call('instance_status')
+        if self._get_instance(instance_id) is None:
+            return None
+        return {
+            'InstanceId': instance_id,
+            'InstanceState': {'Name': 'running'},
+            'InstanceStatus': {
+                'Status': 'ok',
+                'Details': [{'Name': 'reachability', 'Status': 'passed'}],
+            },
+        }
+
+    def create_tags(self, config, instance_id, tags):
+        self._call('create_tags')
+        instance = self._get_instance(instance_id, running=False)
+        with self._lock:
+            instance['tags'].update(tags)
+
+    def describe_tags(self, config, instance_id):
+        self._call('describe_tags')
+        instance = self._get_instance(instance_id, running=False)
+        with self._lock:
+            return dict(instance['tags'])
+
+    def delete_tags(self, config, instance_id, keys):
+        self._call('delete_tags')
+        instance = self._get_instance(instance_id, running=False)
+        with self._lock:
+            for key in keys:
+                instance['tags'].pop(key, None)
+
+    def run(self, config, instance_id, cmd, return_output=False, input=None):
+        self._call('run')
+        instance = self._get_instance(instance_id)
+        if instance is None:
+            # ssh exit status when the host cannot be reached
+            if return_output:
+                raise subprocess.CalledProcessError(255, cmd)
+            return 255
+        env = dict(os.environ)
+        env['HOME'] = instance['root']
+        env['PATH'] = os.path.join(instance['root'], 'bin') + ':' + env['PATH']
+        # emulate the interpretation done by ssh of the command given between
+        # double quotes
+        cmd = 'sh -c "{}"'.format(self._rewrite(config, instance, cmd))
+        if return_output:
+            return subprocess.check_output(cmd, shell=True, input=input,
+                                           env=env, cwd=instance['root'])
+        return subprocess.run(cmd, shell=True, input=input, env=env,
+                              cwd=instance['root']).returncode
+
+    def upload(self, config, instance_id, source, dest, options=''):
+        self._call('upload')
+        instance = self._get_instance(instance_id)
+        if instance is None:
+            return 255
+        dest = self._local_path(config, instance, dest)
+        return _copy(source, dest, options)
+
+    def download(self, config, instance_id, source, dest, options=''):
+        self._call('download')
+        instance = self._get_instance(instance_id)
+        if instance is None:
+            return 255
+        source = self._local_path(config, instance, source)
+        return _copy(source, dest, options)
+
+
+def _copy(source, dest, options):
+    """Copy following the semantic of rsync and return its exit status.
+
+    The ``--exclude`` patterns starting with ``/`` are anchored to the source
+    folder while the other ones match at any depth. The ``--delete`` option
+    removes the files of the destination which are not in the source, except
+    the excluded ones.
+    """
+    tokens = shlex.split(options)
+    exclude = {tokens[idx + 1] for idx, token in enumerate(tokens)
+               if token == '--exclude'}
+    delete = '--delete' in tokens
+    if not os.path.exists(source):
+        # rsync exit status for partial transfer due to vanished files
+        return 23
+    if os.path.isdir(source):
+        if not source.endswith('/'):
+            dest = os.path.join(dest, os.path.basename(source))
+        _copy_folder(source, dest, exclude, delete, top_level=True)
+        return 0
+    if dest.endswith('/') or os.path.isdir(dest):
+        dest = os.path.join(dest, os.path.basename(source))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    shutil.copy2(source, dest)
+    return 0
+
+
+def _copy_folder(source, dest, exclude, delete, top_level):
+    def excluded(name):
+        return name in exclude or (top_level and '/' + name in exclude)
+
+    os.makedirs(dest, exist_ok=True)
+    names = [name for name in os.listdir(source) if not excluded(name)]
+    if delete:
+        for name in os.listdir(dest):
+            if name in names or excluded(name):
+                continue
+            path = os.path.join(dest, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    for name in names:
+        path = os.path.join(source, name)
+        dest_path = os.path.join(dest, name)
+        if os.path.isdir(path):
+            _copy_folder(path, dest_path, exclude, delete, top_level=False)
+        else:
+            shutil.copy2(path, dest_path)
@@ -0,0 +1,89 @@
+"""
+Transports used by the AWS backend to reach the cloud provider and the
+instances. The functions of :mod:`ramp_engine.aws.api` never call boto3,
+ssh, or rsync directly: they go through the transport given in the
+``transport`` entry of the configuration. By default, the
+:class:`ramp_engine.aws.api.EC2Transport` is used.
+"""
+from abc import ABCMeta, abstractmethod
+
+
+class BaseTransport(metaclass=ABCMeta):
+    """Base class of the transports of the AWS backend. Do not use this class
+    directly.
+
+    A transport has two roles: (i) handling the life cycle of the instances
+    (launch, status, tags, termination) and (ii) executing commands and
+    copying files on the instances. All the methods receive the configuration
+    of the worker.
+    """
+
+    @abstractmethod
+    def get_image_id(self, config, image_name):
+        """Get the identifier of the image named ``image_name``."""
+
+    @abstractmethod
+    def launch_instances(self, config, image_id, nb):
+        """Launch ``nb`` instances and wait until they are usable.
+
+        Returns
+        -------
+        instances : list or None
+            The launched instances, each of them exposing an ``id`` attribute.
+            None if the instances could not be launched.
+        """
+
+    @abstractmethod
+    def terminate_instance(self, config, instance_id):
+        """Terminate an instance."""
+
+    @abstractmethod
+    def list_instance_ids(self, config):
+        """List the identifiers of the running instances of the backend."""
+
+    @abstractmethod
+    def instance_status(self, config, instance_id):
+        """Get the status of an instance.
+
+        Returns
+        -------
+        status : dict or None
+            The status, following the EC2 ``describe_instance_status``
+            format, or None if the instance is not yet able to report it.
+        """
+
+    @abstractmethod
+    def create_tags(self, config, instance_id, tags):
+        """Add or update the ``tags`` (a dict) of an instance."""
+
+    @abstractmethod
+    def describe_tags(self, config, instance_id):
+        """Get the tags of an instance as a dict."""
+
+    @abstractmethod
+    def delete_tags(self, config, instance_id, keys):
+        """Remove the tags named ``keys`` from an instance."""
+
+    @abstractmethod
+    def run(self, config, instance_id, cmd, return_output=False, input=None):
+        """Run a shell command on an instance.
+
+        The command is interpreted as if given between double quotes to
+        ``ssh``.
+
+        Returns
+        -------
+        output : int or bytes
+            The standard output if ``return_output`` is True, otherwise the
+            exit status of the command.
+        """
+
+    @abstractmethod
+    def upload(self, config, instance_id, source, dest, options=''):
+        """Copy a local file or folder to an instance, following the
+        ``rsync`` semantic. Return the exit status of the copy."""
+
+    @abstractmethod
+    def download(self, config, instance_id, source, dest, options=''):
+        """Copy a file or folder of an instance locally, following the
+        ``rsync`` semantic. Return the exit status of the copy."""
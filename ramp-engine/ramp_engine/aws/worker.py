@@ -1,4 +1,8 @@
 import logging
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from ..base import BaseWorker, _get_traceback
 from . import api as aws
@@ -17,11 +21,190 @@ logger.setLevel(logging.DEBUG)
 logger.addHandler(fileHandler)
 logger.addHandler(streamHandler)
 
+DEFAULT_MAX_CONCURRENT_TRANSFERS = 8
+
+# the AWS workers of a process share bounded pools of threads in which the
+# blocking calls (boto3, ssh, rsync) are executed
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(config):
+    """Get the thread pool shared by the AWS workers.
+
+    The workers configured with the same ``max_concurrent_transfers`` share
+    the same pool, which is created at the first call.
+    """
+    max_workers = int(config.get(aws.MAX_CONCURRENT_TRANSFERS_FIELD,
+                                 DEFAULT_MAX_CONCURRENT_TRANSFERS))
+    with _executors_lock:
+        if max_workers not in _executors:
+            _executors[max_workers] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix='RAMP-AWS'
+            )
+        return _executors[max_workers]
+
+
+# the instances on which several submissions can be trained concurrently,
+# see _acquire_instance
+_shared_instances = []
+_shared_instances_lock = threading.Lock()
+# the submissions can only share instances launched with the same settings
+_SHARED_INSTANCE_FIELDS = (
+    aws.TRANSPORT_FIELD, aws.REGION_NAME_FIELD, aws.INSTANCE_TYPE_FIELD,
+    aws.AMI_IMAGE_ID_FIELD, aws.AMI_IMAGE_NAME_FIELD,
+    aws.REMOTE_RAMP_KIT_FOLDER_FIELD, aws.STAGE_RAMP_KIT_FIELD, 'kit_dir',
+    'data_dir'
+)
+
+
+class _SharedInstance:
+    """Book-keeping of the resources of an instance shared by workers.
+
+    Parameters
+    ----------
+    key : tuple
+        The settings used to launch the instance.
+    n_vcpus : int
+        The number of vCPUs of the instance.
+    memory : float
+        The memory of the instance in MB.
+    """
+
+    def __init__(self, key, n_vcpus, memory):
+        self.key = key
+        self.free_vcpus = list(range(n_vcpus))
+        self.free_memory = memory
+        self.workers = {}
+        # the future of the launch of the instance, returning the instance
+        self.future = None
+
+    def can_host(self, n_vcpus, memory):
+        if self.future.done() and self.future.exception() is not None:
+            return False
+        return len(self.free_vcpus) >= n_vcpus and self.free_memory >= memory
+
+
+def _get_resources(config):
+    """Get the resources of the instances and of each submission.
+
+    Returns
+    -------
+    instance_vcpus, instance_memory : int, float
+        The vCPUs and the memory in MB of an instance.
+    submission_vcpus, submission_memory : int, float
+        The vCPUs and the memory in MB booked for each submission.
+    """
+    instance_vcpus = config.get(aws.INSTANCE_VCPUS_FIELD)
+    if instance_vcpus is None:
+        # one submission per instance, using all its CPUs
+        return 1, float('inf'), 1, 0
+    instance_vcpus = int(instance_vcpus)
+    instance_memory = float(config.get(aws.INSTANCE_MEMORY_FIELD, 'inf'))
+    submission_vcpus = int(config.get(aws.SUBMISSION_VCPUS_FIELD,
+                                      instance_vcpus))
+    submission_memory = float(config.get(aws.SUBMISSION_MEMORY_FIELD, 0))
+    if (submission_vcpus > instance_vcpus or
+            submission_memory > instance_memory):
+        raise ValueError(
+            'The resources of a submission ({} vCPUs, {} MB) exceed the '
+            'resources of an instance ({} vCPUs, {} MB)'.format(
+                submission_vcpus, submission_memory, instance_vcpus,
+                instance_memory))
+    return instance_vcpus, instance_memory, submission_vcpus, submission_memory
+
+
+def _acquire_instance(worker, executor):
+    """Book vCPUs and memory for a worker on a shared instance.
+
+    The worker joins an instance having enough free resources. Otherwise, the
+    launch of a new instance is submitted to ``executor``.
+
+    Returns
+    -------
+    shared_instance : _SharedInstance
+        The instance hosting the worker.
+    cpus : list of int or None
+        The CPUs to which the training of the submission is bound. None if
+        the submission has the instance for itself.
+    """
+    config = worker.config
+    instance_vcpus, instance_memory, submission_vcpus, submission_memory = \
+        _get_resources(config)
+    key = tuple(config.get(field) for field in _SHARED_INSTANCE_FIELDS)
+    with _shared_instances_lock:
+        for shared_instance in _shared_instances:
+            if (shared_instance.key == key and
+                    shared_instance.can_host(submission_vcpus,
+                                             submission_memory)):
+                break
+        else:
+            shared_instance = _SharedInstance(key, instance_vcpus,
+                                              instance_memory)
+            shared_instance.future = executor.submit(
+                _launch_instance, config)
+            _shared_instances.append(shared_instance)
+        cpus = shared_instance.free_vcpus[:submission_vcpus]
+        del shared_instance.free_vcpus[:submission_vcpus]
+        shared_instance.free_memory -= submission_memory
+        shared_instance.workers[worker] = (cpus, submission_memory)
+    if config.get(aws.INSTANCE_VCPUS_FIELD) is None:
+        cpus = None
+    return shared_instance, cpus
+
+
+def _release_instance(worker, shared_instance):
+    """Release the resources booked by a worker.
+
+    Returns
+    -------
+    last : bool
+        Whether the worker was the last one on the instance. In this case, no
+        other worker can join the instance anymore.
+    """
+    with _shared_instances_lock:
+        cpus, memory = shared_instance.workers.pop(worker)
+        shared_instance.free_vcpus.extend(cpus)
+        shared_instance.free_memory += memory
+        if shared_instance.workers:
+            return False
+        _shared_instances.remove(shared_instance)
+        return True
+
+
+def _launch_instance(config):
+    instances = aws.launch_ec2_instances(config)
+    if not instances:
+        raise RuntimeError("Unable to launch an instance")
+    instance, = instances
+    if config.get(aws.STAGE_RAMP_KIT_FIELD):
+        exit_status = aws.stage_ramp_kit(
+            config, instance.id, config['kit_dir'], config['data_dir'])
+        if exit_status != 0:
+            # do not leave an unusable instance behind
+            aws.terminate_ec2_instance(config, instance.id)
+            raise RuntimeError('Cannot stage the ramp-kit on instance "{}"'
+                               .format(instance.id))
+    return instance
+
 
 class AWSWorker(BaseWorker):
     """
     Run RAMP submissions on Amazon.
 
+    All the blocking operations (launching the instance, uploading the
+    submission, checking the training status and downloading the results) are
+    executed in a thread pool shared between the AWS workers. Therefore, none
+    of the methods called by the dispatcher wait for a network operation to
+    complete, except :meth:`collect_results` when it is called on a running
+    worker. The status of the worker becomes 'error' once the set up or the
+    launch of the training failed in the background.
+
+    When ``instance_vcpus`` is given in the configuration, the workers share
+    instances: a worker joins a running instance having enough free vCPUs and
+    memory for its submission, and the training is bound to the vCPUs booked
+    for it. An instance is terminated when its last worker is torn down.
+
     Parameters
     ----------
     config : dict
@@ -47,12 +230,41 @@ class AWSWorker(BaseWorker):
     def __init__(self, config, submission):
         super().__init__(config, submission)
         self.submissions_path = self.config['submissions_dir']
+        self.instance = None
+        self._shared_instance = None
+        self._cpus = None
+        self._setup_future = None
+        self._launch_future = None
+        self._check_future = None
+        self._download_future = None
+
+    @property
+    def status(self):
+        # the set up and the launch are executed in the background: their
+        # failure is only known once they are done
+        if self._status in ('setup', 'running') and self._error is not None:
+            self._status = 'error'
+        return super().status
+
+    @status.setter
+    def status(self, status):
+        self._status = status
+
+    @property
+    def _error(self):
+        """The error raised by the set up or the launch, if any."""
+        for future in (self._setup_future, self._launch_future):
+            if (future is not None and future.done() and
+                    future.exception() is not None):
+                return future.exception()
+        return None
 
     def setup(self):
         """Set up the worker.
 
-        This will launch an instance on Amazon, and copy the submission
-        to the instance.
+        This will launch an instance on Amazon, or join an instance shared
+        with other workers, and copy the submission to the instance. Both
+        operations are executed in the background.
         """
         # sanity check for the configuration variable
         for required_param in ('instance_type', 'access_key_id'):
@@ -60,14 +272,24 @@ class AWSWorker(BaseWorker):
 
         logger.info("Setting up AWSWorker for submission '{}'".format(
             self.submission))
-        self.instance, = aws.launch_ec2_instances(self.config)
-        if self.instance:
-            logger.info("Instance launched for submission '{}'".format(
-                self.submission))
-        else:
+        self._executor = _get_executor(self.config)
+        self._shared_instance, self._cpus = _acquire_instance(
+            self, self._executor)
+        self._setup_future = self._executor.submit(self._setup)
+        self.status = 'setup'
+
+    def _setup(self):
+        # the launch of the instance has been submitted to the pool before
+        # and will therefore always be started before the current task
+        try:
+            self.instance = self._shared_instance.future.result()
+        except RuntimeError as e:
             logger.info("Unable to launch instance for submission "
                         "'{}'".format(self.submission))
-            self.status = 'error'
+            raise RuntimeError("{} for submission '{}'".format(
+                e, self.submission))
+        logger.info("Instance {} ready for submission '{}'".format(
+            self.instance.id, self.submission))
         for _ in range(5):
             # try uploading the submission a few times, as this regularly fails
             exit_status = aws.upload_submission(
@@ -81,65 +303,132 @@ class AWSWorker(BaseWorker):
             logger.error(
                 'Cannot upload submission "{}"'
                 ', an error occured'.format(self.submission))
-            self.status = 'error'
-        else:
-            logger.info("Uploaded submission '{}'".format(self.submission))
-            self.status = 'setup'
+            raise RuntimeError('Cannot upload submission "{}"'
+                               .format(self.submission))
+        logger.info("Uploaded submission '{}'".format(self.submission))
 
     def launch_submission(self):
         """Launch the submission.
 
         Basically, this runs ``ramp_test_submission`` inside the
-        Amazon instance.
+        Amazon instance, once the set up is completed. An error occurring
+        during the set up or the launch sets the status of the worker to
+        'error'.
         """
         if self.status == 'running':
             raise RuntimeError("Cannot launch submission: one is already "
                                "started")
         if self.status == 'error':
             raise RuntimeError("Cannot launch submission: the setup failed")
+        self._launch_future = self._executor.submit(self._launch)
+        self.status = 'running'
+
+    def _launch(self):
+        # the set up has been submitted to the pool before and will therefore
+        # always be started before the current task
+        self._setup_future.result()
         exit_status = aws.launch_train(
-            self.config, self.instance.id, self.submission)
+            self.config, self.instance.id, self.submission, cpus=self._cpus)
         if exit_status != 0:
             logger.error(
                 'Cannot start training of submission "{}"'
                 ', an error occured.'.format(self.submission))
-            self.status = 'error'
-        else:
-            self.status = 'running'
-        return exit_status
+            raise RuntimeError('Cannot start training of submission "{}"'
+                               .format(self.submission))
 
     def _is_submission_finished(self):
-        return aws._training_finished(
-            self.config, self.instance.id, self.submission)
+        """Status of the submission.
 
-    def collect_results(self):
-        super().collect_results()
-        if self.status == 'running':
-            aws._wait_until_train_finished(
-                self.config, self.instance.id, self.submission)
-            self.status = 'finished'
-        if self.status != 'finished':
-            raise ValueError("Cannot collect results if worker is not"
-                             "'running' or 'finished'")
+        Each call only inspects the background operations and schedules the
+        next one: a check of the training screen on the instance and, once
+        the training is over, the download of the results. The submission is
+        considered finished when the results are available locally.
+        """
+        if not self._launch_future.done():
+            return False
+        if self._download_future is not None:
+            return self._download_future.done()
+        if self._check_future is None:
+            self._check_future = self._executor.submit(
+                aws._training_finished, self.config, self.instance.id,
+                self.submission)
+            return False
+        if not self._check_future.done():
+            return False
+        check_future, self._check_future = self._check_future, None
+        if check_future.exception() is not None:
+            logger.info("Checking the status of submission '{}' failed, "
+                        "retrying ...".format(self.submission))
+            return False
+        if check_future.result():
+            self._download_future = self._executor.submit(
+                self._download_results)
+        return False
 
+    def _download_results(self):
         logger.info("Collecting submission '{}'".format(self.submission))
         aws.download_log(self.config, self.instance.id, self.submission)
-
         if aws._training_successful(
                 self.config, self.instance.id, self.submission):
             _ = aws.download_predictions(  # noqa
                 self.config, self.instance.id, self.submission)
-            self.status = 'collected'
-            exit_status, error_msg = 0, ''
-        else:
-            error_msg = _get_traceback(
-                aws._get_log_content(self.config, self.submission))
-            self.status = 'collected'
-            exit_status = 1
+            if self.config.get(aws.MEMORY_PROFILING_FIELD):
+                try:
+                    aws.download_memory_profile(
+                        self.config, self.instance.id, self.submission)
+                except (subprocess.CalledProcessError, ValueError):
+                    logger.error("Cannot get the memory profile of submission "
+                                 "'{}'".format(self.submission))
+            return 0, ''
+        error_msg = _get_traceback(
+            aws._get_log_content(self.config, self.submission))
+        return 1, error_msg
+
+    def collect_results(self):
+        """Collect the results after that the submission is completed.
+
+        Be aware that calling ``collect_results()`` before that the submission
+        finished will lock the Python main process awaiting for the submission
+        to be processed. Use ``worker.status`` to know the status of the worker
+        beforehand.
+        """
+        super().collect_results()
+        if self.status == 'running':
+            secs = int(self.config.get(
+                aws.CHECK_FINISHED_TRAINING_INTERVAL_SECS_FIELD, 1))
+            while self.status == 'running':
+                time.sleep(secs)
+        if self.status == 'error':
+            raise RuntimeError('The submission "{}" could not be launched: {}'
+                               .format(self.submission, self._error))
+        if self.status != 'finished':
+            raise ValueError("Cannot collect results if worker is not"
+                             "'running' or 'finished'")
+
+        exit_status, error_msg = self._download_future.result()
+        self.status = 'collected'
         logger.info(repr(self))
         return exit_status, error_msg
 
     def teardown(self):
-        """Terminate the Amazon instance"""
-        aws.terminate_ec2_instance(self.config, self.instance.id)
+        """Release the Amazon instance.
+
+        The instance is terminated in the background once no other worker
+        uses it. A submission which is still training is aborted.
+        """
+        if self._setup_future is not None:
+            self._executor.submit(self._terminate,
+                                  abort=self._status == 'running')
         super().teardown()
+
+    def _terminate(self, abort=False):
+        # wait for a pending set up to not leave an instance behind
+        self._setup_future.exception()
+        last = _release_instance(self, self._shared_instance)
+        if self.instance is None:
+            return
+        if last:
+            aws.terminate_ec2_instance(self.config, self.instance.id)
+        elif abort:
+            # free the CPUs for the other submissions of the instance
+            aws.abort_training(self.config, self.instance.id, self.submission)
@@ -79,10 +79,13 @@ def dispatcher(config, event_config, verbose):
     n_workers = dispatcher_config.get('n_workers', -1)
     n_threads = dispatcher_config.get('n_threads', None)
     hunger_policy = dispatcher_config.get('hunger_policy', 'sleep')
+    contributivity_interval = dispatcher_config.get('contributivity_interval',
+                                                    600)
 
     disp = Dispatcher(
         config=config, event_config=event_config, worker=worker_type,
-        n_workers=n_workers, n_threads=n_threads, hunger_policy=hunger_policy
+        n_workers=n_workers, n_threads=n_threads, hunger_policy=hunger_policy,
+        contributivity_interval=contributivity_interval
     )
     disp.launch()
 
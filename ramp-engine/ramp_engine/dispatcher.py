@@ -1,3 +1,4 @@
+import json
 import logging
 import multiprocessing
 import numbers
@@ -12,11 +13,15 @@ from ramp_database.tools.submission import get_submission_by_id
 from ramp_database.tools.submission import get_submission_state
 
 from ramp_database.tools.submission import set_bagged_scores
-# from ramp_database.tools.submission import set_predictions
+from ramp_database.tools.submission import set_predictions
 from ramp_database.tools.submission import set_time
 from ramp_database.tools.submission import set_scores
 from ramp_database.tools.submission import set_submission_error_msg
+from ramp_database.tools.submission import set_submission_memory_profile
 from ramp_database.tools.submission import set_submission_state
+from ramp_database.tools.submission import set_submission_states
+
+from ramp_database.tools.contributivity import compute_contributivity
 
 from ramp_database.tools.leaderboard import update_all_user_leaderboards
 from ramp_database.tools.leaderboard import update_leaderboards
@@ -77,13 +82,25 @@ class Dispatcher:
           for new submission;
         * if 'exit': the dispatcher will stop after collecting the results of
           the last submissions.
+    contributivity_interval : None or float, default=600
+        Minimum time in seconds between two computations of the contributivity
+        of the submissions, which are made after scoring some submissions and
+        before the dispatcher stops. If None, the contributivity is not
+        computed by the dispatcher and can be computed with the
+        ``ramp-database compute-contributivity`` command.
     """
     def __init__(self, config, event_config, worker=None, n_workers=1,
-                 n_threads=None, hunger_policy=None):
+                 n_threads=None, hunger_policy=None,
+                 contributivity_interval=600):
         self.worker = CondaEnvWorker if worker is None else worker
         self.n_workers = (max(multiprocessing.cpu_count() + 1 + n_workers, 1)
                           if n_workers < 0 else n_workers)
         self.hunger_policy = hunger_policy
+        self.contributivity_interval = contributivity_interval
+        # whether submissions were scored since the last computation of the
+        # contributivity, and the time of this computation
+        self._contributivity_outdated = False
+        self._contributivity_time = None
         # init the poison pill to kill the dispatcher
         self._poison_pill = False
         # create the different dispatcher queues
@@ -115,14 +132,16 @@ class Dispatcher:
         """Fetch the submission from the database and create the workers."""
         submissions = get_submissions(session,
                                       self._ramp_config['event_name'],
-                                      state='new')
+                                      state='new', lightweight=True)
         if not submissions:
             return
-        for submission_id, submission_name, _ in submissions:
+        fetched = False
+        for submission_id, submission_name in submissions:
             # do not train the sandbox submission
             submission = get_submission_by_id(session, submission_id)
             if not submission.is_not_sandbox:
                 continue
+            fetched = True
             # create the worker
             worker = self.worker(self._worker_config, submission_name)
             set_submission_state(session, submission_id, 'sent_to_training')
@@ -134,6 +153,11 @@ class Dispatcher:
                                                              submission_name)))
             logger.info('Submission {} added to the queue of submission to be '
                         'processed'.format(submission_name))
+        # the leaderboards are not refreshed when the submissions are added
+        # from the frontend
+        if fetched:
+            update_leaderboards(session, self._ramp_config['event_name'],
+                                new_only=True)
 
     def launch_workers(self, session):
         """Launch the awaiting workers if possible."""
@@ -176,10 +200,18 @@ class Dispatcher:
             return
         for worker, (submission_id, submission_name) in zip(workers,
                                                             submissions):
-            if worker.status == 'running':
+            status = worker.status
+            if status == 'running':
                 self._processing_worker_queue.put_nowait(
                     (worker, (submission_id, submission_name)))
                 time.sleep(0)
+            elif status == 'error':
+                # the set up or the launch of the submission, executed in the
+                # background by some workers, failed
+                logger.info('Worker {} failed to set up or launch the '
+                            'submission'.format(worker))
+                set_submission_state(session, submission_id, 'checking_error')
+                worker.teardown()
             else:
                 logger.info('Collecting results from worker {}'.format(worker))
                 returncode, stderr = worker.collect_results()
@@ -220,28 +252,76 @@ class Dispatcher:
             path_predictions = os.path.join(
                 self._worker_config['predictions_dir'], submission_name
             )
-            # NOTE: In the past we were adding the predictions into the
-            # database. Since they require too much space, we stop to store
-            # them in the database and instead, keep it onto the disk.
-            # set_predictions(session, submission_id, path_predictions)
+            # the predictions are kept on disk and only their paths are
+            # stored in the database
+            try:
+                set_predictions(session, submission_id, path_predictions)
+            except ValueError as e:
+                # the predictions written by the submission cannot be loaded
+                # safely
+                logger.info('Predictions of submission {} rejected: {}'
+                            .format(submission_name, e))
+                session.rollback()
+                set_submission_state(session, submission_id,
+                                     'training_error')
+                set_submission_error_msg(session, submission_id, str(e))
+                continue
             set_time(session, submission_id, path_predictions)
             set_scores(session, submission_id, path_predictions)
             set_bagged_scores(session, submission_id, path_predictions)
+            # the memory profile is only available for some workers
+            path_memory_profile = os.path.join(path_predictions,
+                                               'memory_profile.json')
+            if os.path.isfile(path_memory_profile):
+                with open(path_memory_profile) as f:
+                    memory_profile = json.load(f)
+                set_submission_memory_profile(
+                    session, submission_id, memory_profile['timestamps'],
+                    memory_profile['memory']
+                )
             set_submission_state(session, submission_id, 'scored')
 
+        if make_update_leaderboard:
+            self._contributivity_outdated = True
+        # the outdated contributivity is computed anyway before stopping
+        if (self._contributivity_outdated and
+                self.contributivity_interval is not None and
+                (self._poison_pill or self._contributivity_time is None or
+                 time.monotonic() - self._contributivity_time >=
+                 self.contributivity_interval)):
+            self._update_contributivity(session)
+            make_update_leaderboard = True
+
         if make_update_leaderboard:
             logger.info('Update all leaderboards')
             update_leaderboards(session, self._ramp_config['event_name'])
             update_all_user_leaderboards(session,
                                          self._ramp_config['event_name'])
 
+    def _update_contributivity(self, session):
+        """Compute the contributivity of the scored submissions."""
+        logger.info('Update the contributivity of the submissions')
+        self._contributivity_outdated = False
+        self._contributivity_time = time.monotonic()
+        try:
+            compute_contributivity(session, self._ramp_config['event_name'])
+        except Exception:
+            # the contributivity is not needed to train and score the
+            # submissions: an error, e.g. a missing data file, should not stop
+            # the dispatcher
+            session.rollback()
+            logger.exception('The contributivity of the submissions could not '
+                             'be computed')
+
     @staticmethod
     def _reset_submission_after_failure(session, even_name):
-        submissions = get_submissions(session, even_name, state=None)
-        for submission_id, _, _ in submissions:
-            submission_state = get_submission_state(session, submission_id)
-            if submission_state in ('training', 'send_to_training'):
-                set_submission_state(session, submission_id, 'new')
+        submission_ids = [
+            submission_id
+            for state in ('training', 'sent_to_training')
+            for submission_id, _ in get_submissions(
+                session, even_name, state=state, lightweight=True)
+        ]
+        set_submission_states(session, submission_ids, 'new')
 
     def launch(self):
         """Launch the dispatcher."""
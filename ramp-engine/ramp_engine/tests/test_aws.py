@@ -4,14 +4,23 @@ copy the _config.yml file and rename it config.yml, then update it using the
 credentials to interact with Amazon
 
 """
+import io
+import json
 import logging
 import os
 import shutil
+import tarfile
+import threading
+import time
+from types import SimpleNamespace
 
 import pytest
 
 from ramp_database.tools.submission import get_submissions
 from ramp_engine import Dispatcher, AWSWorker
+from ramp_engine.aws import api as aws
+from ramp_engine.aws import memory_profile
+from ramp_engine.aws.testing import FakeEC2Transport
 from ramp_utils import generate_worker_config, read_config
 from ramp_utils.testing import database_config_template
 from ramp_utils.testing import ramp_config_template
@@ -93,3 +102,409 @@ def test_aws_dispatcher(session_toy):  # noqa
         session_toy, event_config['ramp']['event_name'], 'training_error'
     )
     assert len(submission) == 2
+
+
+@pytest.fixture
+def fake_aws(monkeypatch):
+    """Replace the calls to Amazon and to the instances by local fakes."""
+    calls = {'terminated': [], 'uploaded': []}
+    monkeypatch.setattr(
+        aws, 'launch_ec2_instances',
+        lambda config, nb=1: [SimpleNamespace(id='i-' + str(time.time()))]
+    )
+
+    def upload_submission(config, instance_id, submission_name,
+                          submissions_dir):
+        calls['uploaded'].append(submission_name)
+        return 0
+
+    monkeypatch.setattr(aws, 'upload_submission', upload_submission)
+    monkeypatch.setattr(aws, 'launch_train', lambda *args, **kwargs: 0)
+    monkeypatch.setattr(aws, '_training_finished', lambda *args: True)
+    monkeypatch.setattr(aws, 'download_log', lambda *args: None)
+    monkeypatch.setattr(aws, '_training_successful', lambda *args: True)
+    monkeypatch.setattr(aws, 'download_predictions', lambda *args: None)
+    monkeypatch.setattr(
+        aws, 'terminate_ec2_instance',
+        lambda config, instance_id: calls['terminated'].append(instance_id)
+    )
+    return calls
+
+
+def _fake_aws_config(tmpdir):
+    return {'instance_type': 't2.micro', 'access_key_id': 'xxx',
+            'submissions_dir': str(tmpdir), 'logs_dir': str(tmpdir),
+            'predictions_dir': str(tmpdir)}
+
+
+def _wait_until_not_running(worker, timeout=10):
+    start = time.time()
+    while worker.status == 'running':
+        assert time.time() - start < timeout
+        time.sleep(0.01)
+
+
+def test_aws_worker_non_blocking(fake_aws, monkeypatch, tmpdir):
+    release_upload = threading.Event()
+
+    def upload_submission(config, instance_id, submission_name,
+                          submissions_dir):
+        release_upload.wait()
+        return 0
+
+    monkeypatch.setattr(aws, 'upload_submission', upload_submission)
+    worker = AWSWorker(_fake_aws_config(tmpdir), 'starting_kit')
+    # neither the set up nor the launch wait for the upload to be done
+    worker.setup()
+    assert worker.status == 'setup'
+    worker.launch_submission()
+    assert worker.status == 'running'
+    # the launch is still waiting for the upload
+    assert not worker._launch_future.done()
+
+    release_upload.set()
+    _wait_until_not_running(worker)
+    assert worker.status == 'finished'
+    assert worker.collect_results() == (0, '')
+    assert worker.status == 'collected'
+    instance_id = worker.instance.id
+    worker.teardown()
+    assert worker.status == 'killed'
+    # the termination is requested in the background
+    start = time.time()
+    while not fake_aws['terminated']:
+        assert time.time() - start < 10
+        time.sleep(0.01)
+    assert fake_aws['terminated'] == [instance_id]
+
+
+def test_aws_worker_concurrent_transfers(fake_aws, monkeypatch, tmpdir):
+    # the uploads can only succeed if both of them run at the same time
+    barrier = threading.Barrier(2, timeout=10)
+
+    def upload_submission(config, instance_id, submission_name,
+                          submissions_dir):
+        barrier.wait()
+        return 0
+
+    monkeypatch.setattr(aws, 'upload_submission', upload_submission)
+    workers = [AWSWorker(_fake_aws_config(tmpdir), name)
+               for name in ('starting_kit', 'random_forest_10_10')]
+    for worker in workers:
+        worker.setup()
+        worker.launch_submission()
+    for worker in workers:
+        _wait_until_not_running(worker)
+        assert worker.collect_results() == (0, '')
+
+
+def test_aws_worker_launch_error(fake_aws, monkeypatch, tmpdir):
+    monkeypatch.setattr(aws, 'launch_train', lambda *args, **kwargs: 1)
+    worker = AWSWorker(_fake_aws_config(tmpdir), 'starting_kit')
+    worker.setup()
+    worker.launch_submission()
+    # collecting a running worker waits for the background operations
+    with pytest.raises(RuntimeError,
+                       match='Cannot start training of submission'):
+        worker.collect_results()
+    assert worker.status == 'error'
+
+
+def test_aws_compute_folder_hash(tmpdir):
+    kit_dir = tmpdir.mkdir('kit')
+    kit_dir.join('problem.py').write('a = 1')
+    kit_dir.mkdir('submissions').join('starting_kit.py').write('b = 2')
+    folder = str(kit_dir)
+
+    content_hash = aws._compute_folder_hash(folder, exclude=('submissions',))
+    assert content_hash == aws._compute_folder_hash(
+        folder, exclude=('submissions',))
+    # excluded folders do not change the hash
+    kit_dir.join('submissions', 'starting_kit.py').write('b = 3')
+    assert content_hash == aws._compute_folder_hash(
+        folder, exclude=('submissions',))
+    # the content of the other files does
+    kit_dir.join('problem.py').write('a = 2')
+    assert content_hash != aws._compute_folder_hash(
+        folder, exclude=('submissions',))
+
+
+@pytest.mark.parametrize(
+    "remote_hash, n_uploads",
+    [(None, 2), ('same', 0)]
+)
+def test_aws_stage_ramp_kit(monkeypatch, tmpdir, remote_hash, n_uploads):
+    kit_dir = tmpdir.mkdir('kit')
+    kit_dir.join('problem.py').write('a = 1')
+    data_dir = tmpdir.mkdir('data')
+    data_dir.mkdir('data').join('train.csv').write('x,y')
+    content_hash = aws._compute_folder_hash(
+        str(kit_dir), str(data_dir.join('data')),
+        exclude=aws.RAMP_KIT_EXCLUDED_FOLDERS
+    )
+    if remote_hash == 'same':
+        remote_hash = content_hash
+
+    uploads, commands = [], []
+
+    def _run(config, instance_id, cmd, return_output=False, input=None):
+        commands.append(cmd)
+        if return_output:
+            return (remote_hash or '').encode('utf-8')
+        return 0
+
+    monkeypatch.setattr(aws, '_run', _run)
+    monkeypatch.setattr(
+        aws, '_upload',
+        lambda config, instance_id, source, dest, options='':
+        uploads.append((source, dest)) or 0
+    )
+    config = {aws.REMOTE_RAMP_KIT_FOLDER_FIELD: '/home/ubuntu/iris'}
+    assert aws.stage_ramp_kit(config, 'i-0', str(kit_dir), str(data_dir)) == 0
+    assert len(uploads) == n_uploads
+    if n_uploads:
+        # the hash is stored once the kit and the data are staged
+        assert content_hash in commands[-1]
+
+
+def test_aws_upload_submission_archive(monkeypatch, tmpdir):
+    submission_dir = tmpdir.mkdir('submissions').mkdir('starting_kit')
+    submission_dir.join('classifier.py').write('clf = None')
+    submission_dir.join('feature_extractor.py').write('fe = None')
+
+    calls = []
+    monkeypatch.setattr(
+        aws, '_run',
+        lambda config, instance_id, cmd, return_output=False, input=None:
+        calls.append((cmd, input)) or 0
+    )
+    config = {aws.REMOTE_RAMP_KIT_FOLDER_FIELD: '/home/ubuntu/iris'}
+    exit_status = aws.upload_submission(
+        config, 'i-0', 'starting_kit', str(tmpdir.join('submissions'))
+    )
+    assert exit_status == 0
+    # a single remote command receives all the files
+    assert len(calls) == 1
+    cmd, archive = calls[0]
+    assert 'tar xzf - -C /home/ubuntu/iris/submissions' in cmd
+    with tarfile.open(fileobj=io.BytesIO(archive), mode='r:gz') as f:
+        assert sorted(f.getnames()) == [
+            'starting_kit', 'starting_kit/classifier.py',
+            'starting_kit/feature_extractor.py'
+        ]
+
+
+def _make_fake_transport_config(tmpdir, **transport_params):
+    remote_kit_folder = '/home/ubuntu/ramp-kits/iris'
+    image_dir = tmpdir.join('image')
+    image_dir.ensure(remote_kit_folder.lstrip('/'), 'submissions', dir=True)
+    submissions_dir = tmpdir.mkdir('submissions')
+    for name in ('starting_kit', 'error'):
+        submissions_dir.mkdir(name).join('classifier.py').write('clf = None')
+    transport = FakeEC2Transport(str(tmpdir.mkdir('instances')),
+                                 image_dir=str(image_dir), **transport_params)
+    config = {
+        'instance_type': 't2.micro', 'access_key_id': 'xxx',
+        'secret_access_key': 'xxx', 'region_name': 'us-west-2',
+        'ami_image_name': 'iris', 'ami_user_name': 'ubuntu',
+        'key_name': 'iris', 'key_path': 'iris.pem',
+        'security_group': 'launch-wizard',
+        'remote_ramp_kit_folder': remote_kit_folder,
+        'memory_profiling': False,
+        'check_finished_training_interval_secs': 0.01,
+        'submissions_dir': str(submissions_dir),
+        'predictions_dir': str(tmpdir.join('predictions')),
+        'logs_dir': str(tmpdir.join('logs')),
+        'transport': transport,
+    }
+    return config, transport
+
+
+def test_aws_fake_transport_api(tmpdir):
+    config, transport = _make_fake_transport_config(tmpdir)
+    instance, = aws.launch_ec2_instances(config)
+    assert aws.list_ec2_instance_ids(config) == [instance.id]
+    assert aws._is_ready(config, instance.id)
+    aws._add_or_update_tag(config, instance.id, 'Name', 'starting_kit')
+    assert aws._get_tags(config, instance.id)['Name'] == 'starting_kit'
+    aws._delete_tag(config, instance.id, 'Name')
+    assert 'Name' not in aws._get_tags(config, instance.id)
+    output = aws._run(config, instance.id, 'echo 1', return_output=True)
+    assert output == b'1\n'
+
+    aws.terminate_ec2_instance(config, instance.id)
+    assert aws.list_ec2_instance_ids(config) == []
+    assert aws.status_of_ec2_instance(config, instance.id) is None
+    assert transport.calls['launch_instances'] == 1
+
+
+@pytest.mark.parametrize(
+    "submission, expected_exit_status",
+    [('starting_kit', 0), ('error', 1)]
+)
+def test_aws_worker_fake_transport(tmpdir, submission, expected_exit_status):
+    config, transport = _make_fake_transport_config(
+        tmpdir, train_duration=0.1, error_submissions=['error']
+    )
+    worker = AWSWorker(config, submission)
+    worker.setup()
+    worker.launch_submission()
+    exit_status, error_msg = worker.collect_results()
+    assert exit_status == expected_exit_status
+    assert os.path.isfile(os.path.join(config['logs_dir'], submission, 'log'))
+    if expected_exit_status == 0:
+        assert error_msg == ''
+        for fold_idx in range(transport.n_folds):
+            assert os.path.isfile(os.path.join(
+                config['predictions_dir'], submission,
+                'fold_{}'.format(fold_idx), 'y_pred_test.npz'
+            ))
+    else:
+        assert 'ValueError' in error_msg
+
+
+class _NoCapacityEC2Transport(FakeEC2Transport):
+    """Transport for which EC2 never launches the requested instances."""
+
+    def launch_instances(self, config, image_id, nb):
+        self._call('launch_instances')
+        return []
+
+
+def test_aws_worker_fake_transport_launch_error(tmpdir):
+    config, _ = _make_fake_transport_config(tmpdir)
+    transport = _NoCapacityEC2Transport(str(tmpdir.mkdir('no_capacity')))
+    config['transport'] = transport
+    worker = AWSWorker(config, 'starting_kit')
+    worker.setup()
+    worker.launch_submission()
+    # the failure of the set up is not a failure of the submission
+    _wait_until_not_running(worker)
+    assert worker.status == 'error'
+    with pytest.raises(RuntimeError, match='Unable to launch an instance'):
+        worker.collect_results()
+    with pytest.raises(RuntimeError, match='the setup failed'):
+        worker.launch_submission()
+    worker.teardown()
+    assert worker.status == 'killed'
+    assert transport.calls['launch_instances'] == 1
+
+
+def test_aws_reduce_memory_profile():
+    lines = ['CMDLINE python ramp_test_submission\n']
+    lines += ['MEM {:.1f} {:.1f}\n'.format(10 + (idx % 7), 100 + idx)
+              for idx in range(1000)]
+    lines[500] = 'MEM 512.0 599.0\n'
+    max_ram, timestamps, memory = memory_profile.reduce_memory_profile(
+        lines, n_points=50)
+    assert max_ram == pytest.approx(512)
+    assert max(memory) == pytest.approx(512)
+    assert len(timestamps) == len(memory) <= 50
+    assert timestamps[0] == 0
+    assert timestamps == sorted(timestamps)
+
+    with pytest.raises(ValueError, match='at least 2'):
+        memory_profile.reduce_memory_profile(lines, n_points=1)
+
+
+def test_aws_fake_transport_stage_ramp_kit(tmpdir):
+    config, transport = _make_fake_transport_config(tmpdir)
+    instance, = aws.launch_ec2_instances(config)
+    remote_kit_dir = os.path.join(
+        transport.root_dir, instance.id,
+        config['remote_ramp_kit_folder'].lstrip('/')
+    )
+    kit_dir = tmpdir.mkdir('kit')
+    kit_dir.join('problem.py').write('a = 1')
+    kit_dir.mkdir('utils').mkdir('data').join('loader.py').write('b = 1')
+    kit_dir.mkdir('submissions').join('local.py').write('c = 1')
+    data_dir = tmpdir.mkdir('ramp-data')
+    data_dir.mkdir('data').join('train.csv').write('x,y')
+    os.makedirs(os.path.join(remote_kit_dir, 'submissions', 'starting_kit'))
+    for path in ('stale.py', os.path.join('data', 'stale.csv')):
+        os.makedirs(os.path.dirname(os.path.join(remote_kit_dir, path)),
+                    exist_ok=True)
+        with open(os.path.join(remote_kit_dir, path), 'w') as f:
+            f.write('stale')
+
+    assert aws.stage_ramp_kit(config, instance.id, str(kit_dir),
+                              str(data_dir)) == 0
+    # only the top-level data and submissions folders are excluded, as in the
+    # hash of the ramp-kit
+    assert os.path.isfile(
+        os.path.join(remote_kit_dir, 'utils', 'data', 'loader.py'))
+    assert os.path.isfile(os.path.join(remote_kit_dir, 'data', 'train.csv'))
+    assert not os.path.exists(
+        os.path.join(remote_kit_dir, 'submissions', 'local.py'))
+    # the files removed from the ramp-kit are removed from the instance but
+    # the remote submissions are kept
+    assert not os.path.exists(os.path.join(remote_kit_dir, 'stale.py'))
+    assert not os.path.exists(
+        os.path.join(remote_kit_dir, 'data', 'stale.csv'))
+    assert os.path.isdir(
+        os.path.join(remote_kit_dir, 'submissions', 'starting_kit'))
+
+
+def test_aws_download_memory_profile(tmpdir):
+    config, transport = _make_fake_transport_config(tmpdir)
+    instance, = aws.launch_ec2_instances(config)
+    mprof = os.path.join(
+        transport.root_dir, instance.id,
+        config['remote_ramp_kit_folder'].lstrip('/'), 'submissions',
+        'starting_kit', 'mprof.dat'
+    )
+    os.makedirs(os.path.dirname(mprof))
+    with open(mprof, 'w') as f:
+        for idx in range(100):
+            f.write('MEM {} {}\n'.format(idx, idx / 10))
+
+    profile = aws.download_memory_profile(config, instance.id,
+                                          'starting_kit', n_points=10)
+    assert profile['max_ram'] == pytest.approx(99)
+    assert len(profile['memory']) <= 10
+    path = os.path.join(config['predictions_dir'], 'starting_kit',
+                        aws.MEMORY_PROFILE_FILENAME)
+    with open(path) as f:
+        assert json.load(f) == profile
+    aws.terminate_ec2_instance(config, instance.id)
+
+
+def test_aws_worker_packing(tmpdir):
+    config, transport = _make_fake_transport_config(tmpdir, train_duration=0.1)
+    config.update({'instance_vcpus': 4, 'instance_memory': 8000,
+                   'submission_vcpus': 2, 'submission_memory': 1000})
+    submissions = ['submission_{}'.format(idx) for idx in range(3)]
+    for submission in submissions:
+        os.makedirs(os.path.join(config['submissions_dir'], submission))
+    workers = [AWSWorker(config, submission) for submission in submissions]
+    for worker in workers:
+        worker.setup()
+        worker.launch_submission()
+    for worker in workers:
+        assert worker.collect_results() == (0, '')
+    # two submissions fit on an instance
+    assert transport.calls['launch_instances'] == 2
+    assert workers[0].instance.id == workers[1].instance.id
+    assert workers[0].instance.id != workers[2].instance.id
+    cpus = []
+    for submission in submissions:
+        with open(os.path.join(config['logs_dir'], submission, 'log')) as f:
+            cpus.append(f.read().split('CPUs: ')[1].split()[0])
+    assert cpus == ['0,1', '2,3', '0,1']
+
+    for worker in workers:
+        worker.teardown()
+    start = time.time()
+    while aws.list_ec2_instance_ids(config):
+        assert time.time() - start < 10
+        time.sleep(0.01)
+    # each instance is terminated once, after its last submission
+    assert transport.calls['terminate_instance'] == 2
+
+
+def test_aws_worker_packing_resources(tmpdir):
+    config, _ = _make_fake_transport_config(tmpdir)
+    config.update({'instance_vcpus': 2, 'submission_vcpus': 4})
+    worker = AWSWorker(config, 'starting_kit')
+    with pytest.raises(ValueError, match='exceed the resources'):
+        worker.setup()
@@ -1,6 +1,7 @@
 import shutil
 import os
 
+import numpy as np
 import pytest
 
 from ramp_utils import read_config
@@ -13,9 +14,12 @@ from ramp_database.utils import session_scope
 from ramp_database.testing import create_toy_db
 
 from ramp_database.tools.event import get_event
+from ramp_database.tools.submission import get_predictions
 from ramp_database.tools.submission import get_submissions
 from ramp_database.tools.submission import get_submission_by_id
 
+from ramp_engine import dispatcher as dispatcher_module
+from ramp_engine.base import BaseWorker
 from ramp_engine.local import CondaEnvWorker
 from ramp_engine.dispatcher import Dispatcher
 
@@ -69,7 +73,12 @@ def test_unit_test_dispatcher(session_toy):
 
     # check that all submissions are queued
     submissions = get_submissions(session_toy, 'iris_test', 'new')
+    event = get_event(session_toy, 'iris_test')
+    event.new_leaderboard_html = None
+    session_toy.commit()
     dispatcher.fetch_from_db(session_toy)
+    # the leaderboard of the new submissions is refreshed
+    assert event.new_leaderboard_html
     # we should remove the starting kit from the length of the submissions for
     # each user
     assert dispatcher._awaiting_worker_queue.qsize() == len(submissions) - 2
@@ -97,6 +106,93 @@ def test_unit_test_dispatcher(session_toy):
     assert event.new_leaderboard_html is None
     assert event.public_competition_leaderboard_html
     assert event.private_competition_leaderboard_html
+    # the predictions are kept on disk and memory-mapped
+    submissions = get_submissions(session_toy, 'iris_test', 'scored')
+    assert len(submissions) == 4
+    for submission_id, _, _ in submissions:
+        predictions = get_predictions(session_toy, submission_id)
+        assert all(isinstance(y_pred, np.memmap)
+                   for y_pred in predictions['y_pred_train'])
+        assert all(isinstance(y_pred, np.memmap)
+                   for y_pred in predictions['y_pred_test'])
+
+
+def test_dispatcher_object_predictions(session_toy):
+    # the predictions written by a submission are never unpickled
+    config = read_config(database_config_template())
+    event_config = read_config(ramp_config_template())
+    dispatcher = Dispatcher(config=config,
+                            event_config=event_config,
+                            worker=CondaEnvWorker, n_workers=100,
+                            hunger_policy='exit')
+    dispatcher.fetch_from_db(session_toy)
+    dispatcher.launch_workers(session_toy)
+    while not dispatcher._processing_worker_queue.empty():
+        dispatcher.collect_result(session_toy)
+
+    submission_id, submission_name, _ = get_submissions(
+        session_toy, 'iris_test', 'tested')[0]
+    np.savez(os.path.join(dispatcher._worker_config['predictions_dir'],
+                          submission_name, 'fold_0', 'y_pred_train.npz'),
+             y_pred=np.array([object()], dtype=object))
+    dispatcher.update_database_results(session_toy)
+    submission = get_submission_by_id(session_toy, submission_id)
+    assert submission.state == 'training_error'
+    assert 'array of Python objects' in submission.error_msg
+    assert len(get_submissions(session_toy, 'iris_test', 'scored')) == 3
+
+
+def test_dispatcher_contributivity_error(session_toy, monkeypatch):
+    calls = []
+
+    def compute_contributivity(session, event_name):
+        calls.append(event_name)
+        raise FileNotFoundError('No such file: train.csv')
+
+    monkeypatch.setattr(dispatcher_module, 'compute_contributivity',
+                        compute_contributivity)
+    config = read_config(database_config_template())
+    event_config = read_config(ramp_config_template())
+    dispatcher = Dispatcher(config=config, event_config=event_config,
+                            worker=CondaEnvWorker, n_workers=2,
+                            hunger_policy='exit',
+                            contributivity_interval=3600)
+    dispatcher.launch()
+    # the error does not stop the dispatcher and, although several batches
+    # were scored, the contributivity is only computed after the first one
+    # and before stopping
+    assert calls in (['iris_test'], ['iris_test'] * 2)
+    assert len(get_submissions(session_toy, 'iris_test', 'scored')) == 4
+    event = get_event(session_toy, 'iris_test')
+    assert event.private_leaderboard_html
+
+
+class _LaunchErrorWorker(BaseWorker):
+    """Worker failing to launch the submissions in the background."""
+
+    def launch_submission(self):
+        super().launch_submission()
+
+    def _is_submission_finished(self):
+        self.status = 'error'
+        return False
+
+    def collect_results(self):
+        raise AssertionError('The results of a failed launch are collected')
+
+
+def test_dispatcher_launch_error(session_toy):
+    config = read_config(database_config_template())
+    event_config = read_config(ramp_config_template())
+    dispatcher = Dispatcher(config=config,
+                            event_config=event_config,
+                            worker=_LaunchErrorWorker, n_workers=100,
+                            hunger_policy='exit')
+    dispatcher.launch()
+    # the failures of the workers are not failures of the submissions
+    assert len(get_submissions(session_toy, 'iris_test',
+                               'checking_error')) == 6
+    assert not get_submissions(session_toy, 'iris_test', 'training_error')
 
 
 @pytest.mark.parametrize(
@@ -56,7 +56,8 @@ def client_session(database_connection):
      "/events/iris_test/sign_up/test_user",
      "/events/iris_test/update",
      "/user_interactions",
-     "/events/iris_test/dashboard_submissions"]
+     "/events/iris_test/dashboard_submissions",
+     "/events/iris_test/export_leaderboard"]
 )
 def test_check_login_required(client_session, page):
     client, _ = client_session
@@ -75,7 +76,8 @@ def test_check_login_required(client_session, page):
      ("/events/iris_test/sign_up/test_user", ["get"]),
      ("/events/iris_test/update", ["get", "post"]),
      ("/user_interactions", ["get"]),
-     ("/events/iris_test/dashboard_submissions", ["get"])]
+     ("/events/iris_test/dashboard_submissions", ["get"]),
+     ("/events/iris_test/export_leaderboard", ["get"])]
 )
 def test_check_admin_required(client_session, page, request_function):
     client, _ = client_session
@@ -292,6 +294,42 @@ def test_user_interactions(client_session):
         assert b'landing' in rv.data
 
 
+@pytest.mark.parametrize(
+    "export_format, mimetype, extension",
+    [('csv', 'text/csv', 'csv'),
+     ('parquet', 'application/vnd.apache.parquet', 'parquet'),
+     ('arrow', 'application/vnd.apache.arrow.stream', 'arrows')]
+)
+def test_export_leaderboard(client_session, export_format, mimetype,
+                            extension):
+    client, _ = client_session
+    if export_format != 'csv':
+        pytest.importorskip('pyarrow')
+
+    with login_scope(client, 'test_iris_admin', 'test') as client:
+        rv = client.get('/events/iris_test/export_leaderboard?format={}'
+                        .format(export_format))
+        assert rv.status_code == 200
+        assert rv.mimetype == mimetype
+        assert (rv.headers['Content-Disposition'] ==
+                'attachment; filename=iris_test_leaderboard.{}'
+                .format(extension))
+        assert rv.data
+        if export_format == 'csv':
+            assert rv.data.startswith(b'team,submission,submission ID')
+
+
+def test_export_leaderboard_unknown_format(client_session):
+    client, _ = client_session
+
+    with login_scope(client, 'test_iris_admin', 'test') as client:
+        rv = client.get('/events/iris_test/export_leaderboard?format=xlsx')
+        with client.session_transaction() as cs:
+            flash_message = dict(cs['_flashes'])
+        assert flash_message['message'] == 'Unknown export format "xlsx"'
+        assert rv.status_code == 302
+
+
 # TODO: To be tested when we implemented properly the leaderboard
 # def test_dashboard_submissions(client_session):
 #     client, session = client_session
@@ -0,0 +1,128 @@
+import json
+import shutil
+
+import pytest
+
+from ramp_utils import generate_flask_config
+from ramp_utils import read_config
+from ramp_utils.testing import database_config_template
+from ramp_utils.testing import ramp_config_template
+
+from ramp_database.model import Model
+from ramp_database.testing import create_toy_db
+from ramp_database.utils import setup_db
+from ramp_database.utils import session_scope
+
+from ramp_database.tools.leaderboard import update_leaderboards
+
+from ramp_frontend import create_app
+from ramp_frontend.testing import login_scope
+
+
+@pytest.fixture(scope='module')
+def client_session(database_connection):
+    database_config = read_config(database_config_template())
+    ramp_config = ramp_config_template()
+    try:
+        deployment_dir = create_toy_db(database_config, ramp_config)
+        flask_config = generate_flask_config(database_config)
+        app = create_app(flask_config)
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        with session_scope(database_config['sqlalchemy']) as session:
+            yield app.test_client(), session
+    finally:
+        shutil.rmtree(deployment_dir, ignore_errors=True)
+        try:
+            # In case of failure we should close the global flask engine
+            from ramp_frontend import db as db_flask
+            db_flask.session.close()
+        except RuntimeError:
+            pass
+        db, _ = setup_db(database_config['sqlalchemy'])
+        Model.metadata.drop_all(db)
+
+
+def test_leaderboard_json_login_required(client_session):
+    client, _ = client_session
+    rv = client.get('/events/iris_test/leaderboard.json')
+    assert rv.status_code == 302
+    assert 'http://localhost/login' in rv.location
+
+
+def test_leaderboard_json(client_session):
+    client, session = client_session
+    update_leaderboards(session, 'iris_test')
+
+    with login_scope(client, 'test_iris_admin', 'test') as client:
+        rv = client.get('/events/iris_test/leaderboard.json')
+        assert rv.status_code == 200
+        content = json.loads(rv.data.decode('utf-8'))
+        # the submissions were not trained
+        assert content == {'columns': [], 'data': [], 'n_rows': 0,
+                           'page': 1, 'per_page': 25}
+
+        rv = client.get('/events/iris_test/leaderboard.json?type=new')
+        content = json.loads(rv.data.decode('utf-8'))
+        assert content['columns'] == ['team', 'submission',
+                                      'submitted at (UTC)', 'state']
+        n_rows = content['n_rows']
+        assert n_rows == len(content['data']) > 2
+
+        rv = client.get('/events/iris_test/leaderboard.json?type=new'
+                        '&sort=team&order=desc&page=2&per_page=2')
+        content = json.loads(rv.data.decode('utf-8'))
+        assert content['n_rows'] == n_rows
+        assert len(content['data']) == 2
+        teams = [row[0] for row in content['data']]
+        assert teams == sorted(teams, reverse=True)
+
+        rv = client.get('/events/iris_test/leaderboard.json?type=new'
+                        '&team=test_user')
+        content = json.loads(rv.data.decode('utf-8'))
+        assert content['n_rows'] > 0
+        assert all(row[0] == 'test_user' for row in content['data'])
+
+        # nothing was scored before the submissions were trained
+        rv = client.get('/events/iris_test/leaderboard.json'
+                        '?at=2000-01-01T00:00:00%2B01:00')
+        assert rv.status_code == 200
+        content = json.loads(rv.data.decode('utf-8'))
+        assert content['n_rows'] == 0
+
+        for query in ['type=unknown', 'type=new&sort=unknown',
+                      'type=new&page=0', 'at=yesterday',
+                      'type=new&at=2000-01-01']:
+            rv = client.get('/events/iris_test/leaderboard.json?' + query)
+            assert rv.status_code == 400
+
+        rv = client.get('/events/xxx/leaderboard.json')
+        assert rv.status_code == 404
+
+        # the leaderboard page only contains the first page and requests the
+        # next ones
+        for page in ['leaderboard', 'competition_leaderboard',
+                     'private_leaderboard',
+                     'private_competition_leaderboard']:
+            rv = client.get('/events/iris_test/' + page)
+            assert rv.status_code == 200
+            assert b'"serverSide": true' in rv.data
+            assert b'/events/iris_test/leaderboard.json?type=' in rv.data
+
+
+@pytest.mark.parametrize(
+    "query, status_code",
+    [('type=private', 403),
+     ('type=private competition', 403),
+     ('type=failed', 403),
+     ('type=new', 403),
+     ('type=new&team=test_user_2', 403),
+     ('type=new&team=test_user', 200),
+     ('type=public', 200),
+     ('type=public competition', 200)]
+)
+def test_leaderboard_json_access(client_session, query, status_code):
+    client, _ = client_session
+    with login_scope(client, 'test_user', 'test') as client:
+        rv = client.get('/events/iris_test/leaderboard.json?' + query)
+        assert rv.status_code == status_code
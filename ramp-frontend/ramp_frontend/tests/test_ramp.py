@@ -74,7 +74,8 @@ def makedrop_event(client_session):
      "/events/iris_test/sandbox",
      "problems/iris/ask_for_event",
      "/credit/xxx",
-     "/event_plots/iris_test"]
+     "/event_plots/iris_test",
+     "/memory_profile/xxx"]
 )
 def test_check_login_required(client_session, page):
     client, _ = client_session
@@ -629,6 +630,34 @@ def test_sandbox_save_file(client_session, makedrop_event):
         assert example_code.encode() in rv.data
 
 
+def test_sandbox_submit(client_session, makedrop_event):
+    client, session = client_session
+    sign_up_team(session, 'iris_test_4event', 'test_user')
+    event_team = get_event_team_by_name(session, 'iris_test_4event',
+                                        'test_user')
+    new_leaderboard_html = event_team.new_leaderboard_html
+
+    with login_scope(client, 'test_user', 'test') as client:
+        rv = client.post(
+            'http://localhost/events/iris_test_4event/sandbox',
+            headers={'Referer':
+                     'http://localhost/events/iris_test_4event/sandbox'},
+            data={'submission': 'submit',
+                  'submit-submission_name': 'new_submission'},
+            follow_redirects=False,
+        )
+        assert rv.status_code == 302
+
+    submission = get_submission_by_name(session, 'iris_test_4event',
+                                        'test_user', 'new_submission')
+    assert submission.state == 'new'
+    # the leaderboards are refreshed by the dispatcher, not by the request
+    session.expire_all()
+    event_team = get_event_team_by_name(session, 'iris_test_4event',
+                                        'test_user')
+    assert event_team.new_leaderboard_html == new_leaderboard_html
+
+
 @pytest.mark.parametrize(
     "opening_date, public_date, closing_date, expected", testtimestamps
 )
@@ -667,7 +696,6 @@ def test_correct_message_sandbox(client_session, makedrop_event,
 
 
 # TODO: test the behavior with a non code file
-# TODO: test the importing behavior
 def test_view_model(client_session):
     client, session = client_session
 
@@ -716,6 +744,40 @@ def test_view_model(client_session):
                 rv.data)
 
 
+def test_view_model_import(client_session):
+    client, session = client_session
+
+    event = get_event(session, 'iris_test')
+    sandbox = get_submission_by_name(session, 'iris_test', 'test_user',
+                                     event.ramp_sandbox_name)
+    other_sandbox = get_submission_by_name(session, 'iris_test', 'test_user_2',
+                                           event.ramp_sandbox_name)
+    submission = get_submission_by_name(session, 'iris_test', 'test_user',
+                                        'random_forest_10_10')
+    sandbox_path = os.path.join(sandbox.path, 'estimator.py')
+    other_sandbox_path = os.path.join(other_sandbox.path, 'estimator.py')
+    with open(other_sandbox_path) as f:
+        other_code = f.read()
+    with open(os.path.join(submission.path, 'estimator.py')) as f:
+        submission_code = f.read()
+
+    with login_scope(client, 'test_user', 'test') as client:
+        rv = client.post(
+            '{}/{}'.format(submission.hash_, 'estimator.py'),
+            data={'selected_f_names': ['estimator.py']}
+        )
+        assert rv.status_code == 302
+        assert rv.location == 'http://localhost/events/iris_test/sandbox'
+
+    with open(sandbox_path) as f:
+        assert f.read() == submission_code
+    # the sandbox of the other team shared the file of the starting kit with
+    # the sandbox and is left unchanged
+    with open(other_sandbox_path) as f:
+        assert f.read() == other_code
+    assert other_code != submission_code
+
+
 def test_view_submission_error(client_session):
     client, session = client_session
 
@@ -8,6 +8,8 @@ from flask import flash
 from flask import redirect
 from flask import render_template
 from flask import request
+from flask import Response
+from flask import stream_with_context
 from flask import url_for
 
 from sqlalchemy.exc import IntegrityError
@@ -24,6 +26,8 @@ from ramp_database.tools.frontend import is_admin
 from ramp_database.tools.frontend import is_accessible_event
 from ramp_database.tools.frontend import is_user_signed_up
 from ramp_database.tools.frontend import is_user_sign_up_requested
+from ramp_database.tools.leaderboard import EXPORT_FORMATS
+from ramp_database.tools.leaderboard import stream_leaderboard_export
 from ramp_database.tools.user import approve_user
 from ramp_database.tools.user import delete_user
 from ramp_database.tools.user import select_user_by_name
@@ -41,6 +45,9 @@ from .redirect import redirect_to_user
 mod = Blueprint('admin', __name__)
 logger = logging.getLogger('RAMP-FRONTEND')
 
+# the file extensions of the leaderboard exports
+EXPORT_EXTENSIONS = {'csv': 'csv', 'parquet': 'parquet', 'arrow': 'arrows'}
+
 
 @mod.route("/approve_users", methods=['GET', 'POST'])
 @flask_login.login_required
@@ -351,3 +358,43 @@ def dashboard_submissions(event_name):
         approved=approved,
         asked=asked,
         **dashboard_kwargs)
+
+
+@mod.route("/events/<event_name>/export_leaderboard")
+@flask_login.login_required
+def export_leaderboard(event_name):
+    """Download the scores of each fold of the submissions of an event.
+
+    The file is streamed while being read from the database. Its format is
+    given by ``format`` in the query string: ``'csv'`` (default),
+    ``'parquet'`` or ``'arrow'`` (Arrow IPC stream).
+
+    Parameters
+    ----------
+    event_name : str
+        The name of the event.
+    """
+    if not is_admin(db.session, event_name, flask_login.current_user.name):
+        return redirect_to_user(
+            'Sorry {}, you do not have admin rights'
+            .format(flask_login.current_user.firstname),
+            is_error=True
+        )
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return redirect_to_user(
+            'Unknown export format "{}"'.format(export_format),
+            is_error=True
+        )
+    try:
+        stream = stream_leaderboard_export(db.session, event_name,
+                                           export_format)
+    except ImportError as e:
+        return redirect_to_user(str(e), is_error=True)
+    file_name = '{}_leaderboard.{}'.format(event_name,
+                                           EXPORT_EXTENSIONS[export_format])
+    return Response(
+        stream_with_context(stream), mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition':
+                 'attachment; filename={}'.format(file_name)}
+    )
@@ -4,10 +4,13 @@ import logging
 
 import flask_login
 
+from flask import abort
 from flask import Blueprint
 from flask import current_app as app
+from flask import jsonify
 from flask import redirect
 from flask import render_template
+from flask import request
 from flask import url_for
 
 from ramp_database.tools.event import get_event
@@ -16,6 +19,8 @@ from ramp_database.tools.frontend import is_accessible_code
 from ramp_database.tools.frontend import is_accessible_event
 from ramp_database.tools.frontend import is_accessible_leaderboard
 from ramp_database.tools.frontend import is_user_signed_up
+from ramp_database.tools.leaderboard import get_leaderboard_page
+from ramp_database.tools.leaderboard import leaderboard_to_html
 from ramp_database.tools.user import add_user_interaction
 from ramp_database.tools.team import get_event_team_by_name
 
@@ -26,6 +31,37 @@ from .redirect import redirect_to_user
 mod = Blueprint('leaderboard', __name__)
 logger = logging.getLogger('RAMP-FRONTEND')
 
+# number of rows of the leaderboard pages
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 500
+
+
+def _first_page_kwargs(event_name, leaderboard_type, with_links=True):
+    """Render the first page of a stored leaderboard.
+
+    The next pages are requested by the leaderboard table to
+    :func:`leaderboard_json`.
+
+    Returns
+    -------
+    kwargs : dict or None
+        The arguments of the leaderboard template. None if the leaderboard
+        has not been stored yet.
+    """
+    df, n_rows = get_leaderboard_page(db.session, leaderboard_type,
+                                      event_name, per_page=PAGE_SIZE,
+                                      with_links=with_links)
+    if df is None:
+        return None
+    return dict(
+        leaderboard=leaderboard_to_html(df) if n_rows else None,
+        leaderboard_url=url_for('leaderboard.leaderboard_json',
+                                event_name=event_name, type=leaderboard_type),
+        leaderboard_columns=df.columns.tolist(),
+        n_rows=n_rows,
+        page_size=PAGE_SIZE
+    )
+
 
 @mod.route("/events/<event_name>/my_submissions")
 @flask_login.login_required
@@ -102,8 +138,9 @@ def leaderboard(event_name):
             event=event
         )
 
-    if is_accessible_leaderboard(db.session, event_name,
-                                 flask_login.current_user.name):
+    with_links = is_accessible_leaderboard(db.session, event_name,
+                                           flask_login.current_user.name)
+    if with_links:
         leaderboard_html = event.public_leaderboard_html_with_links
     else:
         leaderboard_html = event.public_leaderboard_html_no_links
@@ -119,6 +156,9 @@ def leaderboard(event_name):
         sorting_direction=sorting_direction,
         event=event
     )
+    leaderboard_kwargs.update(
+        _first_page_kwargs(event_name, 'public', with_links) or {}
+    )
 
     if is_admin(db.session, event_name, flask_login.current_user.name):
         failed_leaderboard_html = event.failed_leaderboard_html
@@ -178,6 +218,9 @@ def competition_leaderboard(event_name):
         asked=asked,
         approved=approved
     )
+    leaderboard_kwargs.update(
+        _first_page_kwargs(event_name, 'public competition') or {}
+    )
 
     return render_template('leaderboard.html', **leaderboard_kwargs)
 
@@ -224,8 +267,7 @@ def private_leaderboard(event_name):
         db.session, event_name, flask_login.current_user.name
     )
     asked = approved
-    template = render_template(
-        'leaderboard.html',
+    leaderboard_kwargs = dict(
         leaderboard_title='Leaderboard',
         leaderboard=leaderboard_html,
         sorting_column_index=5,
@@ -236,6 +278,10 @@ def private_leaderboard(event_name):
         asked=asked,
         approved=approved
     )
+    leaderboard_kwargs.update(
+        _first_page_kwargs(event_name, 'private') or {}
+    )
+    template = render_template('leaderboard.html', **leaderboard_kwargs)
 
     return template
 
@@ -289,5 +335,79 @@ def private_competition_leaderboard(event_name):
         asked=asked,
         approved=approved
     )
+    leaderboard_kwargs.update(
+        _first_page_kwargs(event_name, 'private competition') or {}
+    )
 
     return render_template('leaderboard.html', **leaderboard_kwargs)
+
+
+@mod.route("/events/<event_name>/leaderboard.json")
+@flask_login.login_required
+def leaderboard_json(event_name):
+    """Page of a leaderboard in JSON format.
+
+    The query string gives the leaderboard (``type``, the public leaderboard
+    by default), the page (``page``, starting at 1, and ``per_page``), the
+    sorting (``sort``, the name of a column, and ``order``, ``'asc'`` or
+    ``'desc'``), and the team whose submissions are reported (``team``).
+    The leaderboard as it was at some point in time is given by ``at``, a
+    date and time in ISO format, in UTC if no time zone is given.
+
+    Parameters
+    ----------
+    event_name : str
+        The event name.
+    """
+    user_name = flask_login.current_user.name
+    if not is_accessible_event(db.session, event_name, user_name):
+        abort(404)
+    event = get_event(db.session, event_name)
+    leaderboard_type = request.args.get('type', 'public')
+    team_name = request.args.get('team') or None
+    admin = is_admin(db.session, event_name, user_name)
+    own_team = (team_name == user_name and
+                is_accessible_code(db.session, event_name, user_name))
+
+    if leaderboard_type in ['public', 'public competition']:
+        with_links = own_team or is_accessible_leaderboard(
+            db.session, event_name, user_name)
+    elif leaderboard_type in ['private', 'private competition']:
+        if (not admin and
+                (event.closing_timestamp is None or
+                 event.closing_timestamp > datetime.datetime.utcnow())):
+            abort(403)
+        with_links = True
+    elif leaderboard_type in ['failed', 'new']:
+        if not (admin or own_team):
+            abort(403)
+        with_links = True
+    else:
+        abort(400)
+
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', PAGE_SIZE, type=int),
+                   MAX_PAGE_SIZE)
+    timestamp = request.args.get('at') or None
+    try:
+        if timestamp is not None:
+            timestamp = datetime.datetime.fromisoformat(timestamp)
+            if timestamp.tzinfo is not None:
+                timestamp = (timestamp.astimezone(datetime.timezone.utc)
+                                      .replace(tzinfo=None))
+        df, n_rows = get_leaderboard_page(
+            db.session, leaderboard_type, event_name, user_name=team_name,
+            sort_by=request.args.get('sort') or None,
+            ascending=request.args.get('order', 'asc') != 'desc',
+            page=page, per_page=per_page, with_links=with_links,
+            timestamp=timestamp
+        )
+    except ValueError:
+        abort(400)
+    if df is None:
+        columns, data = [], []
+    else:
+        columns = df.columns.tolist()
+        data = df.astype(object).where(df.notna(), None).values.tolist()
+    return jsonify(columns=columns, data=data, n_rows=n_rows, page=page,
+                   per_page=per_page)
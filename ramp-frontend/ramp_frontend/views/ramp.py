@@ -70,6 +70,7 @@ from .redirect import redirect_to_credit
 from .redirect import redirect_to_sandbox
 from .redirect import redirect_to_user
 
+from .visualization import memory_plot
 from .visualization import score_plot
 
 mod = Blueprint('ramp', __name__)
@@ -456,6 +457,10 @@ def sandbox(event_name):
             else:
                 # non-editable files are not verified for now
                 dst = os.path.join(sandbox_submission.path, upload_f_name)
+                # the file can be shared with other submissions and is
+                # replaced rather than overwritten
+                if os.path.exists(dst):
+                    os.remove(dst)
                 shutil.copy2(tmp_f_name, dst)
             logger.info('{} uploaded {} in {}'
                         .format(flask_login.current_user.name, upload_f_name,
@@ -510,10 +515,13 @@ def sandbox(event_name):
             except Exception as e:
                 return redirect_to_sandbox(event, 'Error: {}'.format(e))
             try:
+                # the leaderboards are refreshed by the dispatcher when it
+                # fetches the new submission, not in the request
                 new_submission = add_submission(db.session, event_name,
                                                 event_team.team.name,
                                                 new_submission_name,
-                                                sandbox_submission.path)
+                                                sandbox_submission.path,
+                                                refresh_leaderboards=False)
             except DuplicateSubmissionError:
                 return redirect_to_sandbox(
                     event,
@@ -773,6 +781,38 @@ def event_plots(event_name):
                             is_error=True)
 
 
+@mod.route("/memory_profile/<submission_hash>")
+@flask_login.login_required
+def memory_profile(submission_hash):
+    """Landing page of the plot illustrating the memory used during the
+    training of a submission.
+
+    Parameters
+    ----------
+    submission_hash : str
+        The hash_ of the submission.
+    """
+    submission = (Submission.query.filter_by(hash_=submission_hash)
+                                  .one_or_none())
+    if (submission is None or
+            not is_accessible_code(db.session, submission.event.name,
+                                   flask_login.current_user.name,
+                                   submission.id)):
+        error_str = 'Missing submission: {}'.format(submission_hash)
+        return redirect_to_user(error_str)
+    if not submission.has_memory_profile:
+        return redirect_to_user('No memory profile for the submission {}.'
+                                .format(submission.name),
+                                is_error=True)
+    p = memory_plot(submission)
+    script, div = components(p)
+    return render_template('memory_profile.html',
+                           script=script,
+                           div=div,
+                           submission=submission,
+                           event=submission.event)
+
+
 @mod.route("/<submission_hash>/<f_name>", methods=['GET', 'POST'])
 @flask_login.login_required
 def view_model(submission_hash, f_name):
@@ -890,6 +930,10 @@ def view_model(submission_hash, f_name):
             # TODO: deal with different extensions of the same file
             src = os.path.join(submission.path, filename)
             dst = os.path.join(sandbox_submission.path, filename)
+            # the file can be shared with other submissions and is replaced
+            # rather than overwritten
+            if os.path.exists(dst):
+                os.remove(dst)
             shutil.copy2(src, dst)  # copying also metadata
             logger.info('Copying {} to {}'.format(src, dst))
 
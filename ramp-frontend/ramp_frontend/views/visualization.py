@@ -89,10 +89,10 @@ def score_plot(session, event):
     from bokeh.models.sources import ColumnDataSource
     from bokeh.models.formatters import DatetimeTickFormatter
 
-    submissions = get_submissions(session, event.name, None)
+    submissions = get_submissions(session, event.name, None, lightweight=True)
     submissions = [
         get_submission_by_id(session, sub_id)
-        for sub_id, _, _ in submissions
+        for sub_id, _ in submissions
         if get_submission_by_id(session, sub_id).is_public_leaderboard and
         get_submission_by_id(session, sub_id).is_valid]
     score_names = [score_type.name for score_type in event.score_types]
@@ -199,3 +199,36 @@ def score_plot(session, event):
     p.xaxis.major_label_text_font_size = '10pt'
     p.yaxis.major_label_text_font_size = '10pt'
     return p
+
+
+def memory_plot(submission):
+    """Plot the memory used during the training of a submission.
+
+    Parameters
+    ----------
+    submission : :class:`ramp_database.model.Submission`
+        The submission. Its memory profile should be stored.
+
+    Returns
+    -------
+    p : :class:`bokeh.plotting.Figure`
+        The plot of the memory profile.
+    """
+    from bokeh.plotting import figure
+    from bokeh.models.sources import ColumnDataSource
+
+    timestamps, memory = submission.memory_profile
+    source = ColumnDataSource({'x': timestamps, 'y': memory})
+
+    tools = ['pan,wheel_zoom,box_zoom,reset,save']
+    p = figure(width=900, height=600, tools=tools, title='Memory usage')
+    p.line('x', 'y', line_width=2, line_color='royalblue', source=source)
+
+    p.xaxis.axis_label = 'training time (s)'
+    p.yaxis.axis_label = 'memory (MB)'
+    p.xaxis.axis_label_text_font_size = '14pt'
+    p.yaxis.axis_label_text_font_size = '14pt'
+    p.title.text_font_size = '16pt'
+    p.xaxis.major_label_text_font_size = '10pt'
+    p.yaxis.major_label_text_font_size = '10pt'
+    return p
@@ -9,6 +9,7 @@ from ramp_database.tools.event import add_event
 from ramp_database.tools.event import add_problem
 from ramp_database.tools.event import get_problem
 from ramp_database.utils import session_scope
+from ramp_database.utils import setup_db
 
 from .config_parser import read_config
 from .ramp import generate_ramp_config
@@ -35,6 +36,7 @@ def deploy_ramp_event(config, event_config, setup_ramp_repo=True, force=False):
     database_config = read_config(config, filter_section='sqlalchemy')
     ramp_config = generate_ramp_config(event_config, config)
 
+    setup_db(database_config)
     with session_scope(database_config) as session:
         setup_files_extension_type(session)
         if setup_ramp_repo: